@@ -1,9 +1,15 @@
 import streamlit as st
 import storage
 import migration
-import time
+import logstream
+import job_runner
+import stats_cache
+import checkpoints
+import throttling
+import tracing
+import os
 import json
-import requests
+import time
 from streamlit_lottie import st_lottie
 import hashlib
 
@@ -14,6 +20,9 @@ st.set_page_config(
     layout="centered"
 )
 
+# Once per process: the process that serves the app takes over the job history and metrics
+job_runner.startup()
+
 # --- Authentication Configuration ---
 ADMIN_USERNAME = "admin"
 ADMIN_PASSWORD_HASH = hashlib.sha256("admin123".encode()).hexdigest()  # Default: admin123
@@ -71,21 +80,18 @@ if not st.session_state.authenticated:
 
 
 # --- Animations ---
-def load_lottieurl(url: str):
-    try:
-        r = requests.get(url)
-        if r.status_code != 200: return None
-        return r.json()
-    except: return None
+# Bundled with the app: no network on the render path (air-gapped installs, and
+# Streamlit re-runs this script on every interaction)
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
 
-# Assets
-LOTTIE_ROBOT = "https://lottie.host/embed/98648b26-5b2d-4696-8888-25102573516f/9iY5M8sJ2N.json" # Placeholder URL, using valid direct JSON usually better. 
-# Using a reliable public URL for a "database" or "robot" animation
-LOTTIE_DB = "https://assets5.lottiefiles.com/private_files/lf30_1003_01.json" # Generic DB
-LOTTIE_ROCKET = "https://assets9.lottiefiles.com/packages/lf20_uzv8jgjg.json" # Rocket
-
-lottie_db_anim = load_lottieurl("https://assets2.lottiefiles.com/packages/lf20_w51pcehl.json") # Server/Database
-lottie_success = load_lottieurl("https://assets10.lottiefiles.com/packages/lf20_lk80fpsm.json") # Success Check
+@st.cache_resource(show_spinner=False)
+def load_lottie(name):
+    """Lottie animation from assets/<name>.json, read once per process."""
+    try:
+        with open(os.path.join(ASSETS_DIR, f"{name}.json"), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
 
 # Custom CSS & Animations
 st.markdown("""
@@ -331,6 +337,18 @@ def manage_connections_dialog():
                 st.rerun()
         st.divider()
 
+# Navigation between the wizard and background job views
+def open_job(job_id):
+    st.session_state.job_id = job_id
+    st.session_state.view = "job"
+    st.rerun()
+
+def go_home():
+    st.session_state.step = 1
+    st.session_state.view = "wizard"
+    st.session_state.job_id = None
+    st.rerun()
+
 with st.sidebar:
     st.markdown("""
         <div class='sidebar-logo'>
@@ -342,9 +360,14 @@ with st.sidebar:
     st.markdown("<div style='margin-top: 1rem;'></div>", unsafe_allow_html=True)
     
     if st.button("🏠 Return to Home", use_container_width=True):
-        st.session_state.step = 1
-        st.session_state.logs = []
-        st.session_state.current_phase = "IDLE"
+        go_home()
+
+    if st.button("📋 Jobs Dashboard", use_container_width=True):
+        st.session_state.view = "jobs"
+        st.rerun()
+
+    if st.button("📦 Batch Migration", use_container_width=True):
+        st.session_state.view = "batch"
         st.rerun()
 
     st.markdown("<div style='margin-top: 1rem;'></div>", unsafe_allow_html=True)
@@ -393,6 +416,11 @@ with st.sidebar:
 
 # --- UI Components ---
 
+def format_bytes(n):
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if abs(n) < 1024 or unit == "TB":
+            return f"{n:,.1f} {unit}"
+        n /= 1024
 
 def render_stepper(current_step):
     steps = ["Start", "Source", "Target", "Execute"]
@@ -517,8 +545,10 @@ def render_stepper(current_step):
 # --- Session State Management ---
 if 'step' not in st.session_state:
     st.session_state.step = 1
-if 'logs' not in st.session_state:
-    st.session_state.logs = []
+if 'view' not in st.session_state:
+    st.session_state.view = "wizard"
+if 'job_id' not in st.session_state:
+    st.session_state.job_id = None
 if 'source_conf' not in st.session_state:
     st.session_state.source_conf = {}
 if 'target_conf' not in st.session_state:
@@ -533,7 +563,7 @@ def next_step(): st.session_state.step += 1
 def prev_step(): st.session_state.step -= 1
 
 # Render scaffold
-if st.session_state.step > 1: # Only show stepper after home
+if st.session_state.view == "wizard" and st.session_state.step > 1: # Only show stepper after home
      render_stepper(st.session_state.step)
 
 # --- step 1: Welcome ---
@@ -595,6 +625,69 @@ def step_1_welcome():
         """, unsafe_allow_html=True)
 
 # --- Step 2: Source ---
+@st.fragment(run_every=2)
+def render_source_analysis():
+    """Source stats from the cache; picks up background refreshes without a full rerun."""
+    try:
+        cached = stats_cache.get_stats(st.session_state.source_conf)
+    except Exception as e:
+        st.error(f"Could not get stats: {e}")
+        return
+    st.session_state.source_stats = stats = cached['stats']
+
+    collected = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(cached['collected_at']))
+    c_info, c_refresh = st.columns([4, 1])
+    if cached['stale']:
+        c_info.warning(f"⚠️ Stale: collected {job_runner.format_duration(cached['age'])} ago ({collected})."
+                       + (" Refreshing..." if cached['refreshing'] else ""))
+    else:
+        c_info.caption(f"Collected {job_runner.format_duration(cached['age'])} ago ({collected})"
+                       + (" · refreshing..." if cached['refreshing'] else ""))
+    if cached['error']:
+        st.caption(f"Last refresh failed: {cached['error']}")
+    if c_refresh.button("🔄 Refresh", key="src_stats_refresh", disabled=cached['refreshing']):
+        stats_cache.refresh_in_background(st.session_state.source_conf)
+        st.rerun(scope="fragment")
+
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Schemas", stats['schemas'])
+    c2.metric("Tables", stats['tables'])
+    c3.metric("Est. Rows", f"{stats['rows']:,}")
+    c4.metric("Total Size", format_bytes(stats['total_bytes']))
+    st.caption(f"Indexes {format_bytes(stats['index_bytes'])} · TOAST {format_bytes(stats['toast_bytes'])}")
+    if stats['unanalyzed']:
+        st.warning(f"{stats['unanalyzed']} tables were never analyzed, their row counts show as 0. Run ANALYZE on the source for better estimates.")
+
+    if stats['table_stats']:
+        top_n = stats['tables']
+        if top_n > 10:
+            top_n = st.slider("Largest tables to show", 10, min(100, stats['tables']), 10, key="src_top_n")
+        st.dataframe([
+            {
+                "Table": f"{t['schema']}.{t['name']}",
+                "Total": format_bytes(t['total_bytes']),
+                "Table Data": format_bytes(t['table_bytes']),
+                "TOAST": format_bytes(t['toast_bytes']),
+                "Indexes": format_bytes(t['index_bytes']),
+                "Est. Rows": f"{t['rows']:,}",
+                "Share": f"{t['total_bytes'] / stats['total_bytes'] * 100:.1f}%" if stats['total_bytes'] else "-",
+            }
+            for t in stats['table_stats'][:top_n]
+        ], use_container_width=True, hide_index=True)
+        if stats['schemas'] > 1:
+            with st.expander("Per-schema breakdown"):
+                st.dataframe([
+                    {
+                        "Schema": s['schema'],
+                        "Tables": s['tables'],
+                        "Total": format_bytes(s['total_bytes']),
+                        "TOAST": format_bytes(s['toast_bytes']),
+                        "Indexes": format_bytes(s['index_bytes']),
+                        "Est. Rows": f"{s['rows']:,}",
+                    }
+                    for s in stats['schema_stats']
+                ], use_container_width=True, hide_index=True)
+
 def step_2_source():
     st.markdown("### 🔒 Source Database")
     st.caption("Read-only connection. We will analyze this source first.")
@@ -654,8 +747,9 @@ def step_2_source():
             if ok:
                 st.success(f"Connected: {res.split(' ')[0]}...")
                 try:
-                    stats = migration.get_db_stats(st.session_state.source_conf)
-                    st.session_state.source_stats = stats
+                    # Served from the cache when possible, refreshed in the background once stale
+                    cached = stats_cache.get_stats(st.session_state.source_conf)
+                    st.session_state.source_stats = cached['stats']
                 except Exception as e:
                     st.error(f"Could not get stats: {e}")
             else:
@@ -682,11 +776,8 @@ def step_2_source():
     if st.session_state.source_stats:
         st.write("---")
         st.markdown("#### 📊 Source Analysis")
-        c1, c2, c3 = st.columns(3)
-        c1.metric("Schemas", st.session_state.source_stats['schemas'])
-        c2.metric("Tables", st.session_state.source_stats['tables'])
-        c3.metric("Est. Rows", f"{st.session_state.source_stats['rows']:,}")
-        
+        render_source_analysis()
+
         col_back, col_next = st.columns([1, 1])
         if col_back.button("⬅ Back"):
             prev_step()
@@ -701,7 +792,7 @@ def step_3_target():
     st.markdown("""
         <div class="danger-box">
             <b>WARNING: Destructive Operations</b><br>
-            All public tables in the target database will be DROPPED before restore.
+            All tables, views, sequences, functions and types in the target's public schema will be DROPPED before restore.
         </div>
     """, unsafe_allow_html=True)
     
@@ -780,6 +871,359 @@ def step_3_target():
             st.error("Confirmation failed. Database name mismatch.")
 
 
+# --- Replication Cutover ---
+@st.fragment(run_every=2)
+def render_replication_lag(job_id, source, target):
+    """Lag and the cutover button, refreshed together so the button is enabled as soon as lag is near zero."""
+    job = storage.get_job(job_id)
+    if job['replication'] == 'cut over':
+        st.success("Cutover complete: the subscription, slot and publication were removed.")
+        return
+    if job['replication'] == 'dropped':
+        st.info("Replication was dropped without a cutover.")
+        return
+    try:
+        lag = migration.get_replication_lag(source, target)
+    except Exception as e:
+        st.error(f"Could not read replication lag: {e}")
+        lag = None
+    else:
+        if lag is None:
+            st.warning("Replication slot not found on source. Drop the replication to remove what is left of it.")
+    ready = False
+    if lag:
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Lag", f"{lag['lag_bytes'] / 1024:,.0f} KB")
+        c2.metric("Since Last Apply", f"{lag['lag_seconds']:.1f}s" if lag['lag_seconds'] is not None else "n/a")
+        c3.metric("Slot", "Active" if lag['active'] else "Inactive")
+        ready = lag['active'] and lag['lag_bytes'] <= migration.CUTOVER_LAG_BYTES
+
+    c1, c2 = st.columns(2)
+    if c1.button("✂️ Cut Over Now", type="primary", disabled=not ready, use_container_width=True,
+                 help="Enabled once lag is near zero. Syncs sequences and removes the subscription, slot and publication."):
+        with st.status("Cutting over...", expanded=True) as status:
+            success, msg = migration.cutover_replication(source, target, st.write)
+            if success:
+                status.update(label="Cutover Complete!", state="complete")
+                storage.update_job(job_id, replication='cut over')
+            else:
+                status.update(label="Cutover Failed", state="error")
+                st.error(f"❌ {msg}")
+    if c2.button("🗑️ Drop Replication", use_container_width=True,
+                 help="Removes the subscription, slot and publication without a cutover. The slot holds WAL on the source until it is dropped."):
+        try:
+            migration.drop_replication(source, target, st.write)
+            storage.update_job(job_id, replication='dropped')
+        except Exception as e:
+            st.error(f"❌ Could not remove replication objects: {e}")
+
+def render_replication_panel(job):
+    st.markdown("#### 🔁 Live Replication")
+    st.caption("The target is subscribed to the source. Stop writes on the source, wait for lag to reach zero, then cut over.")
+    source, target = find_connection(job['source_key']), find_connection(job['target_key'])
+    if not (source and target):
+        st.warning("Save the source and target connections (or select them again) to cut over or drop this replication. "
+                   "Until then its slot holds WAL on the source.")
+        return
+    render_replication_lag(job['id'], source, target)
+
+# --- Background Jobs ---
+STATUS_ICONS = {"queued": "🕒", "running": "⏳", "succeeded": "✅", "unverified": "🔶", "failed": "❌", "interrupted": "⚠️"}
+
+def render_log_tail(job, limit=15):
+    st.code("\n".join(logstream.tail_log(job['log_path'], limit=limit)) or "Waiting for output...")
+
+@st.fragment(run_every=1)
+def render_job_progress(job_id):
+    job = storage.get_job(job_id)
+    if job['status'] in job_runner.FINISHED_STATUSES:
+        # Redraw the whole page once with the final result
+        st.rerun()
+    elapsed = time.time() - (job['started_at'] or job['created_at'])
+    st.info(f"{STATUS_ICONS.get(job['status'], '')} **{job['status'].title()}** · Phase: {job['phase'] or 'Queued'} · {elapsed:,.0f}s")
+    if job['progress']:
+        progress = json.loads(job['progress'])
+        st.progress((progress['percent'] or 0) / 100, text=job_runner.describe_progress(progress))
+    render_log_tail(job)
+
+def render_verification(job):
+    report = json.loads(job['verification'])
+    st.markdown("#### 🔎 Verification")
+    differing = len(report['mismatches']) + len(report['missing'])
+    if differing:
+        st.warning(f"{differing} of {report['tables']} tables differ between source and target ({report['level']} check). "
+                   "Writes on the source after the dump also show up here.")
+        rows = [{"Table": m['table'], "Source Rows": m['source_rows'], "Target Rows": m['target_rows'],
+                 "Checksum": "differs" if m['checksum_differs'] else ""} for m in report['mismatches']]
+        rows += [{"Table": name, "Source Rows": None, "Target Rows": None, "Checksum": "missing on target"} for name in report['missing']]
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+    else:
+        st.success(f"All {report['tables']} tables match ({report['level']} check).")
+    if report['errors']:
+        st.caption(f"{len(report['errors'])} tables could not be checked: " + ", ".join(e['table'] for e in report['errors'][:10]))
+
+def render_trace(job):
+    spans = tracing.read_trace(tracing.trace_path(job['log_path'])) if job['log_path'] else []
+    if not spans:
+        return
+    with st.expander("⏱️ Timing Breakdown"):
+        phases = tracing.phases(spans)
+        total = sum(p['duration'] for p in phases)
+        st.dataframe([{"Phase": p['name'], "Duration": job_runner.format_duration(p['duration']),
+                       "Share": f"{p['duration'] / total:.0%}" if total else "-",
+                       "Status": p['status']} for p in phases], use_container_width=True, hide_index=True)
+        slowest = tracing.slowest(spans)
+        if slowest:
+            st.markdown("**Slowest objects**")
+            st.dataframe([{"Object": s['name'], "Kind": s['kind'], "Seconds": round(s['duration'], 1),
+                           "Rows": s['attributes'].get('rows'), "Status": s['status']} for s in slowest],
+                         use_container_width=True, hide_index=True)
+        c1, c2 = st.columns(2)
+        with open(tracing.trace_path(job['log_path']), 'rb') as f:
+            c1.download_button("⬇️ Trace (JSON lines)", f, file_name=os.path.basename(tracing.trace_path(job['log_path'])))
+        c2.download_button("⬇️ Trace (OpenTelemetry JSON)", json.dumps(tracing.to_otlp(spans)),
+                           file_name=f"job-{job['id']}-otlp.json", mime="application/json")
+
+def find_connection(key):
+    """Connection details for a migration.connection_key: from this session, else a saved connection."""
+    for conf in (st.session_state.get('source_conf'), st.session_state.get('target_conf')):
+        if conf and conf.get('host') and migration.connection_key(conf) == key:
+            return conf
+    for conn in storage.get_connections():
+        if migration.connection_key(conn) == key:
+            return {k: conn[k] for k in ('host', 'port', 'dbname', 'user', 'password')}
+    return None
+
+def render_resume(job):
+    record = checkpoints.resumable(job_runner.job_run_id(job))
+    if not record:
+        return
+    done = len(storage.get_checkpoints(record['id']))
+    st.info(f"The dump of this run was kept and {done} restored objects are checkpointed. "
+            "Resuming skips the dump and everything already restored.")
+    source, target = find_connection(record['source_key']), find_connection(record['target_key'])
+    if not (source and target):
+        st.caption("Save the source and target connections (or select them again) to resume this run.")
+        return
+    if st.button("🔁 Resume Migration", type="primary", use_container_width=True):
+        open_job(job_runner.resume_migration(job, source, target))
+
+def job_view(job_id):
+    job = storage.get_job(job_id) if job_id else None
+    if not job:
+        st.warning("Job not found.")
+        if st.button("📋 Jobs Dashboard"):
+            st.session_state.view = "jobs"
+            st.rerun()
+        return
+
+    st.markdown(f"### 🚀 Migration Job #{job['id']}")
+    st.caption(f"{job['source']} ➜ {job['target']} · mode: {job['mode']}")
+
+    if job['status'] not in job_runner.FINISHED_STATUSES:
+        render_job_progress(job_id)
+    elif job['status'] == 'succeeded':
+        lottie_success = load_lottie("success")
+        if lottie_success:
+            st_lottie(lottie_success, height=150, key="success_anim")
+        st.markdown("""
+            <div class="success-box">
+                <b>Migration Successful!</b><br>
+                The source database has been successfully migrated to the target.
+            </div>
+        """, unsafe_allow_html=True)
+        if job.get('verification'):
+            render_verification(job)
+        if job.get('replication'):
+            render_replication_panel(job)
+    elif job['status'] == 'unverified':
+        st.warning(f"🔶 {job['message']}")
+        if job.get('verification'):
+            render_verification(job)
+    else:
+        st.error(f"❌ {job['message'] or 'Migration ' + job['status']}")
+        render_resume(job)
+
+    if job['status'] in job_runner.FINISHED_STATUSES:
+        render_trace(job)
+        with st.expander("View Full Migration Logs", expanded=job['status'] != 'succeeded'):
+            st.code("\n".join(logstream.tail_log(job['log_path'], limit=500)))
+            if job['log_path'] and os.path.exists(job['log_path']):
+                with open(job['log_path'], 'rb') as f:
+                    st.download_button("⬇️ Download Full Log", f, file_name=os.path.basename(job['log_path']))
+
+    st.write("")
+    c1, c2 = st.columns(2)
+    if c1.button("📋 Jobs Dashboard", use_container_width=True):
+        st.session_state.view = "jobs"
+        st.rerun()
+    if c2.button("🏠 Back to Home", type="primary", use_container_width=True):
+        go_home()
+
+@st.fragment(run_every=2)
+def jobs_dashboard():
+    st.markdown("### 📋 Migration Jobs")
+    st.caption(f"{job_runner.active_job_count()} running or queued in this process · up to {job_runner.MAX_JOBS} at once, "
+               f"{job_runner.MAX_JOBS_PER_HOST} per server")
+
+    jobs = storage.get_jobs()
+    if not jobs:
+        st.info("No migrations have been run yet.")
+    for job in jobs:
+        with st.container(border=True):
+            c1, c2 = st.columns([4, 1])
+            with c1:
+                st.markdown(f"{STATUS_ICONS.get(job['status'], '')} **#{job['id']}** {job['source']} ➜ {job['target']}")
+                started = time.strftime('%Y-%m-%d %H:%M', time.localtime(job['created_at']))
+                end = job['finished_at'] or time.time()
+                duration = end - (job['started_at'] or job['created_at'])
+                st.caption(f"{job['mode']} · {job['status']} · {job['phase'] or '-'} · started {started} · {duration:,.0f}s")
+                if job['replication'] == 'streaming':
+                    st.caption("🔁 Replication still streaming: open the job to cut over or drop it.")
+            with c2:
+                if st.button("Open", key=f"open_job_{job['id']}", use_container_width=True):
+                    open_job(job['id'])
+
+# --- Batch Migration ---
+def batch_setup():
+    st.markdown("### 📦 Batch Migration")
+    st.caption("Migrate many databases in one go. Pairs come from saved connections; jobs run under a batch-wide and a per-host "
+               "concurrency limit, on top of the app-wide limits shared with all other jobs.")
+
+    conns = {c['name']: c for c in storage.get_connections()}
+    if len(conns) < 2:
+        st.info("Save at least two connections to build a batch.")
+        return
+
+    names = sorted(conns)
+    pairs = st.data_editor(
+        [{"source": None, "target": None}],
+        num_rows="dynamic",
+        use_container_width=True,
+        column_config={
+            "source": st.column_config.SelectboxColumn("Source", options=names, required=True),
+            "target": st.column_config.SelectboxColumn("Target", options=names, required=True),
+        },
+        key="batch_pairs"
+    )
+    pairs = [p for p in pairs if p.get("source") and p.get("target")]
+
+    c1, c2, c3 = st.columns(3)
+    max_concurrency = c1.number_input("Max Concurrent Migrations", min_value=1, max_value=64, value=4)
+    per_host_limit = c2.number_input("Max Per Host", min_value=1, max_value=64, value=2,
+                                     help="Migrations touching the same server (as source or target) at once.")
+    mode = c3.selectbox("Mode", migration.MIGRATION_MODES, key="batch_mode")
+    jobs = None
+    if mode in (migration.MODE_PARALLEL, migration.MODE_COPY, migration.MODE_INCREMENTAL):
+        jobs = st.number_input("Parallel Jobs per Migration", min_value=1, max_value=64, value=2, key="batch_jobs")
+    artifact_max_age = None
+    if mode in (migration.MODE_STANDARD, migration.MODE_PARALLEL) and st.checkbox(
+        "♻️ Dump each source once and reuse the dump (up to 1 hour old)",
+        help="Targets sharing a source restore from one cached dump in data/artifacts.",
+        key="batch_reuse_dump"
+    ):
+        artifact_max_age = 3600
+    resumable = mode in (migration.MODE_STANDARD, migration.MODE_PARALLEL) and st.checkbox(
+        "💾 Resumable: keep each failed job's dump",
+        help="A failed job can then be resumed without dumping its source again. Each failed job keeps a full dump in data/resume.",
+        key="batch_resumable"
+    )
+    name = st.text_input("Batch Name", value=time.strftime("Batch %Y-%m-%d %H:%M"))
+
+    invalid = [p for p in pairs if p['source'] == p['target']]
+    if invalid:
+        st.error("A connection can't be both source and target of the same migration.")
+
+    confirm = st.checkbox(f"I confirm that the {len(pairs)} target databases will be overwritten.", key="batch_confirm")
+    if st.button("🚀 Start Batch", type="primary", disabled=not (pairs and confirm and not invalid)):
+        try:
+            with st.spinner(f"Running preflight checks for {len(pairs)} pairs..."):
+                batch_id = job_runner.submit_batch(
+                    name,
+                    [(conns[p['source']], conns[p['target']]) for p in pairs],
+                    max_concurrency=int(max_concurrency),
+                    per_host_limit=int(per_host_limit),
+                    mode=mode,
+                    jobs=jobs,
+                    artifact_max_age=artifact_max_age,
+                    resumable=resumable
+                )
+        except Exception as e:
+            st.error(f"❌ Batch not started: {e}")
+            return
+        st.session_state.batch_id = batch_id
+        st.session_state.view = "batch_status"
+        st.rerun()
+
+    batches = storage.get_batches()
+    if batches:
+        st.markdown("#### Recent Batches")
+        for b in batches:
+            c1, c2 = st.columns([4, 1])
+            state = "finished" if b['finished_at'] else "running"
+            c1.markdown(f"**#{b['id']}** {b['name']} · _{state}_")
+            if c2.button("Open", key=f"open_batch_{b['id']}", use_container_width=True):
+                st.session_state.batch_id = b['id']
+                st.session_state.view = "batch_status"
+                st.rerun()
+
+@st.fragment(run_every=2)
+def batch_status():
+    batch = storage.get_batch(st.session_state.get('batch_id'))
+    if not batch:
+        st.warning("Batch not found.")
+        return
+    jobs = storage.get_batch_jobs(batch['id'])
+
+    st.markdown(f"### 📦 {batch['name']}")
+    st.caption(f"Batch #{batch['id']} · max {batch['max_concurrency']} concurrent · max {batch['per_host_limit']} per host")
+
+    counts = {status: sum(1 for j in jobs if j['status'] == status) for status in STATUS_ICONS}
+    finished = sum(counts[s] for s in job_runner.FINISHED_STATUSES)
+    st.progress(finished / len(jobs) if jobs else 1.0, text=f"{finished}/{len(jobs)} finished")
+    cols = st.columns(len(STATUS_ICONS))
+    for col, (status, icon) in zip(cols, STATUS_ICONS.items()):
+        col.metric(f"{icon} {status.title()}", counts[status])
+
+    rows = []
+    for j in jobs:
+        duration = None
+        if j['started_at']:
+            duration = (j['finished_at'] or time.time()) - j['started_at']
+        throughput = j['size_bytes'] / duration if duration and j['size_bytes'] else None
+        rows.append({
+            "Job": j['id'],
+            "Source": j['source'],
+            "Target": j['target'],
+            "Status": f"{STATUS_ICONS.get(j['status'], '')} {j['status']}",
+            "Phase": j['phase'] or "-",
+            "Progress": job_runner.describe_progress(json.loads(j['progress'])) if j['progress'] and j['status'] == 'running' else "-",
+            "Size": format_bytes(j['size_bytes']) if j['size_bytes'] else "-",
+            "Duration (s)": round(duration, 1) if duration else None,
+            "Throughput": f"{format_bytes(throughput)}/s" if throughput else "-",
+        })
+    st.dataframe(rows, use_container_width=True, hide_index=True)
+
+    if batch['finished_at']:
+        started = min((j['started_at'] for j in jobs if j['started_at']), default=batch['created_at'])
+        wall = batch['finished_at'] - started
+        total = sum(j['size_bytes'] or 0 for j in jobs if j['status'] in ('succeeded', 'unverified'))
+        st.markdown("#### 📊 Summary")
+        c1, c2, c3, c4, c5 = st.columns(5)
+        c1.metric("Succeeded", counts['succeeded'])
+        c2.metric("Unverified", counts['unverified'], help="Migrated, but the target differs from the source or could not be verified.")
+        c3.metric("Failed", counts['failed'] + counts['interrupted'])
+        c4.metric("Wall Time", f"{wall:,.0f}s")
+        c5.metric("Throughput", f"{format_bytes(total / wall)}/s" if wall > 0 else "-")
+        if counts['unverified']:
+            st.warning(f"{counts['unverified']} targets differ from their source or could not be verified; open those jobs for the details.")
+
+    job_ids = [j['id'] for j in jobs]
+    c1, c2 = st.columns([3, 1])
+    selected = c1.selectbox("Open job", job_ids, format_func=lambda i: f"#{i}", label_visibility="collapsed")
+    if c2.button("Open Job", use_container_width=True) and selected:
+        open_job(selected)
+
 # --- Step 4: Execution ---
 def step_4_execute():
     st.markdown("### 🚀 Preflight & Execute")
@@ -787,11 +1231,15 @@ def step_4_execute():
     # Preflight
     st.markdown("#### 🔍 Preflight Checks")
     with st.spinner("Running system checks..."):
-        checks = migration.preflight_check(st.session_state.source_conf, st.session_state.target_conf)
+        checks = migration.preflight_check(
+            st.session_state.source_conf,
+            st.session_state.target_conf,
+            replication=st.session_state.get('migration_replication', False)
+        )
     
     all_passed = True
     for check in checks:
-        icon = "✅" if check['status'] == 'pass' else "❌"
+        icon = {"pass": "✅", "warn": "⚠️"}.get(check['status'], "❌")
         st.write(f"{icon} {check['msg']}")
         if check['status'] == 'fail':
             all_passed = False
@@ -826,103 +1274,236 @@ def step_4_execute():
 
     st.write("")
     
+    # Migration Mode
+    st.markdown("#### ⚙️ Migration Mode")
+    mode_labels = {
+        migration.MODE_STANDARD: "Standard (single file, single-threaded restore)",
+        migration.MODE_PARALLEL: "Parallel (directory format, multiple jobs)",
+        migration.MODE_STREAM: "Streaming (pipe dump into restore, no local dump file)",
+        migration.MODE_COPY: "Native COPY (schema via pg_dump, parallel table copy)",
+        migration.MODE_INCREMENTAL: "Incremental (re-copy only changed ranges, no drop)",
+    }
+    mode = st.radio(
+        "Mode",
+        migration.MIGRATION_MODES,
+        format_func=lambda m: mode_labels.get(m, m),
+        key="migration_mode",
+        label_visibility="collapsed"
+    )
+    jobs = None
+    if mode in (migration.MODE_PARALLEL, migration.MODE_COPY, migration.MODE_INCREMENTAL):
+        jobs = st.number_input(
+            "Parallel Jobs",
+            min_value=1,
+            max_value=64,
+            value=min(migration.default_jobs(), 64),
+            help="Number of concurrent pg_dump / pg_restore / COPY workers. Defaults to PGSHIFT_JOBS or the CPU count.",
+            key="migration_jobs"
+        )
+        stats = st.session_state.source_stats
+        if mode == migration.MODE_PARALLEL and stats and stats['table_stats'] and stats['total_bytes']:
+            largest = stats['table_stats'][0]
+            share = largest['total_bytes'] / stats['total_bytes']
+            # pg_dump/pg_restore -j parallelize per table, one table never uses more than one worker
+            if share > 0.5:
+                st.caption(f"{largest['schema']}.{largest['name']} holds {share:.0%} of the data and is copied by a single worker. The native COPY engine splits large tables into key ranges.")
+    if mode == migration.MODE_INCREMENTAL:
+        st.caption("Nothing is dropped. The target schema must already exist; only key ranges whose row counts or checksums differ are replaced. Tables unchanged since the last sync are skipped.")
+    deferred_indexes = st.checkbox(
+        "Build indexes & constraints in a separate parallel phase",
+        value=True,
+        help="Loads data first, then builds indexes and constraints concurrently over several target connections with a larger maintenance_work_mem.",
+        key="migration_deferred_indexes"
+    )
+    index_workers = None
+    if deferred_indexes:
+        index_workers = st.number_input(
+            "Index Build Connections",
+            min_value=1,
+            max_value=64,
+            value=min(migration.default_jobs(), 64),
+            key="migration_index_workers"
+        )
+    stream_format = 'custom'
+    if mode == migration.MODE_STREAM:
+        stream_format = st.selectbox(
+            "Stream Format",
+            migration.STREAM_FORMATS,
+            help="custom: pg_dump -Fc | pg_restore. plain: pg_dump -Fp | psql.",
+            key="migration_stream_format"
+        )
+        st.caption("Target tables are dropped before the dump starts, since dump and restore run at the same time.")
+    fast_load = None
+    if mode in (migration.MODE_STANDARD, migration.MODE_PARALLEL, migration.MODE_STREAM) and st.checkbox(
+        "⚡ Fast load profile",
+        help="Restores with synchronous_commit=off and a larger maintenance_work_mem, then runs VACUUM ANALYZE on the loaded tables in parallel. Step timings are written to the log.",
+        key="migration_fast_load"
+    ):
+        c1, c2, c3 = st.columns(3)
+        fast_load = {
+            'vacuum': c1.checkbox("VACUUM ANALYZE afterwards", value=True, key="migration_fast_load_vacuum"),
+            'unlogged': mode != migration.MODE_STREAM and c2.checkbox(
+                "Load into UNLOGGED tables", key="migration_fast_load_unlogged",
+                help="Tables are created UNLOGGED and set LOGGED after the data is loaded. Saves WAL when the target runs with wal_level=minimal."),
+            'single_transaction': mode != migration.MODE_PARALLEL and c3.checkbox(
+                "Single transaction", key="migration_fast_load_single_transaction",
+                help="One pg_restore --single-transaction for the schema and data (and indexes, unless they are built in a separate phase): "
+                     "a failed restore leaves nothing behind. Replaces UNLOGGED tables. Not available with parallel jobs."),
+        }
+    throttle = None
+    if mode != migration.MODE_INCREMENTAL and st.checkbox(
+        "🐢 Throttle the dump (production source)",
+        help="Caps how fast data is read from the source, and optionally slows down or pauses the dump while the source is busy.",
+        key="migration_throttle"
+    ):
+        c1, c2 = st.columns(2)
+        max_mb = c1.number_input("Max MB/s (0 = no cap)", min_value=0.0, value=50.0, step=5.0, key="migration_throttle_mb",
+                                 help="Data read from the source per second, before compression: what pg_dump receives "
+                                      "(measured through /proc on Linux) or the COPY streams carry.")
+        adaptive = c2.checkbox(
+            "Adaptive: slow down or pause under load", value=True, key="migration_throttle_adaptive",
+            help=f"Pauses while the source has more than {throttling.MAX_ACTIVE_BACKENDS} active sessions or a replica lags more than "
+                 f"{throttling.MAX_REPLICATION_LAG / 1024 / 1024:,.0f} MB behind (PGSHIFT_THROTTLE_MAX_ACTIVE, PGSHIFT_THROTTLE_MAX_LAG_MB)."
+        )
+        throttle = {'max_bytes_per_second': int(max_mb * 1024 * 1024) or None, 'adaptive': adaptive}
+        st.caption("A paused pg_dump keeps its snapshot open on the source, which holds back vacuum there.")
+    verify = None
+    if st.checkbox(
+        "🔎 Analyze and verify the target afterwards",
+        value=True,
+        help="Runs ANALYZE on the migrated tables over several connections, then compares every table between source and target.",
+        key="migration_verify"
+    ):
+        verify_labels = {
+            'estimate': "Row estimates (sampled by ANALYZE, cheap)",
+            'count': "Exact row counts",
+            'checksum': "Exact row counts and checksums (reads every row on both sides)",
+        }
+        verify = st.selectbox("Verification", migration.VERIFY_LEVELS, format_func=verify_labels.get, key="migration_verify_level")
+    replication = False
+    if mode in migration.REPLICATION_MODES:
+        replication = st.checkbox(
+            "🔁 Keep target in sync with logical replication (near-zero downtime cutover)",
+            help="Dumps from a replication slot snapshot, then subscribes the target to the source. Cut over once lag is near zero. Requires wal_level=logical on the source.",
+            key="migration_replication"
+        )
+    # Selection: pg_dump -n/-N/-t/-T patterns
+    schema_only = False
+    with st.expander("🎯 Selective Migration (schemas, tables, schema only)"):
+        if mode != migration.MODE_INCREMENTAL:
+            schema_only = st.checkbox("Schema only (no data)", key="migration_schema_only")
+        stats = st.session_state.source_stats
+        picked = []
+        if stats and stats['table_stats']:
+            picked = st.multiselect(
+                "Tables",
+                [f"{t['schema']}.{t['name']}" for t in stats['table_stats']],
+                help="Largest first. Picked tables are added to the table include patterns.",
+                key="migration_pick_tables"
+            )
+        c1, c2 = st.columns(2)
+        include_tables = c1.text_area("Include tables (-t), one pattern per line", placeholder="public.orders*", key="migration_include_tables")
+        exclude_tables = c2.text_area("Exclude tables (-T)", placeholder="public.audit_log", key="migration_exclude_tables")
+        include_schemas = c1.text_area("Include schemas (-n)", placeholder="sales", key="migration_include_schemas")
+        exclude_schemas = c2.text_area("Exclude schemas (-N)", key="migration_exclude_schemas")
+        st.caption("Patterns use pg_dump syntax: * and ? wildcards, double quotes for case-sensitive names. "
+                   "Schema patterns are ignored once table patterns are given. Included schemas are dropped and recreated on the target; "
+                   "with table patterns only the matching tables are dropped.")
+    filters = migration.normalize_filters({
+        'include_tables': include_tables.splitlines() + [migration.qualified_name(*t.split('.', 1)) for t in picked],
+        'exclude_tables': exclude_tables.splitlines(),
+        'include_schemas': include_schemas.splitlines(),
+        'exclude_schemas': exclude_schemas.splitlines(),
+    })
+    if filters and stats and stats['table_stats']:
+        selected = [t for t in stats['table_stats'] if migration.table_selected(filters, t['schema'], t['name'])]
+        st.info(f"Selected {len(selected)} of {stats['tables']} tables, {format_bytes(sum(t['total_bytes'] for t in selected))} "
+                f"of {format_bytes(stats['total_bytes'])} (estimate from the source analysis).")
+    if filters and replication:
+        st.warning("Logical replication always covers the whole database; clear the selection or disable replication.")
+
+    artifact_max_age = None
+    if mode in (migration.MODE_STANDARD, migration.MODE_PARALLEL) and not replication:
+        if st.checkbox(
+            "♻️ Keep the dump and reuse a recent one of this source",
+            help="Dumps are kept in data/artifacts. A later migration of the same source restores from a cached dump instead of dumping again, as long as it is recent enough.",
+            key="migration_reuse_dump"
+        ):
+            max_age_minutes = st.number_input("Reuse dumps up to (minutes old)", min_value=1, max_value=7 * 24 * 60, value=60,
+                                              key="migration_artifact_max_age")
+            artifact_max_age = max_age_minutes * 60
+            cached = [a for a in storage.get_artifacts(migration.connection_key(st.session_state.source_conf))
+                      if time.time() - a['created_at'] <= artifact_max_age and not a['schema_only']]
+            if cached:
+                newest = cached[0]
+                st.caption(f"Will restore cached dump #{newest['id']} taken {job_runner.format_duration(time.time() - newest['created_at'])} ago "
+                           f"({format_bytes(newest['size_bytes'])}, LSN {newest['lsn'] or 'unknown'}); the source is not dumped again.")
+            else:
+                st.caption("No recent dump of this source yet: this migration dumps it and keeps the dump.")
+
+    resumable = False
+    if mode in (migration.MODE_STANDARD, migration.MODE_PARALLEL) and not replication and not schema_only:
+        resumable = st.checkbox(
+            "💾 Resumable: keep the dump if the restore fails",
+            help="Checkpoints the restore so a failed job can be resumed without dumping the source again. "
+                 "The dump stays in data/resume until the job is resumed or for PGSHIFT_RESUME_HOURS, so the data volume "
+                 "needs room for a full dump. The restore stops at the first error.",
+            key="migration_resumable"
+        )
+
+    st.write("")
+    
     # Final Destruction Confirmation
     st.markdown("#### 🚨 Safety Authorization")
-    st.markdown("""
+    scope = "Existing data in the selected schemas and tables" if filters else "All existing data in the public schema"
+    st.markdown(f"""
         <div class="danger-box">
-            <b>CRITICAL WARNING:</b> All existing data in the public schema of the <u>target</u> database will be <b>destroyed</b>.
+            <b>CRITICAL WARNING:</b> {scope} of the <u>target</u> database will be <b>destroyed</b>.
         </div>
     """, unsafe_allow_html=True)
     
     confirm_destruction = st.checkbox(
-        f"I confirm that I want to drop all tables in '{st.session_state.target_conf.get('dbname')}' and restore the source data.",
+        f"I confirm that I want to drop {'the selected' if filters else 'all'} tables in '{st.session_state.target_conf.get('dbname')}' and restore the source data.",
         key="final_confirm_check"
     )
 
     if can_proceed:
         st.write("")
         if st.button("🚀 Start Migration Now", type="primary", disabled=not confirm_destruction):
-            st.session_state.logs = []
-            
-            # Create a placeholder for live logs
-            log_display = st.empty()
-            
-            def log_callback(msg):
-                # Handle phase updates
-                if msg.startswith("PHASE:"):
-                    phase_info = msg.split("|")
-                    phase_name = phase_info[0].replace("PHASE:", "").title()
-                    phase_detail = phase_info[1] if len(phase_info) > 1 else ""
-                    st.session_state.current_phase = phase_name
-                    st.session_state.logs.append(f"--- {phase_name}: {phase_detail} ---")
-                else:
-                    st.session_state.logs.append(msg)
-                
-                # Update live log view
-                with log_display:
-                    # Show last 15 lines of logs for brevity during execution
-                    visible_logs = st.session_state.logs[-15:]
-                    st.code("\n".join(visible_logs))
-                    
-                # Structured log for Agents
-                try:
-                    structured = json.dumps({"timestamp": time.time(), "message": msg})
-                    print(structured) 
-                except: pass
-                
-            st.session_state.current_phase = "Initializing"
-            
-            with st.status("Executing Migration...", expanded=True) as status:
-                # Update status label dynamically
-                status.update(label=f"Migration: {st.session_state.get('current_phase', 'Starting')}...")
-                
-                success, msg = migration.run_migration(
-                    st.session_state.source_conf, 
-                    st.session_state.target_conf, 
-                    log_callback,
-                    schema_only=False
-                )
-                
-                if success:
-                    status.update(label="Migration Complete!", state="complete", expanded=False)
-                    if lottie_success:
-                        st_lottie(lottie_success, height=150, key="success_anim")
-                    else:
-                        st.balloons()
-                        
-                    st.markdown("""
-                        <div class="success-box">
-                            <b>Migration Successful!</b><br>
-                            The source database has been successfully migrated to the target.
-                        </div>
-                    """, unsafe_allow_html=True)
-                    
-                    # Back to Home button
-                    st.write("")
-                    if st.button("🏠 Back to Home", type="primary", use_container_width=True):
-                        st.session_state.step = 1
-                        st.session_state.logs = []
-                        st.rerun()
-                else:
-                    status.update(label="Migration Failed", state="error", expanded=True)
-                    st.error(f"❌ {msg}")
-                    
-                    # Back to Home button for failed migrations too
-                    st.write("")
-                    if st.button("🏠 Back to Home", type="secondary", use_container_width=True):
-                        st.session_state.step = 1
-                        st.session_state.logs = []
-                        st.rerun()
-            
-            with st.expander("View Full Migration Logs", expanded=False):
-                st.code("\n".join(st.session_state.logs))
+            # Runs in the background job pool; the page only polls its state
+            job_id = job_runner.submit_migration(
+                st.session_state.source_conf, 
+                st.session_state.target_conf, 
+                schema_only=schema_only,
+                mode=mode,
+                jobs=jobs,
+                stream_format=stream_format,
+                deferred_indexes=deferred_indexes,
+                index_workers=index_workers,
+                replication=replication,
+                artifact_max_age=artifact_max_age,
+                filters=filters,
+                fast_load=fast_load,
+                verify=verify,
+                throttle=throttle,
+                resumable=resumable
+            )
+            open_job(job_id)
     
     if st.button("⬅ Back"):
         prev_step()
         st.rerun()
 
 # --- Main Routing ---
-if st.session_state.step == 1:
+if st.session_state.view == "jobs":
+    jobs_dashboard()
+elif st.session_state.view == "job":
+    job_view(st.session_state.job_id)
+elif st.session_state.view == "batch":
+    batch_setup()
+elif st.session_state.view == "batch_status":
+    batch_status()
+elif st.session_state.step == 1:
     step_1_welcome()
 elif st.session_state.step == 2:
     step_2_source()
@@ -0,0 +1,150 @@
+import os
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+
+import storage
+
+# Dumps kept for reuse: restoring the same snapshot into QA, UAT and staging
+# dumps the source once. Tracked in the storage `artifacts` table.
+ARTIFACT_DIR = os.path.join(storage.DATA_DIR, 'artifacts')
+MAX_BYTES = int(float(os.environ.get('PGSHIFT_ARTIFACT_CACHE_GB', '50')) * 1024 ** 3)
+
+# pg_dump -Z value: a level (gzip), or METHOD[:LEVEL] with zstd/lz4 on pg_dump >= 16
+COMPRESSION = os.environ.get('PGSHIFT_DUMP_COMPRESSION', '')
+COMPRESSION_METHODS = ('gzip', 'lz4', 'zstd', 'none')
+
+# A reused dump is checked against the size and modification time recorded when it was
+# stored. PGSHIFT_ARTIFACT_VERIFY=checksum also recomputes its sha256, reading the whole dump
+FULL_CHECK = os.environ.get('PGSHIFT_ARTIFACT_VERIFY', 'stat') == 'checksum'
+
+_in_use = {}  # artifact id -> number of running restores
+_source_locks = {}
+_lock = threading.Lock()
+
+def new_path(source_key):
+    """Fresh path in the store for a dump of source_key (a file, or a directory for -Fd)."""
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    digest = hashlib.md5(source_key.encode()).hexdigest()[:12]
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    return os.path.join(ARTIFACT_DIR, f"{digest}-{stamp}-{uuid.uuid4().hex[:8]}.dump")
+
+def compression_args(setting, pg_dump_version, log_callback):
+    """pg_dump arguments for a PGSHIFT_DUMP_COMPRESSION value, empty for pg_dump's default (gzip)."""
+    if not setting:
+        return []
+    method, _, level = setting.partition(':')
+    if method.isdigit():
+        return ['-Z', method]
+    if method not in COMPRESSION_METHODS:
+        raise Exception(f"Unknown dump compression '{setting}', use a level or one of {', '.join(COMPRESSION_METHODS)}")
+    if pg_dump_version >= 16:
+        return ['-Z', setting]
+    # Older pg_dump only knows gzip levels
+    if method in ('lz4', 'zstd'):
+        log_callback(f"WARNING: pg_dump {pg_dump_version} does not support {method} compression, using gzip.")
+    if method == 'none':
+        return ['-Z', '0']
+    return ['-Z', level] if level else []
+
+def checksum(path):
+    """sha256 over the dump file, or over every file of a directory dump in name order."""
+    digest = hashlib.sha256()
+    if os.path.isdir(path):
+        files = sorted(os.listdir(path))
+    else:
+        files = [None]
+    for name in files:
+        file_path = os.path.join(path, name) if name else path
+        if name:
+            digest.update(name.encode())
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+def stat(path):
+    """(total size in bytes, newest modification time) of a dump file or directory."""
+    if os.path.isdir(path):
+        files = [os.stat(os.path.join(path, name)) for name in os.listdir(path)]
+    else:
+        files = [os.stat(path)]
+    return sum(s.st_size for s in files), max((s.st_mtime for s in files), default=0)
+
+def intact(artifact, full=FULL_CHECK):
+    """Whether an artifact's dump is unchanged since it was registered.
+
+    Compares size and modification time; with full (or for artifacts stored without
+    an mtime) the sha256 of the whole dump as well.
+    """
+    try:
+        size, mtime = stat(artifact['path'])
+    except OSError:
+        return False
+    if size != artifact['size_bytes']:
+        return False
+    if full or artifact['mtime'] is None:
+        return checksum(artifact['path']) == artifact['checksum']
+    return mtime == artifact['mtime']
+
+def remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+def source_lock(source_key):
+    """Serializes find-or-dump per source, so concurrent jobs of a batch share one dump."""
+    with _lock:
+        return _source_locks.setdefault(source_key, threading.Lock())
+
+def find_fresh(source_key, schema_only, max_age):
+    """Newest intact artifact of source_key no older than max_age seconds, or None."""
+    for artifact in storage.get_artifacts(source_key):
+        if bool(artifact['schema_only']) != bool(schema_only):
+            continue
+        if time.time() - artifact['created_at'] > max_age:
+            break
+        if not os.path.exists(artifact['path']):
+            storage.delete_artifact(artifact['id'])
+            continue
+        return artifact
+    return None
+
+def register(source_key, schema_only, fmt, compression, path, lsn, created_at):
+    """Records a finished dump in the store and returns its artifact row. The only full
+    checksum of the dump, unless reuse is verified with FULL_CHECK."""
+    size_bytes, mtime = stat(path)
+    artifact_id = storage.create_artifact(
+        source_key, schema_only, fmt, compression, path, size_bytes, checksum(path), lsn, created_at, mtime
+    )
+    return next(a for a in storage.get_artifacts(source_key) if a['id'] == artifact_id)
+
+def checkout(artifact):
+    """Marks an artifact as being restored from; it is not evicted until release()."""
+    with _lock:
+        _in_use[artifact['id']] = _in_use.get(artifact['id'], 0) + 1
+    storage.touch_artifact(artifact['id'])
+
+def release(artifact):
+    with _lock:
+        _in_use[artifact['id']] -= 1
+        if not _in_use[artifact['id']]:
+            del _in_use[artifact['id']]
+
+def evict(log_callback, max_bytes=MAX_BYTES):
+    """Deletes least recently used artifacts until the store fits in max_bytes. Artifacts in use are kept."""
+    artifacts = storage.get_artifacts()
+    total = sum(a['size_bytes'] for a in artifacts)
+    for artifact in sorted(artifacts, key=lambda a: a['last_used_at']):
+        if total <= max_bytes:
+            break
+        with _lock:
+            if artifact['id'] in _in_use:
+                continue
+        remove_path(artifact['path'])
+        storage.delete_artifact(artifact['id'])
+        total -= artifact['size_bytes']
+        log_callback(f"Evicted cached dump #{artifact['id']} ({artifact['size_bytes'] / 1024 / 1024:,.0f} MB) from the artifact store.")
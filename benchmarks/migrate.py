@@ -0,0 +1,374 @@
+"""Migration benchmark: every run_migration mode against throwaway local PostgreSQL clusters.
+
+Creates a source and a target cluster with initdb/pg_ctl in a scratch
+directory, fills the source with synthetic schemas of the chosen shapes and
+runs each mode in a fresh Python process. Records wall time, throughput, peak
+RSS (of the migration process and of the largest pg_dump/pg_restore/psql it
+ran) and peak temporary disk use. With --baseline it fails if a mode got
+slower than the baseline's median by more than --tolerance.
+
+    python benchmarks/migrate.py --scale 0.1 --runs 3 --output bench.json
+    python benchmarks/migrate.py --baseline bench.json --tolerance 0.2
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import resource
+import threading
+import statistics
+import subprocess
+
+import psycopg2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DBNAME = 'bench'
+
+# Synthetic schemas, one per shape: (SQL run on the source, rows it inserts) for a scale factor.
+# Data is derived from generate_series only, so every run loads the same rows.
+
+def shape_small_tables(scale):
+    tables = max(1, int(500 * scale))
+    return f"""
+        CREATE SCHEMA small_tables;
+        DO $$ BEGIN FOR i IN 1..{tables} LOOP
+            EXECUTE format('CREATE TABLE small_tables.t%s (id int PRIMARY KEY, name text NOT NULL, value numeric, created_at timestamptz NOT NULL)', i);
+            EXECUTE format('INSERT INTO small_tables.t%s SELECT g, md5(g::text), g * 1.5, timestamptz ''2024-01-01'' + g * interval ''1 hour'' FROM generate_series(1, 100) g', i);
+        END LOOP; END $$;
+    """, tables * 100
+
+def shape_huge_tables(scale):
+    rows = max(1, int(2000000 * scale))
+    return f"""
+        CREATE SCHEMA huge_tables;
+        CREATE TABLE huge_tables.accounts (id int PRIMARY KEY, name text NOT NULL);
+        INSERT INTO huge_tables.accounts SELECT g, 'account ' || g FROM generate_series(0, 9999) g;
+        CREATE TABLE huge_tables.events (
+            id bigint PRIMARY KEY, account_id int NOT NULL REFERENCES huge_tables.accounts,
+            kind text NOT NULL, amount numeric(12,2), created_at timestamptz NOT NULL
+        );
+        INSERT INTO huge_tables.events
+            SELECT g, g % 10000, (ARRAY['click', 'view', 'buy'])[g % 3 + 1], (g % 100000) / 100.0,
+                   timestamptz '2024-01-01' + g * interval '1 second'
+            FROM generate_series(1, {rows}) g;
+        CREATE TABLE huge_tables.audit_log (id bigint PRIMARY KEY, event_id bigint NOT NULL, message text NOT NULL);
+        INSERT INTO huge_tables.audit_log SELECT g, g, repeat(md5(g::text), 4) FROM generate_series(1, {rows}) g;
+        CREATE INDEX ON huge_tables.events (account_id, created_at);
+    """, 10000 + 2 * rows
+
+def shape_wide_jsonb(scale):
+    rows = max(1, int(50000 * scale))
+    return f"""
+        CREATE SCHEMA wide_jsonb;
+        CREATE TABLE wide_jsonb.documents (id bigint PRIMARY KEY, doc jsonb NOT NULL);
+        INSERT INTO wide_jsonb.documents
+            SELECT g, (SELECT jsonb_object_agg('field_' || k, md5((g * k)::text)) FROM generate_series(1, 40) k)
+                      || jsonb_build_object('tags', jsonb_build_array(g % 7, g % 11, g % 13))
+            FROM generate_series(1, {rows}) g;
+        CREATE INDEX ON wide_jsonb.documents USING gin (doc jsonb_path_ops);
+    """, rows
+
+def shape_many_indexes(scale):
+    rows = max(1, int(200000 * scale))
+    indexes = ["(a)", "(b)", "(c)", "(d)", "(e)", "(f)", "(g)", "(h)", "(a, b)", "(c, d, e)", "(lower(name))",
+               "(created_at DESC)", "(b) WHERE a % 10 = 0", "(name text_pattern_ops)", "(f, g, h)"]
+    return f"""
+        CREATE SCHEMA many_indexes;
+        CREATE TABLE many_indexes.items (
+            id bigint PRIMARY KEY, a int, b int, c int, d int, e int, f text, g text, h text,
+            name text NOT NULL, created_at timestamptz NOT NULL
+        );
+        INSERT INTO many_indexes.items
+            SELECT n, n % 97, n % 1009, n % 13, n % 10007, n % 3, md5(n::text), md5((n * 7)::text), md5((n * 13)::text),
+                   'Item ' || n, timestamptz '2024-01-01' + n * interval '1 minute'
+            FROM generate_series(1, {rows}) n;
+        {" ".join(f"CREATE INDEX ON many_indexes.items {index};" for index in indexes)}
+    """, rows
+
+def shape_partitions(scale):
+    rows = max(1, int(1000000 * scale))
+    return f"""
+        CREATE SCHEMA partitions;
+        CREATE TABLE partitions.measurements (
+            id bigint NOT NULL, sensor_id int NOT NULL, recorded_at timestamptz NOT NULL, value double precision,
+            PRIMARY KEY (id, recorded_at)
+        ) PARTITION BY RANGE (recorded_at);
+        DO $$ BEGIN FOR m IN 0..23 LOOP
+            EXECUTE format('CREATE TABLE partitions.measurements_%s PARTITION OF partitions.measurements FOR VALUES FROM (%L) TO (%L)',
+                           m, timestamptz '2023-01-01' + m * interval '1 month', timestamptz '2023-01-01' + (m + 1) * interval '1 month');
+        END LOOP; END $$;
+        INSERT INTO partitions.measurements
+            SELECT g, g % 500, timestamptz '2023-01-01' + (g::float / {rows} * 729) * interval '1 day', g * 0.25
+            FROM generate_series(1, {rows}) g;
+        CREATE INDEX ON partitions.measurements (sensor_id, recorded_at);
+    """, rows
+
+SHAPES = {
+    'small_tables': shape_small_tables,
+    'huge_tables': shape_huge_tables,
+    'wide_jsonb': shape_wide_jsonb,
+    'many_indexes': shape_many_indexes,
+    'partitions': shape_partitions,
+}
+
+# Every run starts from an empty target database; incremental gets the schema restored first
+MODES = ['standard', 'parallel', 'stream', 'copy', 'incremental']
+
+def bin_dir():
+    """Directory of the PostgreSQL binaries: pg_config --bindir, else whatever is on PATH."""
+    try:
+        return subprocess.check_output(['pg_config', '--bindir'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return os.path.dirname(shutil.which('initdb') or '')
+
+class Cluster:
+    """A throwaway PostgreSQL cluster listening only on a Unix socket in its own directory."""
+
+    def __init__(self, bindir, root, name, port):
+        self.bindir = bindir
+        self.data = os.path.join(root, name)
+        self.socket_dir = os.path.join(root, f"{name}-socket")
+        self.port = port
+
+    def run(self, tool, *args):
+        subprocess.run([os.path.join(self.bindir, tool), *args], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    def start(self, settings):
+        os.makedirs(self.socket_dir)
+        self.run('initdb', '-D', self.data, '-U', 'postgres', '-A', 'trust', '-E', 'UTF8', '--no-sync')
+        options = f"-p {self.port} -k {self.socket_dir} -c listen_addresses=''"
+        options += "".join(f" -c {setting}" for setting in settings)
+        self.run('pg_ctl', '-D', self.data, '-l', self.data + '.log', '-o', options, '-w', 'start')
+        self.create_database()
+
+    def create_database(self, drop=False):
+        """Creates the bench database, first dropping the existing one with drop=True."""
+        conn = self.connect('postgres')
+        try:
+            cur = conn.cursor()
+            if drop:
+                cur.execute(f"DROP DATABASE IF EXISTS {DBNAME} WITH (FORCE);")
+            cur.execute(f"CREATE DATABASE {DBNAME};")
+        finally:
+            conn.close()
+
+    def stop(self):
+        self.run('pg_ctl', '-D', self.data, '-m', 'fast', '-w', 'stop')
+
+    def details(self):
+        """Connection details as stored for a PG Shift connection."""
+        return {'host': self.socket_dir, 'port': str(self.port), 'dbname': DBNAME, 'user': 'postgres', 'password': ''}
+
+    def connect(self, dbname=DBNAME):
+        conn = psycopg2.connect(host=self.socket_dir, port=self.port, dbname=dbname, user='postgres')
+        conn.autocommit = True
+        return conn
+
+def fill_source(cluster, shapes, scale):
+    """Creates the shapes on the source. Returns (rows, tables, bytes) loaded."""
+    rows = 0
+    conn = cluster.connect()
+    try:
+        cur = conn.cursor()
+        for name in shapes:
+            started = time.perf_counter()
+            sql, shape_rows = SHAPES[name](scale)
+            cur.execute(sql)
+            rows += shape_rows
+            print(f"Created {name}: {shape_rows:,} rows in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+        cur.execute("VACUUM ANALYZE;")
+        cur.execute("SELECT count(*) FROM pg_tables WHERE schemaname = ANY(%s);", (list(shapes),))
+        tables = cur.fetchone()[0]
+        cur.execute("SELECT pg_database_size(current_database());")
+        size = cur.fetchone()[0]
+    finally:
+        conn.close()
+    return rows, tables, size
+
+def max_rss_bytes(who):
+    # ru_maxrss is in KB on Linux, bytes on macOS
+    rss = resource.getrusage(who).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def run_child(spec):
+    """One migration in this (fresh) process; prints its measurements as JSON."""
+    sys.path.insert(0, ROOT)
+    import migration
+
+    peak_temp = 0
+    done = threading.Event()
+
+    def sample():
+        # Dumps and list files go to TMPDIR, which the parent made empty for this run
+        nonlocal peak_temp
+        while not done.wait(0.2):
+            try:
+                peak_temp = max(peak_temp, migration.path_size(tempfile.gettempdir()))
+            except OSError:
+                pass
+
+    lines = 0
+    with open(spec['log_file'], 'w') as log:
+        def log_callback(msg):
+            nonlocal lines
+            lines += 1
+            log.write(msg + "\n")
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        started = time.perf_counter()
+        success, msg = migration.run_migration(spec['source'], spec['target'], log_callback, **spec['options'])
+        wall = time.perf_counter() - started
+        done.set()
+        sampler.join()
+
+    print(json.dumps({
+        'success': success,
+        'message': msg,
+        'wall_seconds': round(wall, 3),
+        'peak_rss_bytes': max_rss_bytes(resource.RUSAGE_SELF),
+        'peak_child_rss_bytes': max_rss_bytes(resource.RUSAGE_CHILDREN),
+        'peak_temp_bytes': peak_temp,
+        'log_lines': lines,
+    }))
+
+def run_mode(source, target, mode, args, workdir, run):
+    """Runs one mode in a child process with its own TMPDIR, on a fresh target database. Returns its measurements."""
+    target.create_database(drop=True)
+    if mode == 'incremental':
+        # Incremental syncs into existing tables: restore the schema first (not measured)
+        seed = run_child_process(source, target, {'mode': 'standard', 'schema_only': True}, workdir, f"seed-{run}")
+        if not seed['success']:
+            raise Exception(f"Could not restore the schema for the incremental run: {seed['message']}")
+    options = {'mode': mode, 'jobs': args.jobs, 'index_workers': args.jobs, 'verify': args.verify}
+    result = run_child_process(source, target, options, workdir, f"{mode}-{run}")
+    result.update({'mode': mode, 'run': run})
+    return result
+
+def run_child_process(source, target, options, workdir, name):
+    """One run_migration call in a fresh Python process with an empty TMPDIR."""
+    tmp = os.path.join(workdir, f"tmp-{name}")
+    os.makedirs(tmp)
+    spec = {'source': source.details(), 'target': target.details(), 'options': options,
+            'log_file': os.path.join(workdir, f"{name}.log")}
+    env = dict(os.environ, TMPDIR=tmp, PATH=source.bindir + os.pathsep + os.environ.get('PATH', ''))
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', json.dumps(spec)],
+                            env=env, check=True, stdout=subprocess.PIPE, text=True).stdout
+    shutil.rmtree(tmp, ignore_errors=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+def summarize(results, rows, size):
+    """Per mode: median wall time and throughput, worst peak memory and disk use."""
+    summary = {}
+    for mode in dict.fromkeys(r['mode'] for r in results):
+        runs = [r for r in results if r['mode'] == mode]
+        wall = statistics.median(r['wall_seconds'] for r in runs)
+        summary[mode] = {
+            'runs': len(runs),
+            'failed': sum(1 for r in runs if not r['success']),
+            'median_wall_seconds': round(wall, 3),
+            'rows_per_second': round(rows / wall) if wall else None,
+            'bytes_per_second': round(size / wall) if wall else None,
+            'peak_rss_bytes': max(r['peak_rss_bytes'] for r in runs),
+            'peak_child_rss_bytes': max(r['peak_child_rss_bytes'] for r in runs),
+            'peak_temp_bytes': max(r['peak_temp_bytes'] for r in runs),
+        }
+    return summary
+
+def regressions(summary, baseline, tolerance):
+    """Modes slower than in baseline by more than tolerance (a share of the baseline median)."""
+    slower = []
+    for mode, current in summary.items():
+        before = baseline['summary'].get(mode)
+        if before and current['median_wall_seconds'] > before['median_wall_seconds'] * (1 + tolerance):
+            slower.append(f"{mode}: {before['median_wall_seconds']:.1f}s -> {current['median_wall_seconds']:.1f}s")
+    return slower
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shapes', nargs='+', choices=sorted(SHAPES), default=list(SHAPES))
+    parser.add_argument('--scale', type=float, default=0.1, help="Size factor; 1.0 loads about 5 million rows")
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    parser.add_argument('--runs', type=int, default=1, help="Runs per mode")
+    parser.add_argument('--jobs', type=int, default=4, help="Parallel jobs and index build connections")
+    parser.add_argument('--verify', choices=['estimate', 'count', 'checksum'], help="Also verify each run (adds to its time)")
+    parser.add_argument('--setting', action='append', default=[], metavar='NAME=VALUE', help="Server setting for both clusters")
+    parser.add_argument('--port', type=int, default=55432, help="Source port; the target uses the next one")
+    parser.add_argument('--bindir', default=None, help="PostgreSQL binaries (default: pg_config --bindir)")
+    parser.add_argument('--workdir', default=None, help="Scratch directory, kept with the logs when given")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    parser.add_argument('--baseline', help="Results of an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(json.loads(args.child))
+        return
+
+    bindir = args.bindir or bin_dir()
+    workdir = args.workdir or tempfile.mkdtemp(prefix="pgshift-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    source = Cluster(bindir, workdir, 'source', args.port)
+    target = Cluster(bindir, workdir, 'target', args.port + 1)
+    started = []
+    try:
+        for cluster in (source, target):
+            cluster.start(args.setting)
+            started.append(cluster)
+        conn = source.connect()
+        try:
+            cur = conn.cursor()
+            cur.execute("SHOW server_version;")
+            version = cur.fetchone()[0]
+        finally:
+            conn.close()
+        rows, tables, size = fill_source(source, args.shapes, args.scale)
+
+        results = []
+        for mode in args.modes:
+            for run in range(1, args.runs + 1):
+                result = run_mode(source, target, mode, args, workdir, run)
+                results.append(result)
+                status = "ok" if result['success'] else f"FAILED: {result['message']}"
+                print(f"{mode:12} run {run}: {result['wall_seconds']:8.1f}s | peak RSS {result['peak_rss_bytes'] / 1024 / 1024:7.0f} MB"
+                      f" | tools {result['peak_child_rss_bytes'] / 1024 / 1024:7.0f} MB | temp {result['peak_temp_bytes'] / 1024 / 1024:7.0f} MB | {status}",
+                      file=sys.stderr)
+    finally:
+        for cluster in started:
+            cluster.stop()
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'postgres': version,
+        'python': sys.version.split()[0],
+        'shapes': args.shapes,
+        'scale': args.scale,
+        'jobs': args.jobs,
+        'settings': args.setting,
+        'source': {'rows': rows, 'tables': tables, 'bytes': size},
+        'summary': summarize(results, rows, size),
+        'runs': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report['summary'], indent=2))
+
+    failed = [r for r in results if not r['success']]
+    if failed:
+        print(f"FAIL: {len(failed)} runs failed, see the logs in --workdir", file=sys.stderr)
+    slower = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = regressions(report['summary'], json.load(f), args.tolerance)
+    for line in slower:
+        print(f"REGRESSION: {line}", file=sys.stderr)
+    sys.exit(1 if failed or slower else 0)
+
+if __name__ == '__main__':
+    main()
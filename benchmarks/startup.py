@@ -0,0 +1,89 @@
+"""Startup benchmark: how long one Streamlit script run of app.py takes.
+
+Streamlit re-executes app.py on every click, so its module level must stay
+cheap and must never touch the network. Runs the login page and the
+authenticated start page with outbound sockets disabled and fails if a run
+tries to connect anywhere or the warm median exceeds the budget.
+
+    python benchmarks/startup.py --runs 20 --budget-ms 300
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+
+from streamlit.testing.v1 import AppTest
+
+# The app's metrics exporter would bind a port in this process
+os.environ.setdefault('PGSHIFT_METRICS_PORT', '0')
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+
+blocked = []
+_connect = socket.socket.connect
+
+def guarded_connect(sock, address):
+    # Unix sockets and loopback are fine, anything else is a network fetch on the render path
+    if sock.family == socket.AF_UNIX or (isinstance(address, tuple) and address[0] in ('127.0.0.1', '::1', 'localhost')):
+        return _connect(sock, address)
+    blocked.append(address)
+    raise OSError(f"Network access blocked by the startup benchmark: {address}")
+
+def measure(authenticated, runs):
+    """Wall time in ms of each script run; the first one includes module imports."""
+    timings = []
+    for _ in range(runs):
+        at = AppTest.from_file(APP, default_timeout=60)
+        if authenticated:
+            at.session_state['authenticated'] = True
+            at.session_state['username'] = 'admin'
+        started = time.perf_counter()
+        at.run()
+        timings.append((time.perf_counter() - started) * 1000)
+        if at.exception:
+            raise Exception(f"app.py raised: {at.exception[0].message}")
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--budget-ms', type=float, default=300, help="Maximum warm median per script run")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args()
+
+    socket.socket.connect = guarded_connect
+    try:
+        results = {}
+        for name, authenticated in (('login', False), ('home', True)):
+            timings = measure(authenticated, args.runs)
+            warm = sorted(timings[1:]) or timings
+            results[name] = {
+                'first_ms': round(timings[0], 1),
+                'median_ms': round(statistics.median(warm), 1),
+                'p95_ms': round(warm[min(len(warm) - 1, int(len(warm) * 0.95))], 1),
+                'max_ms': round(max(warm), 1),
+            }
+    finally:
+        socket.socket.connect = _connect
+
+    if args.json:
+        print(json.dumps({'runs': args.runs, 'budget_ms': args.budget_ms, 'blocked_connections': len(blocked), 'pages': results}, indent=2))
+    else:
+        for name, r in results.items():
+            print(f"{name:6} first {r['first_ms']:8.1f} ms | median {r['median_ms']:7.1f} ms | p95 {r['p95_ms']:7.1f} ms | max {r['max_ms']:7.1f} ms")
+
+    failed = False
+    if blocked:
+        print(f"FAIL: {len(blocked)} outbound connection attempts during script runs: {blocked[:5]}", file=sys.stderr)
+        failed = True
+    for name, r in results.items():
+        if r['median_ms'] > args.budget_ms:
+            print(f"FAIL: {name} median {r['median_ms']} ms exceeds the {args.budget_ms} ms budget", file=sys.stderr)
+            failed = True
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
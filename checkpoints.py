@@ -0,0 +1,246 @@
+import os
+import re
+import time
+import threading
+import subprocess
+
+import storage
+import artifacts
+import tracing
+
+# Restores that can be resumed after a failure: their dump is kept here and the
+# restored TOC entries are recorded in the storage `restore_checkpoints` table.
+RESUME_DIR = os.path.join(storage.DATA_DIR, 'resume')
+# Dumps of failed runs that are not resumed within this time are deleted
+RESUME_MAX_AGE = float(os.environ.get('PGSHIFT_RESUME_HOURS', '72')) * 3600
+
+# pg_restore -l: "<dump id>; <tableoid> <oid> <desc> <schema> <tag> <owner>"
+TOC_LINE = re.compile(r'^(\d+); \d+ \d+ (.+)$')
+# TOC descriptions of more than one word; everything else is a single word
+TOC_DESCS = sorted([
+    'TABLE DATA', 'SEQUENCE SET', 'SEQUENCE OWNED BY', 'FK CONSTRAINT', 'CHECK CONSTRAINT', 'DEFAULT ACL',
+    'INDEX ATTACH', 'MATERIALIZED VIEW', 'MATERIALIZED VIEW DATA', 'FOREIGN TABLE', 'FOREIGN DATA WRAPPER',
+    'FOREIGN SERVER', 'USER MAPPING', 'EVENT TRIGGER', 'OPERATOR CLASS', 'OPERATOR FAMILY', 'ACCESS METHOD',
+    'TEXT SEARCH CONFIGURATION', 'TEXT SEARCH DICTIONARY', 'TEXT SEARCH PARSER', 'TEXT SEARCH TEMPLATE',
+    'LARGE OBJECT', 'BLOB METADATA', 'DATABASE PROPERTIES', 'ROW SECURITY', 'PUBLICATION TABLE',
+    'PUBLICATION TABLES IN SCHEMA', 'STATISTICS DATA',
+], key=len, reverse=True)
+
+# pg_restore -v output. Parallel restores report each launched and finished entry by
+# id; serial restores only announce starts, so an entry is done once the next one starts.
+# Workers of parallel restores announce their entries too, so that rule is for jobs == 1 only.
+ITEM_LAUNCHING = re.compile(r'launching item (\d+) ')
+ITEM_FINISHED = re.compile(r'finished item (\d+) ')
+ITEM_CREATING = re.compile(r'creating (.+?) "(.*)"$')
+ITEM_DATA = re.compile(r'processing data for table "(.*)"$')
+
+def item_key(desc, schema, name):
+    """Checkpoint key of an object, the same for TOC entries, pg_restore output and post-data items."""
+    return f"{desc} {name}" if schema in ('', '-', None) else f"{desc} {schema}.{name}"
+
+def parse_toc_line(line):
+    """(dump id, desc, schema, tag) of one pg_restore -l line, or None for comments."""
+    match = TOC_LINE.match(line)
+    if not match:
+        return None
+    rest = match.group(2)
+    desc = next((d for d in TOC_DESCS if rest.startswith(d + ' ')), rest.split(' ', 1)[0])
+    fields = rest[len(desc) + 1:].split(' ')
+    # The tag may contain spaces ("orders orders_pkey"), the owner comes last
+    tag = fields[1:-1] if len(fields) > 2 else fields[1:]
+    return int(match.group(1)), desc, fields[0], " ".join(tag)
+
+def read_toc(dump_file):
+    """TOC entries of a dump: [{'id', 'desc', 'schema', 'tag', 'key', 'line'}] in restore order."""
+    output = subprocess.check_output(['pg_restore', '-l', dump_file], text=True)
+    entries = []
+    for line in output.splitlines():
+        parsed = parse_toc_line(line)
+        if parsed:
+            dump_id, desc, schema, tag = parsed
+            entries.append({'id': dump_id, 'desc': desc, 'schema': schema, 'tag': tag,
+                            'key': item_key(desc, schema, tag), 'line': line})
+    return entries
+
+def dump_path(run_id, parallel):
+    """Where a resumable run keeps its dump (a directory for -Fd)."""
+    os.makedirs(RESUME_DIR, exist_ok=True)
+    path = os.path.join(RESUME_DIR, f"{run_id}.dump")
+    if parallel:
+        os.makedirs(path, exist_ok=True)
+    return path
+
+class RestoreRun:
+    """Restored stages and TOC entries of one run.
+
+    With a run_id they are saved in storage as they complete, so a failed run
+    can be resumed; without one they are only kept in memory.
+    """
+
+    def __init__(self, run_id=None, done=()):
+        self.run_id = run_id
+        self.done_items = set(done)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, run_id):
+        """The saved run, or None if it does not exist."""
+        if not storage.get_restore_run(run_id):
+            return None
+        return cls(run_id, storage.get_checkpoints(run_id))
+
+    @classmethod
+    def start(cls, run_id, source_key, target_key, dump_file, owns_dump):
+        """A new run; without run_id checkpoints stay in memory."""
+        if run_id:
+            storage.create_restore_run(run_id, source_key, target_key, dump_file, owns_dump, time.time())
+        return cls(run_id)
+
+    def done(self, key):
+        with self.lock:
+            return key in self.done_items
+
+    def mark(self, key):
+        with self.lock:
+            if key in self.done_items:
+                return
+            self.done_items.add(key)
+        if self.run_id:
+            storage.add_checkpoint(self.run_id, key, time.time())
+
+    def stage_done(self, stage):
+        return self.done(f"STAGE {stage}")
+
+    def finish_stage(self, stage):
+        self.mark(f"STAGE {stage}")
+
+    def forget_items(self):
+        """Drops the entry checkpoints (stages stay), after the objects they stand for were dropped."""
+        with self.lock:
+            self.done_items = {k for k in self.done_items if k.startswith("STAGE ")}
+        if self.run_id:
+            storage.delete_checkpoints(self.run_id, exclude_prefix="STAGE ")
+
+    def items(self, prefix):
+        """Checkpoint keys starting with prefix, with the prefix removed."""
+        with self.lock:
+            return sorted(k[len(prefix):] for k in self.done_items if k.startswith(prefix))
+
+class RestoreTracker:
+    """Follows pg_restore -v output and checkpoints every TOC entry that completes.
+
+    Serial restores (jobs == 1) checkpoint an entry once the next one starts,
+    parallel ones on the "finished item" lines only. Restores run with
+    --single-transaction (atomic) keep everything in memory until succeeded(),
+    since a failure rolls all of it back. Entries are only safe to checkpoint
+    early when pg_restore stops on the first error (--exit-on-error).
+
+    Table data, index and constraint entries are also reported as tracing spans.
+    """
+
+    def __init__(self, run, toc, jobs=1, atomic=False):
+        self.run = run
+        self.by_id = {e['id']: e for e in toc}
+        self.serial = jobs == 1
+        self.atomic = atomic
+        self.current = None
+        # key -> (desc, name, start) of the entries being restored
+        self.started = {}
+        # Entries completed in an atomic restore, checkpointed once it commits
+        self.pending = []
+        self.log_callback = None
+
+    def begin(self, key, desc, name):
+        self.started[key] = (desc, name, time.time())
+
+    def end(self, key):
+        if self.atomic:
+            self.pending.append(key)
+        else:
+            self.run.mark(key)
+        desc, name, start = self.started.pop(key, (None, None, None))
+        kind = tracing.object_kind(desc)
+        if kind and start and self.log_callback:
+            tracing.emit(self.log_callback, name, kind, start, type=desc)
+
+    def observe(self, msg):
+        match = ITEM_LAUNCHING.search(msg) or ITEM_FINISHED.search(msg)
+        if match:
+            entry = self.by_id.get(int(match.group(1)))
+            if entry and match.re is ITEM_LAUNCHING:
+                self.begin(entry['key'], entry['desc'], entry['key'][len(entry['desc']) + 1:])
+            elif entry:
+                self.end(entry['key'])
+            return
+        match = ITEM_DATA.search(msg)
+        if match:
+            desc, name = 'TABLE DATA', match.group(1)
+        else:
+            match = ITEM_CREATING.search(msg)
+            desc, name = match.groups() if match else (None, None)
+        if not desc:
+            return
+        key = f"{desc} {name}"
+        if self.serial:
+            if self.current:
+                self.end(self.current)
+            self.current = key
+            self.begin(key, desc, name)
+        elif key not in self.started:
+            # Entries the leader restores before launching workers; done once the restore succeeds
+            self.begin(key, desc, name)
+
+    def wrap(self, log_callback):
+        """log_callback that also records finished entries (and reports their spans to it)."""
+        self.log_callback = log_callback
+
+        def callback(msg):
+            self.observe(msg)
+            log_callback(msg)
+        return callback
+
+    def succeeded(self):
+        """The restore exited cleanly: every entry it started is done, and atomic ones are checkpointed."""
+        self.current = None
+        for key in list(self.started):
+            self.end(key)
+        for key in self.pending:
+            self.run.mark(key)
+        self.pending = []
+
+def finish(run):
+    """Forgets a run that completed, deleting its dump unless it belongs to the artifact store."""
+    if not run.run_id:
+        return
+    record = storage.get_restore_run(run.run_id)
+    if record:
+        if record['owns_dump']:
+            artifacts.remove_path(record['dump_path'])
+        storage.delete_restore_run(run.run_id)
+
+def reopen(run_id):
+    """Loads a failed run to resume it."""
+    storage.update_restore_run(run_id, status='running', updated_at=time.time())
+    return RestoreRun.load(run_id)
+
+def fail(run, log_callback):
+    if not run.run_id:
+        return
+    storage.update_restore_run(run.run_id, status='failed', updated_at=time.time())
+    log_callback(f"Dump and {len(run.done_items)} checkpoints kept: this migration can be resumed.")
+
+def prune(log_callback, max_age=RESUME_MAX_AGE):
+    """Deletes failed runs (and their dumps) that were not resumed within max_age seconds."""
+    for record in storage.get_restore_runs():
+        if record['status'] == 'failed' and time.time() - record['updated_at'] > max_age:
+            if record['owns_dump']:
+                artifacts.remove_path(record['dump_path'])
+            storage.delete_restore_run(record['id'])
+            log_callback(f"Deleted the dump of run {record['id']}, which was not resumed in time.")
+
+def resumable(run_id):
+    """The saved run if it failed and its dump still exists, else None."""
+    record = storage.get_restore_run(run_id) if run_id else None
+    if record and record['status'] == 'failed' and os.path.exists(record['dump_path']):
+        return record
+    return None
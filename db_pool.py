@@ -0,0 +1,188 @@
+import os
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+
+# Process-wide pools, one per database identity (host, port, dbname, user, password)
+MAX_SIZE = int(os.environ.get('PGSHIFT_POOL_MAX_SIZE', '5'))
+IDLE_TIMEOUT = float(os.environ.get('PGSHIFT_POOL_IDLE_TIMEOUT', '300'))
+# Idle connections older than this are pinged before being handed out
+HEALTH_CHECK_AFTER = float(os.environ.get('PGSHIFT_POOL_HEALTH_CHECK_AFTER', '30'))
+ACQUIRE_TIMEOUT = float(os.environ.get('PGSHIFT_POOL_ACQUIRE_TIMEOUT', '30'))
+
+class PoolTimeout(Exception):
+    pass
+
+class ConnectionPool:
+    """Bounded pool of autocommit psycopg2 connections to one database.
+
+    Idle connections are reused most-recently-used first, pinged if they sat idle
+    for more than HEALTH_CHECK_AFTER seconds, and closed after IDLE_TIMEOUT.
+    Only for catalog/admin queries: borrowers must not leave session state
+    (SET, snapshots, ...) behind. Workers that need that open their own connections.
+    """
+
+    def __init__(self, conn_details, max_size=MAX_SIZE, idle_timeout=IDLE_TIMEOUT,
+                 health_check_after=HEALTH_CHECK_AFTER):
+        self.conn_details = conn_details
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.idle = []  # (conn, released_at), most recent last
+        self.in_use = 0
+        self.created = 0
+        self.cond = threading.Condition()
+
+    def connect(self, connect_timeout=10):
+        conn = psycopg2.connect(
+            host=self.conn_details['host'],
+            port=self.conn_details['port'],
+            dbname=self.conn_details['dbname'],
+            user=self.conn_details['user'],
+            password=self.conn_details['password'],
+            connect_timeout=connect_timeout
+        )
+        conn.autocommit = True
+        self.created += 1
+        return conn
+
+    def healthy(self, conn, idle_for):
+        if conn.closed:
+            return False
+        if idle_for < self.health_check_after:
+            return True
+        try:
+            conn.cursor().execute("SELECT 1;")
+            return True
+        except psycopg2.Error:
+            return False
+
+    def evict_idle(self):
+        """Closes connections idle for longer than idle_timeout. Caller holds the lock."""
+        now = time.time()
+        keep = []
+        for conn, released_at in self.idle:
+            if now - released_at > self.idle_timeout:
+                close_quietly(conn)
+            else:
+                keep.append((conn, released_at))
+        self.idle = keep
+
+    def acquire(self, timeout=ACQUIRE_TIMEOUT, connect_timeout=10):
+        """Borrows a connection, waiting up to timeout for a free slot. connect_timeout only
+        applies if a new connection has to be opened: it belongs to the caller, not the pool."""
+        deadline = time.time() + timeout
+        with self.cond:
+            while True:
+                self.evict_idle()
+                if self.idle:
+                    conn, released_at = self.idle.pop()
+                    self.in_use += 1
+                    break
+                if self.in_use < self.max_size:
+                    self.in_use += 1
+                    conn = None
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise PoolTimeout(f"No free connection to {self.conn_details['host']} within {timeout}s")
+                self.cond.wait(remaining)
+
+        # Network round trips happen outside the lock
+        try:
+            if conn is not None and not self.healthy(conn, time.time() - released_at):
+                close_quietly(conn)
+                conn = None
+            if conn is None:
+                conn = self.connect(connect_timeout)
+        except Exception:
+            with self.cond:
+                self.in_use -= 1
+                self.cond.notify()
+            raise
+        return conn
+
+    def release(self, conn, discard=False):
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                conn.autocommit = True
+            except psycopg2.Error:
+                discard = True
+        if discard or conn.closed:
+            close_quietly(conn)
+        with self.cond:
+            self.in_use -= 1
+            if not discard and not conn.closed:
+                self.idle.append((conn, time.time()))
+            self.cond.notify()
+
+    def close(self):
+        with self.cond:
+            for conn, _ in self.idle:
+                close_quietly(conn)
+            self.idle = []
+
+    def stats(self):
+        with self.cond:
+            return {'in_use': self.in_use, 'idle': len(self.idle), 'max_size': self.max_size, 'created': self.created}
+
+def close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def pool_key(conn_details):
+    # The password is part of the identity (a changed password must not reuse old sessions) but never kept in clear
+    secret = hashlib.sha256(str(conn_details.get('password', '')).encode()).hexdigest()[:16]
+    return (conn_details['host'], str(conn_details['port']), conn_details['dbname'], conn_details['user'], secret)
+
+def get_pool(conn_details):
+    key = pool_key(conn_details)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(dict(conn_details))
+        return pool
+
+@contextmanager
+def connection(conn_details, connect_timeout=10):
+    """Borrows an autocommit connection from the shared pool for conn_details."""
+    pool = get_pool(conn_details)
+    conn = pool.acquire(connect_timeout=connect_timeout)
+    discard = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        # Broken connection: don't hand it out again
+        discard = True
+        raise
+    finally:
+        pool.release(conn, discard)
+
+def pool_label(key):
+    """"host:port/<hash>" of a pool key: names a pool (in metrics) without its user and database."""
+    digest = hashlib.sha256("/".join(key[2:]).encode()).hexdigest()[:8]
+    return f"{key[0]}:{key[1]}/{digest}"
+
+def pool_stats():
+    """Usage of every pool, keyed by pool_label()."""
+    with _pools_lock:
+        pools = list(_pools.items())
+    return {pool_label(k): p.stats() for k, p in pools}
+
+def close_all():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,323 @@
+import os
+import json
+import time
+import fcntl
+import threading
+import concurrent.futures
+
+import storage
+import migration
+import throttling
+import tracing
+import metrics
+import logstream
+
+# Migrations run on threads of this process, outside the Streamlit script thread, so
+# they survive page reloads and several can run at once. Every job, from the wizard or
+# a batch, is started by the same scheduler under process-wide limits: MAX_JOBS at once,
+# MAX_JOBS_PER_HOST touching the same server, and one at a time per target database.
+MAX_JOBS = int(os.environ.get('PGSHIFT_MAX_JOBS', '4'))
+MAX_JOBS_PER_HOST = int(os.environ.get('PGSHIFT_MAX_JOBS_PER_HOST', '2'))
+
+FINISHED_STATUSES = ('succeeded', 'unverified', 'failed', 'interrupted')
+
+# Job ids queued or running in this process
+_active = set()
+_lock = threading.Lock()
+
+# Scheduler state: jobs waiting to start (oldest first), and what the running ones hold
+_pending = []
+_running = {'total': 0, 'hosts': {}, 'targets': set(), 'batches': {}}
+# Batch id -> jobs of the batch not finished yet
+_batch_remaining = {}
+_schedule_lock = threading.Lock()
+
+def connection_label(conn_details):
+    return f"{conn_details.get('host')}/{conn_details.get('dbname')}"
+
+def submit_migration(source, target, **options):
+    """Queues migration.run_migration(source, target, **options) as a background job. Returns the job id."""
+    log_path = logstream.new_log_path("job")
+    job_id = storage.create_job(
+        connection_label(source),
+        connection_label(target),
+        options.get('mode', migration.MODE_STANDARD),
+        json.dumps(options),
+        log_path,
+        source_key=migration.connection_key(source),
+        target_key=migration.connection_key(target)
+    )
+    with _lock:
+        _active.add(job_id)
+    enqueue([new_entry(job_id, source, target, log_path, options)])
+    return job_id
+
+def job_run_id(job):
+    """Checkpoint run of a job: its own, or the one of the failed job it resumes."""
+    return json.loads(job['options']).get('resume') or f"job-{job['id']}"
+
+def resume_migration(job, source, target):
+    """Queues a new job that continues the failed job's restore from its kept dump. Returns the job id."""
+    options = json.loads(job['options'])
+    options['resume'] = job_run_id(job)
+    return submit_migration(source, target, **options)
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60}s"
+    return f"{seconds}s"
+
+def describe_progress(progress):
+    """One-line summary of a migration.ProgressTracker snapshot."""
+    done, total = progress['done'], progress['total']
+    parts = [progress['phase'].title()]
+    if progress['percent'] is not None:
+        parts.append(f"{progress['percent']:.1f}%")
+    parts.append(f"{done['tables']}/{total['tables']} tables")
+    if total['rows']:
+        parts.append(f"{done['rows']:,}/{total['rows']:,} rows")
+    if done['bytes']:
+        parts.append(f"{done['bytes'] / 1024 / 1024:,.0f} MB written ({progress['bytes_per_second'] / 1024 / 1024:,.1f} MB/s)")
+    if progress['rate']:
+        parts.append(f"{progress['rate']:,.0f} {progress['unit']}/s")
+    if progress['eta_seconds'] is not None:
+        parts.append(f"ETA {format_duration(progress['eta_seconds'])}")
+    if progress.get('throttle'):
+        parts.append(throttling.describe(progress['throttle']))
+    return " · ".join(parts)
+
+def run_job(job_id, source, target, log_path, options):
+    """Job body: runs the migration, streams the log to disk and tracks phase/status in storage.
+
+    Phase and object timings go to a trace file next to the log (see tracing).
+    A run that only failed its verification ends 'unverified': the data was migrated,
+    but the target does not (or could not be shown to) match the source.
+    """
+    streamer = logstream.LogStreamer(log_path, fps=1)
+    trace = tracing.TraceWriter(tracing.trace_path(log_path))
+
+    def log_callback(msg):
+        if msg.startswith("PHASE:"):
+            phase_info = msg.split("|")
+            phase_name = phase_info[0].replace("PHASE:", "").title()
+            phase_detail = phase_info[1] if len(phase_info) > 1 else ""
+            storage.update_job(job_id, phase=phase_name)
+            metrics.phase_finished(trace.phase(phase_name, phase_detail))
+            streamer.write(msg, display=f"--- {phase_name}: {phase_detail} ---")
+        elif msg.startswith("PROGRESS:"):
+            progress = json.loads(msg[len("PROGRESS:"):])
+            storage.update_job(job_id, progress=json.dumps(progress))
+            metrics.job_progress(job_id, progress)
+            streamer.write(describe_progress(progress), fields={"progress": progress})
+        elif msg.startswith("VERIFY:"):
+            report = json.loads(msg[len("VERIFY:"):])
+            storage.update_job(job_id, verification=json.dumps(report))
+            streamer.write(f"Verification ({report['level']}): {report['matched']}/{report['tables']} tables match", fields={"verification": report})
+        elif msg.startswith("THROTTLE:"):
+            state = json.loads(msg[len("THROTTLE:"):])
+            streamer.write(throttling.describe(state), fields={"throttle": state})
+        elif msg.startswith("SPAN:"):
+            trace.write(json.loads(msg[len("SPAN:"):]))
+        else:
+            streamer.write(msg)
+
+    started_at = time.time()
+    mode = options.get('mode', migration.MODE_STANDARD)
+    storage.update_job(job_id, status='running', phase='Initializing', started_at=started_at)
+    metrics.job_started(job_id, mode)
+    size_bytes = None
+    try:
+        # Source size, for throughput reporting
+        size_bytes = migration.get_database_size(source)
+        storage.update_job(job_id, size_bytes=size_bytes)
+    except Exception:
+        pass
+    success, msg = False, "Interrupted"
+    try:
+        success, msg = migration.run_migration(source, target, log_callback, run_id=f"job-{job_id}", **options)
+    except Exception as e:
+        log_callback(f"ERROR: Migration Failed - {str(e)}")
+        success, msg = False, str(e)
+    finally:
+        streamer.close()
+        metrics.phase_finished(trace.close(error=None if success else msg))
+        metrics.job_finished(job_id, mode, success, time.time() - started_at, size_bytes)
+
+    if success:
+        status = 'succeeded'
+    else:
+        status = 'unverified' if msg.startswith(migration.UNVERIFIED) else 'failed'
+    storage.update_job(
+        job_id,
+        status=status,
+        message=msg,
+        finished_at=time.time(),
+        # A successful replicated migration leaves the subscription streaming until cutover
+        replication='streaming' if success and options.get('replication') else None
+    )
+    with _lock:
+        _active.discard(job_id)
+    return success, msg
+
+def active_job_count():
+    with _lock:
+        return len(_active)
+
+def host_key(conn_details):
+    return f"{conn_details.get('host')}:{conn_details.get('port')}"
+
+def database_key(conn_details):
+    return f"{host_key(conn_details)}/{conn_details.get('dbname')}"
+
+def new_entry(job_id, source, target, log_path, options, batch_id=None, max_concurrency=None, per_host_limit=None):
+    """A job for the scheduler; batch jobs also respect their batch's own limits."""
+    return {'job_id': job_id, 'source': source, 'target': target, 'log_path': log_path, 'options': options,
+            'batch_id': batch_id, 'max_concurrency': max_concurrency, 'per_host_limit': per_host_limit}
+
+def entry_hosts(entry):
+    # A server acting as both source and target counts once
+    return {host_key(entry['source']), host_key(entry['target'])}
+
+def fits(entry):
+    """Whether entry can start now without exceeding any limit (call with _schedule_lock held)."""
+    if _running['total'] >= MAX_JOBS or database_key(entry['target']) in _running['targets']:
+        return False
+    per_host = min(MAX_JOBS_PER_HOST, entry['per_host_limit'] or MAX_JOBS_PER_HOST)
+    if any(_running['hosts'].get(h, 0) >= per_host for h in entry_hosts(entry)):
+        return False
+    batch_id = entry['batch_id']
+    return batch_id is None or _running['batches'].get(batch_id, 0) < entry['max_concurrency']
+
+def hold(entry, count):
+    """Adds (count=1) or releases (count=-1) what a running entry holds (call with _schedule_lock held)."""
+    _running['total'] += count
+    for h in entry_hosts(entry):
+        _running['hosts'][h] = _running['hosts'].get(h, 0) + count
+    if count > 0:
+        _running['targets'].add(database_key(entry['target']))
+    else:
+        _running['targets'].discard(database_key(entry['target']))
+    if entry['batch_id'] is not None:
+        _running['batches'][entry['batch_id']] = _running['batches'].get(entry['batch_id'], 0) + count
+
+def enqueue(entries):
+    with _schedule_lock:
+        _pending.extend(entries)
+    schedule()
+
+def schedule():
+    """Starts every pending job that the limits leave room for, oldest first."""
+    started = []
+    with _schedule_lock:
+        for entry in list(_pending):
+            if fits(entry):
+                _pending.remove(entry)
+                hold(entry, 1)
+                started.append(entry)
+    for entry in started:
+        threading.Thread(target=run_scheduled, args=(entry,), name=f"pgshift-job-{entry['job_id']}", daemon=True).start()
+
+def run_scheduled(entry):
+    finished_batch = None
+    try:
+        run_job(entry['job_id'], entry['source'], entry['target'], entry['log_path'], entry['options'])
+    finally:
+        with _schedule_lock:
+            hold(entry, -1)
+            batch_id = entry['batch_id']
+            if batch_id is not None:
+                _batch_remaining[batch_id] -= 1
+                if not _batch_remaining[batch_id]:
+                    del _batch_remaining[batch_id]
+                    finished_batch = batch_id
+        if finished_batch is not None:
+            storage.finish_batch(finished_batch)
+        schedule()
+
+def check_batch(pairs, replication=False):
+    """Raises if the pairs can't run as one batch: a database targeted twice or both read and
+    overwritten, or a pair that fails its preflight checks."""
+    targets = [database_key(target) for _, target in pairs]
+    twice = sorted({key for key in targets if targets.count(key) > 1})
+    if twice:
+        raise Exception(f"These databases are the target of more than one pair: {', '.join(twice)}")
+    both = sorted(set(targets) & {database_key(source) for source, _ in pairs})
+    if both:
+        raise Exception(f"These databases are both a source and a target in the batch: {', '.join(both)}")
+
+    def preflight(pair):
+        source, target = pair
+        failed = [c['msg'] for c in migration.preflight_check(source, target, replication) if c['status'] == 'fail']
+        return f"{connection_label(source)} -> {connection_label(target)}: {'; '.join(failed)}" if failed else None
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(8, len(pairs) or 1)) as pool:
+        failures = [f for f in pool.map(preflight, pairs) if f]
+    if failures:
+        raise Exception("Preflight checks failed for " + " | ".join(failures))
+
+def submit_batch(name, pairs, max_concurrency=4, per_host_limit=2, **options):
+    """Queues many (source, target) migrations under a batch-wide and a per-host concurrency limit.
+
+    Returns the batch id. The pairs are checked first (see check_batch), then the
+    jobs are created up front (status 'queued') and started by the scheduler as soon
+    as the batch's limits and the process-wide ones allow it.
+    """
+    check_batch(pairs, options.get('replication', False))
+    batch_id = storage.create_batch(name, max_concurrency, per_host_limit)
+    entries = []
+    for source, target in pairs:
+        log_path = logstream.new_log_path("job")
+        job_id = storage.create_job(
+            connection_label(source),
+            connection_label(target),
+            options.get('mode', migration.MODE_STANDARD),
+            json.dumps(options),
+            log_path,
+            batch_id=batch_id,
+            source_key=migration.connection_key(source),
+            target_key=migration.connection_key(target)
+        )
+        entries.append(new_entry(job_id, source, target, log_path, options, batch_id, max_concurrency, per_host_limit))
+    with _lock:
+        _active.update(e['job_id'] for e in entries)
+    if not entries:
+        storage.finish_batch(batch_id)
+        return batch_id
+    with _schedule_lock:
+        _batch_remaining[batch_id] = len(entries)
+    enqueue(entries)
+    return batch_id
+
+# Held by the process that serves the app for as long as it runs (see startup)
+SERVER_LOCK = os.path.join(storage.DATA_DIR, 'server.lock')
+_server_lock_file = None
+
+def startup():
+    """Startup work of the serving process: flags the jobs of a previous server as
+    interrupted and starts the metrics exporter. Returns whether this process serves.
+
+    Only the process holding SERVER_LOCK does this, so anything else that runs the
+    app (benchmarks, a second instance) leaves the live server's jobs alone.
+    """
+    global _server_lock_file
+    with _lock:
+        if _server_lock_file:
+            return True
+        lock_file = open(SERVER_LOCK, 'a+')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        lock_file.truncate(0)
+        lock_file.write(f"{os.getpid()}\n")
+        lock_file.flush()
+        _server_lock_file = lock_file
+    # Jobs still marked running in the DB belong to a previous process that is gone
+    storage.mark_interrupted_jobs()
+    # Prometheus exporter for this process (PGSHIFT_METRICS_PORT)
+    metrics.start_server()
+    return True
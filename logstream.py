@@ -0,0 +1,119 @@
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+from collections import deque
+
+import storage
+
+# Migration logs live next to the connections DB so they persist in the Docker volume
+LOG_DIR = os.path.join(storage.DATA_DIR, 'logs')
+
+def new_log_path(prefix="migration"):
+    """Returns a fresh log file path under data/logs."""
+    os.makedirs(LOG_DIR, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    return os.path.join(LOG_DIR, f"{prefix}-{stamp}-{uuid.uuid4().hex[:8]}.jsonl")
+
+class LogStreamer:
+    """Buffers log lines and redraws the UI at a fixed frame rate.
+
+    Every line is appended to a JSON-lines file on disk (the full, structured log).
+    Only the last `tail` lines are kept in memory, in a ring buffer, and handed to
+    `render` at most `fps` times per second. Lines written between frames are flushed
+    by a timer at the next frame, so a quiet step doesn't leave them buffered (`render`
+    may then run on the timer thread).
+    """
+
+    def __init__(self, path, render=None, tail=15, fps=4, echo=True):
+        self.path = path
+        self.render = render
+        self.interval = 1.0 / fps
+        self.echo = echo
+        self.lines = deque(maxlen=tail)
+        self.pending = []
+        self.last_flush = time.monotonic() - self.interval  # First line renders immediately
+        self.lock = threading.Lock()
+        self.timer = None
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def write(self, msg, display=None, fields=None):
+        """Records one log line. `display` overrides the text shown in the UI tail,
+        `fields` adds structured data to the JSON record."""
+        record = json.dumps({"timestamp": time.time(), "message": msg, **(fields or {})})
+        with self.lock:
+            self.file.write(record + "\n")
+            self.pending.append(record)
+            self.lines.append(msg if display is None else display)
+            wait = self.last_flush + self.interval - time.monotonic()
+            if wait > 0 and self.timer is None:
+                self.timer = threading.Timer(wait, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+        if wait <= 0:
+            self.flush()
+
+    def flush(self):
+        """Pushes buffered lines to disk, stdout and the UI."""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if self.file.closed:
+                return
+            self.file.flush()
+            pending, self.pending = self.pending, []
+            visible = list(self.lines)
+            self.last_flush = time.monotonic()
+        # Structured log for Agents, one write per frame instead of one per line
+        if self.echo and pending:
+            sys.stdout.write("\n".join(pending) + "\n")
+            sys.stdout.flush()
+        if self.render:
+            self.render(visible)
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            with self.lock:
+                if self.timer is not None:
+                    self.timer.cancel()
+                    self.timer = None
+                self.file.close()
+
+def tail_log(path, limit=15, block_size=64 * 1024):
+    """Last `limit` messages of a log file, reading backwards from the end instead of the whole file."""
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        data = b""
+        while end > 0 and data.count(b"\n") <= limit:
+            start = max(0, end - block_size)
+            f.seek(start)
+            data = f.read(end - start) + data
+            end = start
+    messages = []
+    for line in data.splitlines()[-limit:]:
+        try:
+            messages.append(json.loads(line)['message'])
+        except (ValueError, KeyError):
+            continue
+    return messages
+
+def read_log(path, limit=None):
+    """Returns the messages of a JSON-lines log file, optionally only the last `limit`."""
+    if not path or not os.path.exists(path):
+        return []
+    messages = deque(maxlen=limit)
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                messages.append(json.loads(line)['message'])
+            except (ValueError, KeyError):
+                continue
+    return list(messages)
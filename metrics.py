@@ -0,0 +1,192 @@
+import os
+import sys
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import storage
+import db_pool
+
+# Prometheus text-format exporter, served on a daemon thread of the app process
+# (started by job_runner.startup()). Counters and histograms are fed by the job
+# runner and start from zero with the process; job counts and pool usage are read
+# at scrape time. The endpoint has no authentication, so it listens on localhost
+# unless PGSHIFT_METRICS_ADDRESS says otherwise.
+PORT = os.environ.get('PGSHIFT_METRICS_PORT', '9108')  # empty or 0 disables the exporter
+ADDRESS = os.environ.get('PGSHIFT_METRICS_ADDRESS', '127.0.0.1')
+
+# Upper bounds in seconds, from quick phases to multi-hour restores
+DURATION_BUCKETS = (1, 5, 15, 60, 300, 900, 1800, 3600, 3 * 3600, 12 * 3600)
+
+# Progress phases whose rows are rows landing on the target (not dumped or compared)
+LOAD_PHASES = ('restoring', 'streaming', 'copying')
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(dict(key))} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        # labels -> (bucket counts, sum, count)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            counts, total, count = self.values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            counts = [c + (value <= bound) for c, bound in zip(counts, self.buckets)]
+            self.values[key] = (counts, total + value, count + 1)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.values.items()):
+                labels = dict(key)
+                for bound, c in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{format_labels({**labels, 'le': bound})} {c}")
+                lines.append(f"{self.name}_bucket{format_labels({**labels, 'le': '+Inf'})} {count}")
+                lines.append(f"{self.name}_sum{format_labels(labels)} {total}")
+                lines.append(f"{self.name}_count{format_labels(labels)} {count}")
+        return lines
+
+MIGRATIONS_STARTED = Counter('pgshift_migrations_started_total', "Migrations started, by mode.")
+MIGRATIONS_SUCCEEDED = Counter('pgshift_migrations_succeeded_total', "Migrations that completed, by mode.")
+MIGRATIONS_FAILED = Counter('pgshift_migrations_failed_total', "Migrations that failed, by mode.")
+ROWS_MOVED = Counter('pgshift_rows_moved_total', "Rows loaded into targets, updated while jobs run (estimates unless COPY counts them).")
+BYTES_MOVED = Counter('pgshift_bytes_moved_total', "Source database bytes of completed migrations.")
+DUMP_BYTES = Counter('pgshift_dump_bytes_total', "Dump bytes written to local disk, updated while jobs run.")
+MIGRATION_DURATION = Histogram('pgshift_migration_duration_seconds', "Wall time of finished migrations, by mode and status.")
+PHASE_DURATION = Histogram('pgshift_phase_duration_seconds', "Wall time of migration phases, by phase.")
+
+REGISTRY = [MIGRATIONS_STARTED, MIGRATIONS_SUCCEEDED, MIGRATIONS_FAILED, ROWS_MOVED, BYTES_MOVED, DUMP_BYTES,
+            MIGRATION_DURATION, PHASE_DURATION]
+
+# job id -> {'mode', 'phase', 'rows', 'bytes'}: last progress seen, to count increments
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+def job_started(job_id, mode):
+    MIGRATIONS_STARTED.inc(mode=mode)
+    with _jobs_lock:
+        _jobs[job_id] = {'mode': mode, 'phase': None, 'rows': 0, 'bytes': 0}
+
+def job_progress(job_id, progress):
+    """Counts the rows and dump bytes a migration.ProgressTracker snapshot adds to the job's last one."""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if not job:
+            return
+        if job['phase'] != progress['phase']:
+            job.update(phase=progress['phase'], rows=0, bytes=0)
+        rows, size = progress['done']['rows'], progress['done']['bytes']
+        new_rows, new_bytes = rows - job['rows'], size - job['bytes']
+        job.update(rows=rows, bytes=size)
+        mode = job['mode']
+    if progress['phase'] in LOAD_PHASES and new_rows > 0:
+        ROWS_MOVED.inc(new_rows, mode=mode)
+    if new_bytes > 0:
+        DUMP_BYTES.inc(new_bytes, mode=mode)
+
+def phase_finished(record):
+    """Records a phase span (see tracing.TraceWriter)."""
+    if record:
+        PHASE_DURATION.observe(record['end'] - record['start'], phase=record['name'].lower())
+
+def job_finished(job_id, mode, success, duration, size_bytes=None):
+    with _jobs_lock:
+        _jobs.pop(job_id, None)
+    status = 'succeeded' if success else 'failed'
+    (MIGRATIONS_SUCCEEDED if success else MIGRATIONS_FAILED).inc(mode=mode)
+    MIGRATION_DURATION.observe(duration, mode=mode, status=status)
+    if success and size_bytes:
+        BYTES_MOVED.inc(size_bytes, mode=mode)
+
+def gauge(name, help_text, samples):
+    """Lines of a gauge from [(labels, value)]."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    lines += [f"{name}{format_labels(labels)} {value}" for labels, value in samples]
+    return lines
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+
+    with _jobs_lock:
+        active = len(_jobs)
+    lines += gauge('pgshift_jobs_active', "Migrations running in this process.", [({}, active)])
+    try:
+        counts = storage.count_jobs_by_status()
+    except Exception:
+        counts = {}
+    lines += gauge('pgshift_jobs', "Jobs in the job history, by status.", [({'status': s}, n) for s, n in sorted(counts.items())])
+
+    pools = sorted(db_pool.pool_stats().items())
+    lines += gauge('pgshift_pool_connections', "Pooled connections, by pool and state.",
+                   [({'pool': name, 'state': state}, stats[state]) for name, stats in pools for state in ('in_use', 'idle')])
+    lines += gauge('pgshift_pool_max_size', "Connection limit of each pool.", [({'pool': name}, stats['max_size']) for name, stats in pools])
+    lines += ["# HELP pgshift_pool_connections_created_total Connections opened by each pool.",
+              "# TYPE pgshift_pool_connections_created_total counter"]
+    lines += [f"pgshift_pool_connections_created_total{format_labels({'pool': name})} {stats['created']}" for name, stats in pools]
+    lines += gauge('pgshift_scrape_timestamp_seconds', "Time of this scrape.", [({}, round(time.time(), 3))])
+    return "\n".join(lines) + "\n"
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would flood stdout, which carries the structured job logs
+
+_server = None
+_server_lock = threading.Lock()
+
+def start_server(port=PORT, address=ADDRESS):
+    """Serves /metrics on a daemon thread, once per process. Returns the server, None when disabled."""
+    global _server
+    with _server_lock:
+        if _server or not port or str(port) == '0':
+            return _server
+        try:
+            _server = ThreadingHTTPServer((address, int(port)), MetricsHandler)
+        except OSError as e:
+            # Another app process already serves this port
+            print(f"Metrics exporter not started on port {port}: {e}", file=sys.stderr)
+            return None
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="pgshift-metrics", daemon=True).start()
+        return _server
@@ -1,14 +1,42 @@
 import subprocess
 import os
 import tempfile
+import shutil
+import threading
+import queue
+import fcntl
+import time
+import hashlib
+import json
+import contextlib
+import concurrent.futures
 import psycopg2
+import psycopg2.errors
+import psycopg2.extras
 import logging
+import re
+import storage
+import db_pool
+import artifacts
+import checkpoints
+import throttling
+import tracing
+
+def conninfo_quote(value):
+    """A libpq conninfo value: single-quoted, with backslashes and quotes escaped."""
+    return "'" + str(value).replace('\\', '\\\\').replace("'", "\\'") + "'"
 
 def get_conn_string(conn_details):
-    return f"host={conn_details['host']} port={conn_details['port']} dbname={conn_details['dbname']} user={conn_details['user']} password={conn_details['password']}"
+    return " ".join(f"{key}={conninfo_quote(conn_details[key])}" for key in ('host', 'port', 'dbname', 'user', 'password'))
+
+def run_command(cmd, env, log_callback, tick=None, limiter=None, measure=None):
+    """Runs a shell command and streams stdout/stderr to the log callback.
 
-def run_command(cmd, env, log_callback):
-    """Runs a shell command and streams stdout/stderr to the log callback."""
+    tick, if given, is called at least once per second while the command runs.
+    limiter (a throttling.Throttle) holds the command back to its byte budget, measured
+    by the bytes its process group has read (throttling.read_meter), or by measure()
+    where /proc is not available.
+    """
     masked_cmd = " ".join([c if i != 0 or 'PGPASSWORD' not in env else '****' for i, c in enumerate(cmd)])
     # Simplified masking for now as PGPASSWORD is in env, not cmd
     log_callback(f"Executing: {' '.join(cmd[:1])} ...") 
@@ -20,172 +48,2307 @@ def run_command(cmd, env, log_callback):
         stderr=subprocess.STDOUT,
         text=True,
         bufsize=1,
-        universal_newlines=True
+        universal_newlines=True,
+        # Own process group, so the throttle can stop and continue pg_dump -j workers too
+        start_new_session=limiter is not None
     )
+    release = limiter.control(process, throttling.read_meter(process.pid, measure)) if limiter else None
     
-    for line in iter(process.stdout.readline, ""):
-        if line:
-            log_callback(line.strip())
+    if tick is None:
+        for line in iter(process.stdout.readline, ""):
+            if line:
+                log_callback(line.strip())
+    else:
+        # Read on a helper thread so tick() still runs while the command is silent
+        lines = queue.Queue()
+
+        def reader():
+            for line in iter(process.stdout.readline, ""):
+                lines.put(line)
+            lines.put(None)
+
+        threading.Thread(target=reader, daemon=True).start()
+        while True:
+            try:
+                line = lines.get(timeout=1)
+            except queue.Empty:
+                tick()
+                continue
+            if line is None:
+                break
+            if line.strip():
+                log_callback(line.strip())
+            tick()
             
     process.stdout.close()
     return_code = process.wait()
+    if release:
+        release()
     if return_code != 0:
         raise Exception(f"Command failed with exit code {return_code}")
 
-def drop_public_tables(target_conn_details, log_callback):
-    log_callback("Connecting to target to drop tables...")
+# Selective migration: pg_dump -n/-N/-t/-T patterns (psql syntax: * and ?, "quoted" names)
+FILTER_FLAGS = (('include_schemas', '-n'), ('exclude_schemas', '-N'), ('include_tables', '-t'), ('exclude_tables', '-T'))
+
+RELKIND_DROP = {'r': 'TABLE', 'p': 'TABLE', 'v': 'VIEW', 'm': 'MATERIALIZED VIEW', 'f': 'FOREIGN TABLE'}
+
+def normalize_filters(filters):
+    """Filters without empty patterns; None when nothing is filtered."""
+    filters = {key: [p.strip() for p in (filters or {}).get(key) or [] if p.strip()] for key, _ in FILTER_FLAGS}
+    return {key: patterns for key, patterns in filters.items() if patterns} or None
+
+def filter_args(filters):
+    """pg_dump arguments for a filters dict."""
+    args = []
+    for key, flag in FILTER_FLAGS:
+        for pattern in (filters or {}).get(key, []):
+            args += [flag, pattern]
+    return args
+
+def parse_name_pattern(pattern):
+    """psql name pattern -> (schema regex or None, name regex), the way pg_dump interprets it."""
+    parts, current, quoted = [], [], False
+    i = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == '"':
+            if quoted and pattern[i + 1:i + 2] == '"':
+                current.append('"')
+                i += 1
+            else:
+                quoted = not quoted
+        elif quoted:
+            current.append(re.escape(ch))
+        elif ch == '.':
+            parts.append("".join(current))
+            current = []
+        elif ch == '*':
+            current.append('.*')
+        elif ch == '?':
+            current.append('.')
+        else:
+            # Unquoted names are folded to lower case
+            current.append(re.escape(ch.lower()))
+        i += 1
+    parts.append("".join(current))
+    # database.schema.table: the database part is ignored
+    regexes = [re.compile(f"^(?:{p})$", re.S) for p in parts[-2:]]
+    return (None, regexes[0]) if len(regexes) == 1 else tuple(regexes)
+
+def match_schema(patterns, schema):
+    return any(parse_name_pattern(p)[1].match(schema) for p in patterns)
+
+def match_table(patterns, schema, name, visible):
+    """Unqualified patterns only match tables visible in the search_path, like pg_dump -t."""
+    for pattern in patterns:
+        schema_re, name_re = parse_name_pattern(pattern)
+        if name_re.match(name) and (schema_re.match(schema) if schema_re else visible):
+            return True
+    return False
+
+def table_selected(filters, schema, name, visible=True):
+    """Whether pg_dump with filter_args(filters) dumps this table. -n/-N don't apply once -t is used."""
+    if not filters:
+        return True
+    if filters.get('include_tables'):
+        selected = match_table(filters['include_tables'], schema, name, visible)
+    else:
+        selected = ((not filters.get('include_schemas') or match_schema(filters['include_schemas'], schema))
+                    and not match_schema(filters.get('exclude_schemas', []), schema))
+    return selected and not match_table(filters.get('exclude_tables', []), schema, name, visible)
+
+def reset_target(target_conn_details, log_callback, filters=None):
+    """Clears the target for the restore as its own phase and reports how long it took."""
+    log_callback("PHASE:RESETTING|Preparing target database (dropping existing objects)...")
+    started = time.time()
+    strategy = drop_target_tables(target_conn_details, log_callback, filters)
+    log_callback(f"Target reset completed in {time.time() - started:.1f}s ({strategy}).")
+
+def drop_target_tables(target_conn_details, log_callback, filters=None):
+    """Clears the target for the restore and returns the strategy used.
+
+    Without filters, the public schema is emptied. With -t patterns the
+    matching tables and views are dropped, with -n patterns the whole schemas
+    (the dump recreates them, CREATE SCHEMA included). Exclude patterns keep
+    matching objects, except inside a schema that is dropped as a whole.
+    """
+    filters = normalize_filters(filters)
+    if not filters:
+        return reset_public_schema(target_conn_details, log_callback)
+
+    log_callback("Connecting to target to drop selected objects...")
     try:
-        conn = psycopg2.connect(
-            host=target_conn_details['host'],
-            port=target_conn_details['port'],
-            dbname=target_conn_details['dbname'],
-            user=target_conn_details['user'],
-            password=target_conn_details['password']
-        )
-        conn.autocommit = True
-        cur = conn.cursor()
-        
-        sql = """
-        DO
-        $$
-        DECLARE
-            r RECORD;
-        BEGIN
-            FOR r IN (SELECT tablename FROM pg_tables WHERE schemaname = 'public') LOOP
-                EXECUTE 'DROP TABLE IF EXISTS ' || quote_ident(r.tablename) || ' CASCADE';
-            END LOOP;
-        END
-        $$;
-        """
-        log_callback("Executing DROP TABLE script...")
-        cur.execute(sql)
-        log_callback("All public tables dropped successfully.")
-        
-        cur.close()
-        conn.close()
+        with db_pool.connection(target_conn_details) as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT n.nspname FROM pg_namespace n
+                WHERE n.nspname NOT IN ('pg_catalog', 'information_schema')
+                  AND n.nspname NOT LIKE 'pg_toast%' AND n.nspname NOT LIKE 'pg_temp%';
+            """)
+            schemas = []
+            if filters.get('include_schemas') and not filters.get('include_tables'):
+                schemas = [r[0] for r in cur.fetchall()
+                           if match_schema(filters['include_schemas'], r[0])
+                           and not match_schema(filters.get('exclude_schemas', []), r[0])]
+
+            cur.execute("""
+                SELECT n.nspname, c.relname, c.relkind, pg_table_is_visible(c.oid)
+                FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE c.relkind IN ('r', 'p', 'v', 'm', 'f') AND NOT c.relispartition
+                  AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+                  AND n.nspname NOT LIKE 'pg_toast%' AND n.nspname NOT LIKE 'pg_temp%'
+                  AND NOT EXISTS (SELECT 1 FROM pg_depend d WHERE d.objid = c.oid AND d.deptype = 'e');
+            """)
+            # Without include patterns the dump is the whole database minus exclusions; like a full run, only public is cleared
+            scope_public = not (filters.get('include_tables') or filters.get('include_schemas'))
+            relations = [
+                (schema, name, kind) for schema, name, kind, visible in cur.fetchall()
+                if schema not in schemas
+                and (schema == 'public' or not scope_public)
+                and table_selected(filters, schema, name, visible)
+            ]
+
+            if filters.get('exclude_tables') and schemas:
+                log_callback(f"WARNING: Excluded tables inside {', '.join(schemas)} are dropped with their schema.")
+
+            # One statement per object kind, in one transaction: a failed drop leaves the target as it was
+            statements = []
+            if schemas:
+                log_callback(f"Dropping schemas {', '.join(schemas)}...")
+                statements.append(f"DROP SCHEMA IF EXISTS {', '.join(quote_ident(s) for s in schemas)} CASCADE;")
+            by_kind = {}
+            for schema, name, kind in relations:
+                by_kind.setdefault(RELKIND_DROP[kind], []).append(qualified_name(schema, name))
+            for kind, names in by_kind.items():
+                statements.append(f"DROP {kind} IF EXISTS {', '.join(names)} CASCADE;")
+            conn.autocommit = False
+            for sql in statements:
+                cur.execute(sql)
+            conn.commit()
+            for notice in conn.notices:
+                log_callback(notice.strip())
+            del conn.notices[:]
+            log_callback(f"Dropped {len(schemas)} schemas and {len(relations)} tables/views selected for migration.")
+            return "selected objects"
     except Exception as e:
         log_callback(f"Error dropping tables: {str(e)}")
         raise e
 
-def run_migration(source, target, log_callback, schema_only=False):
-    # Use NamedTemporaryFile for better lifecycle management
-    with tempfile.NamedTemporaryFile(suffix=".dump", delete=False) as tmp_file:
-        dump_file = tmp_file.name
+# Objects of the public schema, one DROP statement per kind. Extension members and
+# objects that go away with their parent (partitions, array and row types) are left out.
+PUBLIC_OBJECT_QUERIES = [
+    ('TABLE', """
+        SELECT c.oid::regclass::text FROM pg_class c
+        WHERE c.relnamespace = 'public'::regnamespace AND c.relkind IN ('r', 'p') AND NOT c.relispartition
+          AND NOT EXISTS (SELECT 1 FROM pg_depend d WHERE d.classid = 'pg_class'::regclass AND d.objid = c.oid AND d.deptype = 'e');
+    """),
+    ('FOREIGN TABLE', """
+        SELECT c.oid::regclass::text FROM pg_class c
+        WHERE c.relnamespace = 'public'::regnamespace AND c.relkind = 'f'
+          AND NOT EXISTS (SELECT 1 FROM pg_depend d WHERE d.classid = 'pg_class'::regclass AND d.objid = c.oid AND d.deptype = 'e');
+    """),
+    ('MATERIALIZED VIEW', """
+        SELECT c.oid::regclass::text FROM pg_class c
+        WHERE c.relnamespace = 'public'::regnamespace AND c.relkind = 'm'
+          AND NOT EXISTS (SELECT 1 FROM pg_depend d WHERE d.classid = 'pg_class'::regclass AND d.objid = c.oid AND d.deptype = 'e');
+    """),
+    ('VIEW', """
+        SELECT c.oid::regclass::text FROM pg_class c
+        WHERE c.relnamespace = 'public'::regnamespace AND c.relkind = 'v'
+          AND NOT EXISTS (SELECT 1 FROM pg_depend d WHERE d.classid = 'pg_class'::regclass AND d.objid = c.oid AND d.deptype = 'e');
+    """),
+    ('SEQUENCE', """
+        SELECT c.oid::regclass::text FROM pg_class c
+        WHERE c.relnamespace = 'public'::regnamespace AND c.relkind = 'S'
+          AND NOT EXISTS (SELECT 1 FROM pg_depend d WHERE d.classid = 'pg_class'::regclass AND d.objid = c.oid AND d.deptype IN ('e', 'a', 'i'));
+    """),
+    ('ROUTINE', """
+        SELECT p.oid::regprocedure::text FROM pg_proc p
+        WHERE p.pronamespace = 'public'::regnamespace
+          AND NOT EXISTS (SELECT 1 FROM pg_depend d WHERE d.classid = 'pg_proc'::regclass AND d.objid = p.oid AND d.deptype = 'e');
+    """),
+    ('DOMAIN', """
+        SELECT t.oid::regtype::text FROM pg_type t
+        WHERE t.typnamespace = 'public'::regnamespace AND t.typtype = 'd'
+          AND NOT EXISTS (SELECT 1 FROM pg_depend d WHERE d.classid = 'pg_type'::regclass AND d.objid = t.oid AND d.deptype = 'e');
+    """),
+    ('TYPE', """
+        SELECT t.oid::regtype::text FROM pg_type t
+        WHERE t.typnamespace = 'public'::regnamespace AND t.typtype IN ('b', 'c', 'e', 'r')
+          AND NOT EXISTS (SELECT 1 FROM pg_depend d WHERE d.classid = 'pg_type'::regclass AND d.objid = t.oid AND d.deptype IN ('e', 'i'));
+    """),
+]
+
+def reset_public_schema(target_conn_details, log_callback):
+    """Empties the target's public schema in a single transaction and returns the strategy used.
 
+    When the user may drop public and no extension lives in it, the schema is
+    dropped and recreated with its owner, privileges and comment. Otherwise its
+    tables, views, sequences, routines and types are dropped with one
+    statement per object kind; extension objects are kept.
+    """
+    log_callback("Connecting to target to reset the public schema...")
     try:
-        # 1. pg_dump from Source
-        mode_str = "Schema Only" if schema_only else "Full (Schema + Data)"
-        log_callback(f"PHASE:DUMPING|Starting dump ({mode_str}) from {source['host']}...")
-        
-        env_source = os.environ.copy()
-        env_source['PGPASSWORD'] = source['password']
-        
-        dump_cmd = [
-            'pg_dump',
-            '-v', # Verbose for better logging
-            '-h', source['host'],
-            '-p', source['port'],
-            '-U', source['user'],
-            '-Fc', # Custom format
-            '-f', dump_file,
-            source['dbname']
-        ]
-        
-        if schema_only:
-            dump_cmd.insert(5, '-s')
+        with db_pool.connection(target_conn_details) as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT n.nspowner::regrole::text,
+                       pg_has_role(n.nspowner, 'MEMBER') OR (SELECT rolsuper FROM pg_roles WHERE rolname = current_user),
+                       obj_description(n.oid, 'pg_namespace'),
+                       EXISTS (SELECT 1 FROM pg_extension e WHERE e.extnamespace = n.oid)
+                FROM pg_namespace n WHERE n.nspname = 'public';
+            """)
+            row = cur.fetchone()
+            if row is None:
+                log_callback("Target has no public schema, creating it.")
+                cur.execute("CREATE SCHEMA public;")
+                return "schema created"
+            owner, can_drop, comment, has_extensions = row
+
+            conn.autocommit = False
+            if can_drop and not has_extensions:
+                # 1. Privileges to re-grant on the new schema
+                cur.execute("""
+                    SELECT CASE WHEN a.grantee = 0 THEN 'PUBLIC' ELSE a.grantee::regrole::text END,
+                           a.privilege_type, a.is_grantable
+                    FROM pg_namespace n, aclexplode(n.nspacl) a WHERE n.nspname = 'public';
+                """)
+                grants = cur.fetchall()
+                cur.execute("SELECT count(*) FROM pg_class WHERE relnamespace = 'public'::regnamespace;")
+                relations = cur.fetchone()[0]
+
+                # 2. Drop and recreate in one transaction; the dump does not emit CREATE SCHEMA public
+                log_callback(f"Dropping and recreating schema public ({relations} relations)...")
+                cur.execute("DROP SCHEMA public CASCADE;")
+                cur.execute("CREATE SCHEMA public;")
+                cur.execute(f"ALTER SCHEMA public OWNER TO {owner};")
+                for grantee, privilege, grantable in grants:
+                    option = " WITH GRANT OPTION" if grantable and grantee != 'PUBLIC' else ""
+                    cur.execute(f"GRANT {privilege} ON SCHEMA public TO {grantee}{option};")
+                if comment is not None:
+                    cur.execute("COMMENT ON SCHEMA public IS %s;", (comment,))
+                conn.commit()
+                del conn.notices[:]
+                log_callback("Schema public recreated.")
+                return "schema recreated"
+
+            # Fallback: one DROP per object kind, names collected before anything is dropped
+            reason = "it contains extensions" if has_extensions else f"it is owned by {owner}"
+            log_callback(f"Schema public is kept because {reason}; dropping its objects instead.")
+            statements = []
+            counts = []
+            for kind, query in PUBLIC_OBJECT_QUERIES:
+                cur.execute(query)
+                names = [r[0] for r in cur.fetchall()]
+                if names:
+                    # IF EXISTS: an earlier CASCADE may already have removed some of them
+                    statements.append(f"DROP {kind} IF EXISTS {', '.join(names)} CASCADE;")
+                    counts.append(f"{len(names)} {kind.lower()}")
+            for sql in statements:
+                cur.execute(sql)
+            conn.commit()
+            del conn.notices[:]
+            log_callback(f"Dropped {', '.join(counts) or 'nothing'} from schema public.")
+            return "set-based drop"
+    except Exception as e:
+        log_callback(f"Error resetting target: {str(e)}")
+        raise e
+
+PIPE_BUFFER_SIZE = 1024 * 1024
+
+def run_pipeline(dump_cmd, env_source, restore_cmd, env_target, log_callback, tick=None, limiter=None):
+    """Pipes dump_cmd stdout into restore_cmd stdin, streaming both outputs to the log callback.
+
+    The OS pipe provides back-pressure: pg_dump blocks when the restore side falls
+    behind. If either side fails the other one is terminated so a partial dump is
+    never silently applied. limiter (a throttling.Throttle) holds the dump side
+    back to its byte budget.
+    """
+    log_callback(f"Executing: {dump_cmd[0]} | {restore_cmd[0]} ...")
+
+    dump_proc = subprocess.Popen(dump_cmd, env=env_source, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                 start_new_session=limiter is not None)
+    release = None
+    if limiter:
+        release = limiter.control(dump_proc, throttling.read_meter(dump_proc.pid))
+    try:
+        restore_proc = subprocess.Popen(
+            restore_cmd,
+            env=env_target,
+            stdin=dump_proc.stdout,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT
+        )
+    except Exception:
+        dump_proc.kill()
+        dump_proc.wait()
+        if release:
+            release()
+        raise
+
+    # Bigger pipe buffer means fewer context switches between the two processes
+    if hasattr(fcntl, 'F_SETPIPE_SZ'):
+        try:
+            fcntl.fcntl(dump_proc.stdout.fileno(), fcntl.F_SETPIPE_SZ, PIPE_BUFFER_SIZE)
+        except OSError:
+            pass
+
+    # Only pg_restore/psql holds the read end now, so pg_dump gets SIGPIPE if it dies
+    dump_proc.stdout.close()
+
+    # Reader threads feed one queue so log_callback is only ever called from this thread
+    lines = queue.Queue()
+
+    def reader(name, stream):
+        for raw in iter(stream.readline, b""):
+            lines.put((name, raw.decode(errors='replace').strip()))
+        stream.close()
+        lines.put((name, None))
+
+    threads = [
+        threading.Thread(target=reader, args=(dump_cmd[0], dump_proc.stderr), daemon=True),
+        threading.Thread(target=reader, args=(restore_cmd[0], restore_proc.stdout), daemon=True),
+    ]
+    for t in threads:
+        t.start()
+
+    terminated = set()
+    open_streams = len(threads)
+    while open_streams:
+        try:
+            name, line = lines.get(timeout=0.5)
+        except queue.Empty:
+            name, line = None, ""
+        if line is None:
+            open_streams -= 1
+        elif line:
+            log_callback(line)
+
+        if tick:
+            tick()
+
+        # Fail fast: stop the other side as soon as one side exits with an error
+        dump_rc, restore_rc = dump_proc.poll(), restore_proc.poll()
+        if dump_rc not in (None, 0) and restore_rc is None:
+            restore_proc.terminate()
+            terminated.add('restore')
+        if restore_rc not in (None, 0) and dump_rc is None:
+            if release:
+                # A stopped pg_dump would not act on SIGTERM
+                release()
+            dump_proc.terminate()
+            terminated.add('dump')
+
+    dump_rc = dump_proc.wait()
+    if release:
+        release()
+    restore_rc = restore_proc.wait()
+    # Report the side that failed first, not the one we stopped
+    if restore_rc != 0 and 'restore' not in terminated:
+        raise Exception(f"{restore_cmd[0]} failed with exit code {restore_rc}")
+    if dump_rc != 0:
+        raise Exception(f"{dump_cmd[0]} failed with exit code {dump_rc}")
+    if restore_rc != 0:
+        raise Exception(f"{restore_cmd[0]} failed with exit code {restore_rc}")
+
+# --- Progress reporting ---
+
+# Seconds between PROGRESS: log lines, and smoothing factor of the moving-average rate
+PROGRESS_INTERVAL = 5
+PROGRESS_SMOOTHING = 0.3
+
+# pg_dump / pg_restore -v lines naming the table whose data is being processed
+TABLE_STARTED = re.compile(r'(?:dumping contents of table|processing data for table) "?([^"]+)"?')
+# Parallel (-j) output: "finished item <id> TABLE DATA <table>", without the schema
+TABLE_FINISHED = re.compile(r'finished item \d+ TABLE DATA (\S+)')
+
+def path_size(path):
+    """Size of a file, or of all files in a directory, in bytes."""
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+class ProgressTracker:
+    """Tracks a phase's progress in tables, rows and bytes, with a moving-average rate and ETA.
+
+    Progress is reported through log_callback as "PROGRESS:{json}" lines, at most
+    every PROGRESS_INTERVAL seconds. Rows are estimates from reltuples unless the
+    engine counts them exactly (COPY). The ETA follows rows when the table sizes
+    are known, otherwise tables.
+    """
+
+    def __init__(self, log_callback, tables=None, total_bytes=0):
+        self.log_callback = log_callback
+        # "schema.table" -> estimated rows
+        self.table_rows = {f"{t['schema']}.{t['name']}": t['rows'] for t in (tables or [])}
+        self.total_bytes = total_bytes
+        self.phase = None
+        # Throttle of the running dump, if any, reported with each snapshot
+        self.limiter = None
+
+    def start(self, phase, count_bytes=False):
+        self.phase = phase
+        self.count_bytes = count_bytes
+        self.done = {'tables': 0, 'rows': 0, 'bytes': 0}
+        self.current = None
+        self.parallel = False
+        self.finished = set()
+        self.started = self.last_sample = self.last_report = time.time()
+        self.last_value = 0
+        self.rate = None
+
+    def primary(self):
+        return 'rows' if sum(self.table_rows.values()) > 0 else 'tables'
+
+    def totals(self):
+        return {
+            'tables': len(self.table_rows),
+            'rows': sum(self.table_rows.values()),
+            'bytes': self.total_bytes if self.count_bytes else 0,
+        }
+
+    def table_done(self, name, rows=None):
+        """Marks a table finished; rows defaults to its reltuples estimate."""
+        if name in self.finished:
+            return
+        self.finished.add(name)
+        self.done['tables'] += 1
+        self.done['rows'] += self.table_rows.get(name, 0) if rows is None else rows
+
+    def add_rows(self, rows):
+        self.done['rows'] += rows
+
+    def set_bytes(self, value):
+        self.done['bytes'] = value
+
+    def observe(self, msg):
+        """Follows pg_dump / pg_restore -v output to count finished tables."""
+        match = TABLE_FINISHED.search(msg)
+        if match:
+            self.parallel = True
+            name = match.group(1)
+            full = next((t for t in self.table_rows if t.split('.', 1)[1] == name and t not in self.finished), None)
+            self.table_done(full or name)
+            return
+        match = TABLE_STARTED.search(msg)
+        if match and not self.parallel:
+            # Serial output only announces starts: the previous table is done
+            if self.current:
+                self.table_done(self.current)
+            self.current = match.group(1)
+
+    def wrap(self, log_callback):
+        """log_callback that also feeds the tracker."""
+        def callback(msg):
+            self.observe(msg)
+            log_callback(msg)
+        return callback
+
+    def sample(self):
+        now = time.time()
+        value = self.done[self.primary()]
+        if now > self.last_sample:
+            instant = (value - self.last_value) / (now - self.last_sample)
+            self.rate = instant if self.rate is None else PROGRESS_SMOOTHING * instant + (1 - PROGRESS_SMOOTHING) * self.rate
+            self.last_sample, self.last_value = now, value
+
+    def tick(self, force=False):
+        """Reports progress if PROGRESS_INTERVAL has passed (or force)."""
+        if not force and time.time() - self.last_report < PROGRESS_INTERVAL:
+            return
+        self.sample()
+        self.last_report = time.time()
+        self.log_callback("PROGRESS:" + json.dumps(self.snapshot()))
+
+    def finish(self):
+        if self.current:
+            self.table_done(self.current)
+            self.current = None
+        self.tick(force=True)
+
+    def snapshot(self):
+        totals = self.totals()
+        unit = self.primary()
+        remaining = max(totals[unit] - self.done[unit], 0)
+        percent = min(100.0, 100.0 * self.done[unit] / totals[unit]) if totals[unit] else None
+        eta = remaining / self.rate if self.rate else None
+        elapsed = time.time() - self.started
+        return {
+            'phase': self.phase,
+            'unit': unit,
+            'percent': round(percent, 1) if percent is not None else None,
+            'done': dict(self.done),
+            'total': totals,
+            'rate': round(self.rate, 1) if self.rate else 0,
+            'bytes_per_second': round(self.done['bytes'] / elapsed) if elapsed > 0 else 0,
+            'eta_seconds': round(eta) if eta is not None else None,
+            'elapsed_seconds': round(elapsed),
+            'throttle': self.limiter.snapshot() if self.limiter else None,
+        }
+
+@contextlib.contextmanager
+def dump_throttle(source, throttle, log_callback, progress=None):
+    """A running throttling.Throttle for one dump (None when throttle is not set), shown in progress."""
+    if not throttle:
+        yield None
+        return
+    limiter = throttling.Throttle(source, throttle, log_callback).start()
+    if progress:
+        progress.limiter = limiter
+    try:
+        yield limiter
+    finally:
+        limiter.stop()
+        if progress:
+            progress.limiter = None
+
+def start_progress(source, log_callback, filters=None):
+    """ProgressTracker seeded with the source's tables (reltuples) and database size."""
+    try:
+        with db_pool.connection(source, connect_timeout=5) as conn:
+            cur = conn.cursor()
+            tables = list_copy_tables(cur, filters)
+            if filters:
+                # Only the selected tables are dumped
+                total_bytes = sum(t['bytes'] for t in tables)
+            else:
+                cur.execute("SELECT pg_database_size(current_database());")
+                total_bytes = cur.fetchone()[0]
+    except Exception as e:
+        log_callback(f"WARNING: Progress totals unavailable: {str(e)}")
+        tables, total_bytes = [], 0
+    return ProgressTracker(log_callback, tables, total_bytes)
+
+# Migration modes
+MODE_STANDARD = "standard"  # Single pg_dump -Fc file, single-threaded pg_restore
+MODE_PARALLEL = "parallel"  # Directory format dump/restore with -j N
+MODE_STREAM = "stream"      # pg_dump piped straight into pg_restore/psql, no local dump file
+MODE_COPY = "copy"          # Schema via pg_dump -s, data via parallel COPY between servers
+MODE_INCREMENTAL = "incremental"  # Re-copy only changed primary-key ranges, no drop
+MIGRATION_MODES = [MODE_STANDARD, MODE_PARALLEL, MODE_STREAM, MODE_COPY, MODE_INCREMENTAL]
+
+# Modes whose pg_dump can start from a replication slot's exported snapshot
+REPLICATION_MODES = [MODE_STANDARD, MODE_PARALLEL, MODE_STREAM]
+
+# Dump formats usable in stream mode
+STREAM_FORMATS = ['custom', 'plain']
+
+def default_jobs():
+    """Number of parallel jobs: PGSHIFT_JOBS setting, else based on CPU count."""
+    setting = os.environ.get('PGSHIFT_JOBS')
+    if setting:
+        try:
+            return max(1, int(setting))
+        except ValueError:
+            pass
+    # Leave one core for the app itself, cap to keep source load sane
+    return max(1, min((os.cpu_count() or 2) - 1, 16))
+
+def job_progress_callback(log_callback, jobs):
+    """Wraps log_callback to annotate pg_dump/pg_restore -j output with per-job progress."""
+    state = {'running': 0, 'finished': 0}
+
+    def callback(msg):
+        # pg_restore -j workers report "launching item ...", pg_dump -j workers "dumping contents
+        # of table ..."; both leaders report "finished item ..." once a worker is done
+        if 'launching item' in msg or 'dumping contents of table' in msg:
+            state['running'] += 1
+        elif 'finished item' in msg:
+            state['running'] = max(0, state['running'] - 1)
+            state['finished'] += 1
+        else:
+            log_callback(msg)
+            return
+        log_callback(f"[jobs {state['running']}/{jobs} busy, {state['finished']} done] {msg}")
+
+    return callback
+
+def pg_env(conn_details):
+    """Environment for client binaries, password passed via PGPASSWORD."""
+    env = os.environ.copy()
+    env['PGPASSWORD'] = conn_details['password']
+    return env
+
+def build_dump_cmd(source, fmt, output=None, schema_only=False, jobs=1, extra=None, filters=None):
+    """pg_dump command line. fmt is a pg_dump -F letter; no output means stdout."""
+    cmd = [
+        'pg_dump',
+        '-v', # Verbose for better logging
+        '-h', source['host'],
+        '-p', source['port'],
+        '-U', source['user'],
+        f'-F{fmt}',
+    ]
+    if schema_only:
+        cmd.append('-s')
+    if jobs > 1:
+        cmd += ['-j', str(jobs)]
+    if output:
+        cmd += ['-f', output]
+    cmd += filter_args(filters)
+    cmd += extra or []
+    cmd.append(source['dbname'])
+    return cmd
+
+def build_restore_cmd(target, dump_file=None, jobs=1, extra=None):
+    """pg_restore command line. No dump_file means the archive is read from stdin."""
+    cmd = [
+        'pg_restore',
+        '-v', # Verbose
+        '-h', target['host'],
+        '-p', target['port'],
+        '-U', target['user'],
+        '-d', target['dbname'],
+    ]
+    if jobs > 1:
+        cmd += ['-j', str(jobs)]
+    cmd += extra or []
+    if dump_file:
+        cmd.append(dump_file)
+    return cmd
+
+def build_psql_cmd(target):
+    """psql command line that applies a plain SQL script from stdin and stops on the first error."""
+    return [
+        'psql',
+        '-q',
+        '-v', 'ON_ERROR_STOP=1',
+        '-h', target['host'],
+        '-p', target['port'],
+        '-U', target['user'],
+        '-d', target['dbname'],
+    ]
+
+def build_stream_restore_cmd(target, stream_format, single=False):
+    """psql (plain format) or pg_restore command line that applies a dump stream from stdin."""
+    if stream_format != 'plain':
+        return build_restore_cmd(target, extra=['--single-transaction'] if single else None)
+    cmd = build_psql_cmd(target)
+    if single:
+        # psql only honors -1 together with -c/-f; "-f -" still reads the script from stdin
+        cmd += ['--single-transaction', '-f', '-']
+    return cmd
+
+# Message of a run that migrated the data but failed its verification
+UNVERIFIED = "Migration completed, but "
 
-        run_command(dump_cmd, env_source, log_callback)
-        log_callback("Dump completed successfully.")
+def run_migration(source, target, log_callback, schema_only=False, mode=MODE_STANDARD, jobs=None,
+                  stream_format='custom', deferred_indexes=True, index_workers=None, replication=False,
+                  artifact_max_age=None, filters=None, fast_load=None, verify=None, run_id=None, resume=None,
+                  throttle=None, resumable=False):
+    """Runs one migration. filters selects schemas/tables with pg_dump -n/-N/-t/-T patterns:
+    {'include_schemas': [...], 'exclude_schemas': [...], 'include_tables': [...], 'exclude_tables': [...]}.
+    fast_load turns on the bulk-load profile of the pg_dump based modes (see normalize_fast_load).
+    verify (one of VERIFY_LEVELS) analyzes the target and compares it with the source after the run;
+    a run whose target differs from the source, or could not be verified, fails.
+    With resumable, run_id checkpoints the restore of the standard and parallel modes
+    so that a failed run can be continued later by passing its id as resume. This
+    keeps the dump of a failed run in data/resume and stops the restore at the
+    first error; without it a failed run leaves nothing behind.
+    throttle limits the read load on the source (see throttling.normalize_throttle);
+    the incremental mode is not throttled.
+    """
+    if mode not in MIGRATION_MODES:
+        return False, f"Unknown migration mode: {mode}"
+    filters = normalize_filters(filters)
+    fast_load = normalize_fast_load(fast_load)
+    throttle = throttling.normalize_throttle(throttle)
+    if resume and (replication or mode not in (MODE_STANDARD, MODE_PARALLEL)):
+        return False, "Only standard and parallel migrations without replication can be resumed"
+    if replication:
+        if mode not in REPLICATION_MODES or schema_only or filters:
+            return False, f"Logical replication needs a full, unfiltered pg_dump based mode ({', '.join(REPLICATION_MODES)})"
+        if verify:
+            log_callback("Verification skipped: the target keeps receiving changes through replication.")
+        return run_replicated_migration(source, target, log_callback, mode, jobs, stream_format, deferred_indexes, index_workers,
+                                        fast_load, throttle)
+    if mode == MODE_STREAM:
+        success, msg = run_stream_migration(source, target, log_callback, schema_only, stream_format, deferred_indexes, index_workers,
+                                            filters=filters, fast_load=fast_load, throttle=throttle)
+    elif mode == MODE_COPY and not schema_only:
+        success, msg = run_copy_migration(source, target, log_callback, jobs, index_workers, filters, throttle)
+    elif mode == MODE_INCREMENTAL:
+        success, msg = run_incremental_migration(source, target, log_callback, jobs, filters)
+    else:
+        success, msg = run_dump_migration(source, target, log_callback, schema_only, mode == MODE_PARALLEL, jobs, deferred_indexes,
+                                          index_workers, artifact_max_age=artifact_max_age, filters=filters, fast_load=fast_load,
+                                          run_id=resume or (run_id if resumable else None), resume=bool(resume), throttle=throttle)
+    if not (success and verify) or schema_only:
+        return success, msg
+
+    # The fast load profile has already run VACUUM ANALYZE
+    analyzed = fast_load and fast_load['vacuum'] and mode in (MODE_STANDARD, MODE_PARALLEL, MODE_STREAM)
+    try:
+        report = verify_migration(source, target, log_callback, verify, index_workers or jobs, filters, analyze=not analyzed)
+    except Exception as e:
+        log_callback(f"ERROR: Verification Failed - {str(e)}")
+        return False, f"{UNVERIFIED}verification failed: {str(e)}"
+    differing = len(report['mismatches']) + len(report['missing'])
+    if differing:
+        return False, f"{UNVERIFIED}{differing} of {report['tables']} tables differ between source and target."
+    return success, msg
+
+def run_dump_migration(source, target, log_callback, schema_only=False, parallel=False, jobs=None,
+                       deferred_indexes=True, index_workers=None, snapshot=None, artifact_max_age=None, filters=None,
+                       fast_load=None, run_id=None, resume=False, throttle=None):
+    """Dump to a local file (custom, or directory format when parallel), drop, restore.
+
+    With artifact_max_age (seconds) the dump is kept in the artifact store, and a
+    cached dump of the same source at most that old is restored instead of
+    dumping again. Dumps from a replication snapshot are never cached.
+
+    With fast_load the restore sessions run with FAST_LOAD_SETTINGS, optionally
+    in one transaction or into UNLOGGED tables that are set LOGGED after the
+    data section, and the loaded tables are vacuumed and analyzed in parallel.
+
+    With run_id, restored sections and TOC entries are checkpointed in storage and
+    the dump is kept if the run fails; resume=True continues that run from its
+    dump, skipping everything already restored.
+
+    throttle limits the load pg_dump puts on the source (see dump_source).
+    """
+    jobs = (jobs or default_jobs()) if parallel else 1
+    use_cache = artifact_max_age is not None and not snapshot
+    timings = StepTimings(log_callback)
+
+    job_log = job_progress_callback(log_callback, jobs) if parallel else log_callback
+    progress = ProgressTracker(log_callback) if schema_only else start_progress(source, log_callback, filters)
+
+    dump_file = None
+    artifact = None
+    run = None
+    success = False
+    try:
+        # 1. pg_dump from Source, a cached dump of it, or the dump of the failed run
+        if resume:
+            record = checkpoints.resumable(run_id)
+            if not record:
+                raise Exception(f"Run {run_id} can't be resumed: it did not fail or its dump no longer exists")
+            run = checkpoints.reopen(run_id)
+            dump_file = record['dump_path']
+            log_callback(f"Resuming run {run_id} from its dump, {len(run.done_items)} objects were already restored.")
+        else:
+            if run_id:
+                checkpoints.prune(log_callback)
+            with timings.step('dump'):
+                if use_cache:
+                    artifact = checkout_artifact(source, log_callback, schema_only, parallel, jobs, artifact_max_age, progress, job_log,
+                                                 filters, throttle)
+                    dump_file = artifact['path']
+                elif run_id:
+                    # Kept in the data directory, so a failed run can be resumed after a restart
+                    dump_file = checkpoints.dump_path(run_id, parallel)
+                else:
+                    if parallel:
+                        # Directory format is required for pg_dump -j
+                        # (pg_dump -Fd accepts an existing empty directory)
+                        dump_file = tempfile.mkdtemp(suffix=".dump")
+                    else:
+                        # Use NamedTemporaryFile for better lifecycle management
+                        with tempfile.NamedTemporaryFile(suffix=".dump", delete=False) as tmp_file:
+                            dump_file = tmp_file.name
+                if not artifact:
+                    dump_source(source, dump_file, log_callback, schema_only, parallel, jobs, progress, job_log, snapshot, filters,
+                                throttle)
+            run = checkpoints.RestoreRun.start(run_id, connection_key(source), connection_key(target), dump_file, owns_dump=not artifact)
+        toc = checkpoints.read_toc(dump_file)
+        data_tables = {qualified_name(e['schema'], e['tag']) for e in toc if e['desc'] == 'TABLE DATA'}
         
-        # 2. Drop tables on Target
-        log_callback("PHASE:DROPPING|Preparing target database (dropping existing tables)...")
-        drop_public_tables(target, log_callback)
+        # 2. Drop tables on Target (again if the schema was only partly restored)
+        env = restore_env(target, fast_load)
+        workers = index_workers or default_jobs()
+        extra = ['--single-transaction'] if single_transaction(fast_load, jobs, log_callback) else []
+        if not run.stage_done('pre-data'):
+            with timings.step('reset'):
+                reset_target(target, log_callback, filters)
+                # Whatever the failed attempt created is gone now, restore all of it again
+                run.forget_items()
         
-        # 3. pg_restore to Target
+        # 3. pg_restore to Target, section by section. In a single transaction the sections
+        # (and post-data, unless it is deferred) are restored by one pg_restore, so a failure
+        # anywhere rolls all of them back
         log_callback(f"PHASE:RESTORING|Starting restore to {target['host']}...")
+        together = [section for section in ['pre-data', 'data'] + ([] if deferred_indexes else ['post-data'])
+                    if not run.stage_done(section)] if extra else []
+        if together:
+            with timings.step('restore'):
+                if resume and 'pre-data' not in together:
+                    truncate_unfinished(target, toc, run, log_callback)
+                if 'data' in together:
+                    progress.start('restoring')
+                    for name in run.items("TABLE DATA "):
+                        progress.table_done(name)
+                restore_section(target, dump_file, jobs, together, env, job_log, run, toc, extra,
+                                progress if 'data' in together else None)
+                if 'data' in together:
+                    progress.finish()
+        if not run.stage_done('pre-data'):
+            with timings.step('restore pre-data'):
+                restore_section(target, dump_file, jobs, ['pre-data'], env, job_log, run, toc, extra)
+        
+        # Tables are created UNLOGGED so the data section writes no WAL, then set LOGGED.
+        # Not in a single transaction, which already loads the tables it creates without
+        # WAL when the target runs with wal_level=minimal
+        unlogged = fast_load and fast_load['unlogged'] and not schema_only and not extra
+        if unlogged and not run.stage_done('unlogged'):
+            with timings.step('set unlogged'):
+                tables = [name for name, kind, persistence in list_target_tables(target).values()
+                          if name in data_tables and kind == 'r' and persistence == 'p']
+                for name in set_tables_persistence(target, tables, 'UNLOGGED', workers, log_callback):
+                    run.mark(f"UNLOGGED {name}")
+                run.finish_stage('unlogged')
         
-        env_target = os.environ.copy()
-        env_target['PGPASSWORD'] = target['password']
+        if not run.stage_done('data'):
+            with timings.step('restore data'):
+                if resume:
+                    truncate_unfinished(target, toc, run, log_callback)
+                progress.start('restoring')
+                for name in run.items("TABLE DATA "):
+                    progress.table_done(name)
+                restore_section(target, dump_file, jobs, ['data'], env, job_log, run, toc, extra, progress)
+                progress.finish()
         
-        restore_cmd = [
-            'pg_restore',
-            '-v', # Verbose
-            '-h', target['host'],
-            '-p', target['port'],
-            '-U', target['user'],
-            '-d', target['dbname'],
-            dump_file
-        ]
+        if unlogged and not run.stage_done('logged'):
+            with timings.step('set logged'):
+                set_tables_persistence(target, run.items("UNLOGGED "), 'LOGGED', workers, log_callback)
+                run.finish_stage('logged')
         
-        run_command(restore_cmd, env_target, log_callback)
+        # 4. Post-data objects, built concurrently when deferred
+        if not run.stage_done('post-data'):
+            with timings.step('post-data'):
+                if deferred_indexes:
+                    build_post_data(target, dump_file, log_callback, index_workers, run)
+                    run.finish_stage('post-data')
+                else:
+                    restore_section(target, dump_file, jobs, ['post-data'], env, job_log, run, toc, extra)
         log_callback("Restore completed successfully.")
         
+        # 5. Fresh statistics for the loaded tables
+        if fast_load and fast_load['vacuum'] and not schema_only:
+            with timings.step('vacuum analyze'):
+                tables = [t for t in list_target_tables(target).values() if t[0] in data_tables]
+                vacuum_analyze(target, tables, workers, log_callback)
+        timings.report(fast_load)
+        
+        success = True
         return True, "Migration completed successfully!"
         
     except Exception as e:
         log_callback(f"ERROR: Migration Failed - {str(e)}")
         return False, str(e)
     finally:
-        if os.path.exists(dump_file):
+        with timings.step('cleanup'):
+            if artifact:
+                # Kept for the next migration of this source
+                artifacts.release(artifact)
+            if run and run.run_id:
+                if success:
+                    checkpoints.finish(run)
+                else:
+                    checkpoints.fail(run, log_callback)
+            elif not artifact and dump_file and os.path.exists(dump_file):
+                try:
+                    if os.path.isdir(dump_file):
+                        shutil.rmtree(dump_file)
+                    else:
+                        os.remove(dump_file)
+                    log_callback("Cleaned up temporary resources.")
+                except:
+                    pass
+
+def restore_section(target, dump_file, jobs, sections, env, log_callback, run, toc, extra=(), progress=None):
+    """pg_restore of sections, checkpointing each entry and skipping the ones run has already restored.
+
+    Checkpointed runs stop on the first error, so no failed entry is recorded as restored.
+    """
+    args = [f'--section={section}' for section in sections] + list(extra)
+    if run.run_id:
+        args.append('--exit-on-error')
+    list_file = None
+    if any(run.done(e['key']) for e in toc):
+        # pg_restore -L only restores the entries listed; ';' comments an entry out
+        with tempfile.NamedTemporaryFile('w', suffix='.list', delete=False) as f:
+            for entry in toc:
+                f.write(("; " if run.done(entry['key']) else "") + entry['line'] + "\n")
+            list_file = f.name
+        args += ['-L', list_file]
+
+    tracker = checkpoints.RestoreTracker(run, toc, jobs, atomic='--single-transaction' in extra)
+    callback = tracker.wrap(progress.wrap(log_callback) if progress else log_callback)
+    try:
+        run_command(build_restore_cmd(target, dump_file, jobs, args), env, callback, progress.tick if progress else None)
+    finally:
+        if list_file:
+            os.remove(list_file)
+    tracker.succeeded()
+    for section in sections:
+        run.finish_stage(section)
+
+def truncate_unfinished(target, toc, run, log_callback):
+    """Empties the tables whose data the failed attempt did not finish, before they are loaded again."""
+    tables = [qualified_name(e['schema'], e['tag']) for e in toc if e['desc'] == 'TABLE DATA' and not run.done(e['key'])]
+    if not tables:
+        return
+    log_callback(f"Truncating {len(tables)} tables whose data was not completely restored...")
+    with db_pool.connection(target) as conn:
+        conn.cursor().execute(f"TRUNCATE {', '.join(tables)};")
+
+def dump_source(source, dump_file, log_callback, schema_only, parallel, jobs, progress, job_log, snapshot=None, filters=None,
+                throttle=None):
+    """pg_dump into dump_file: directory format when parallel, else custom.
+
+    throttle (see throttling.normalize_throttle) caps the bytes pg_dump reads from the
+    source per second and pauses the dump while the source is overloaded.
+    """
+    mode_str = "Schema Only" if schema_only else "Full (Schema + Data)"
+    if filters:
+        mode_str += f", filtered: {' '.join(filter_args(filters))}"
+    if parallel:
+        mode_str += f", {jobs} parallel jobs"
+    log_callback(f"PHASE:DUMPING|Starting dump ({mode_str}) from {source['host']}...")
+
+    extra = artifacts.compression_args(artifacts.COMPRESSION, get_local_pg_dump_version(), log_callback)
+    if snapshot:
+        extra += ['--snapshot', snapshot]
+    dump_cmd = build_dump_cmd(source, 'd' if parallel else 'c', dump_file, schema_only, jobs, extra, filters)
+    progress.start('dumping', count_bytes=True)
+
+    def dump_tick():
+        # Dump bytes written so far (compressed) vs. pg_database_size
+        progress.set_bytes(path_size(dump_file))
+        progress.tick()
+
+    with dump_throttle(source, throttle, log_callback, progress) as limiter:
+        # Without /proc the cap falls back to the dump's (compressed) size on disk
+        run_command(dump_cmd, pg_env(source), progress.wrap(job_log), dump_tick, limiter, lambda: path_size(dump_file))
+    progress.set_bytes(path_size(dump_file))
+    progress.finish()
+    log_callback("Dump completed successfully.")
+
+def get_wal_lsn(conn_details):
+    """Current WAL position of a server (replay position on a standby)."""
+    with db_pool.connection(conn_details, connect_timeout=5) as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() ELSE pg_current_wal_lsn() END;
+        """)
+        return str(cur.fetchone()[0])
+
+def checkout_artifact(source, log_callback, schema_only, parallel, jobs, max_age, progress, job_log, filters=None, throttle=None):
+    """A verified cached dump of source at most max_age seconds old, dumping a new one if needed.
+
+    Returns the artifact, checked out: call artifacts.release() once the restore is done.
+    """
+    source_key = connection_key(source)
+    if filters:
+        # A filtered dump only stands in for the same selection
+        source_key += "?" + json.dumps(filters, sort_keys=True)
+    # Jobs restoring the same source wait here for one dump instead of each running their own
+    with artifacts.source_lock(source_key):
+        artifact = artifacts.find_fresh(source_key, schema_only, max_age)
+        if artifact:
+            if artifacts.FULL_CHECK:
+                log_callback(f"Verifying the checksum of cached dump #{artifact['id']}...")
+            if artifacts.intact(artifact):
+                age = time.time() - artifact['created_at']
+                log_callback(f"PHASE:DUMPING|Reusing cached dump #{artifact['id']} of {source['host']} "
+                             f"taken {age / 60:,.0f} min ago at LSN {artifact['lsn'] or 'unknown'}, skipping pg_dump.")
+                artifacts.checkout(artifact)
+                return artifact
+            log_callback(f"WARNING: Cached dump #{artifact['id']} changed since it was stored, discarding it.")
+            artifacts.remove_path(artifact['path'])
+            storage.delete_artifact(artifact['id'])
+
+        # Directory format for parallel, else custom; pg_restore reads both, also with -j
+        fmt = 'd' if parallel else 'c'
+        dump_file = artifacts.new_path(source_key)
+        if parallel:
+            os.makedirs(dump_file)
+        try:
+            lsn = get_wal_lsn(source)
+        except Exception as e:
+            log_callback(f"WARNING: Could not read source WAL position: {str(e)}")
+            lsn = None
+        created_at = time.time()
+        try:
+            dump_source(source, dump_file, log_callback, schema_only, parallel, jobs, progress, job_log, filters=filters,
+                        throttle=throttle)
+            artifact = artifacts.register(source_key, schema_only, fmt, artifacts.COMPRESSION or None, dump_file, lsn, created_at)
+        except Exception:
+            artifacts.remove_path(dump_file)
+            raise
+        artifacts.checkout(artifact)
+        log_callback(f"Stored dump as artifact #{artifact['id']} ({artifact['size_bytes'] / 1024 / 1024:,.0f} MB, LSN {lsn or 'unknown'}).")
+
+    artifacts.evict(log_callback)
+    return artifact
+
+def run_stream_migration(source, target, log_callback, schema_only=False, stream_format='custom',
+                         deferred_indexes=True, index_workers=None, snapshot=None, filters=None, fast_load=None,
+                         throttle=None):
+    """Streams pg_dump output straight into the target without a local dump file.
+
+    The target has to be dropped before the dump starts, since dump and restore
+    overlap. Custom format goes through pg_restore, plain format through psql.
+    With deferred indexes the stream carries pre-data and data only; post-data
+    definitions come from a small separate schema dump. fast_load works as in
+    run_dump_migration, except for UNLOGGED tables, which need separate passes.
+    throttle limits the load of the streaming pg_dump on the source.
+    """
+    if stream_format not in STREAM_FORMATS:
+        return False, f"Unknown stream format: {stream_format}"
+
+    progress = ProgressTracker(log_callback) if schema_only else start_progress(source, log_callback, filters)
+    sections = list(PRE_AND_DATA_SECTIONS) if deferred_indexes else []
+    if snapshot:
+        sections += ['--snapshot', snapshot]
+    post_data_file = None
+    timings = StepTimings(log_callback)
+
+    try:
+        # 1. Drop tables on Target (restore starts as soon as the first bytes arrive)
+        with timings.step('reset'):
+            reset_target(target, log_callback, filters)
+        existing = list_target_tables(target) if fast_load else None
+        if fast_load and fast_load['unlogged']:
+            log_callback("WARNING: UNLOGGED loading needs a dump file restored in passes, streaming into logged tables.")
+
+        # 2. pg_dump | pg_restore
+        mode_str = "Schema Only" if schema_only else "Full (Schema + Data)"
+        log_callback(f"PHASE:STREAMING|Streaming {stream_format} dump ({mode_str}) from {source['host']} to {target['host']}...")
+
+        dump_cmd = build_dump_cmd(source, 'p' if stream_format == 'plain' else 'c', schema_only=schema_only, extra=sections,
+                                  filters=filters)
+        restore_cmd = build_stream_restore_cmd(target, stream_format, single_transaction(fast_load, 1, log_callback))
+
+        with timings.step('stream'):
+            progress.start('streaming')
+            with dump_throttle(source, throttle, log_callback, progress) as limiter:
+                run_pipeline(dump_cmd, pg_env(source), restore_cmd, restore_env(target, fast_load), progress.wrap(log_callback),
+                             progress.tick, limiter)
+            progress.finish()
+        log_callback("Stream completed successfully.")
+
+        # 3. Post-data objects built concurrently
+        if deferred_indexes:
+            with timings.step('post-data'):
+                with tempfile.NamedTemporaryFile(suffix=".dump", delete=False) as tmp_file:
+                    post_data_file = tmp_file.name
+                dump_cmd = build_dump_cmd(source, 'c', post_data_file, extra=['--section=post-data'], filters=filters)
+                run_command(dump_cmd, pg_env(source), log_callback)
+                build_post_data(target, post_data_file, log_callback, index_workers)
+
+        # 4. Fresh statistics for the loaded tables
+        if fast_load and fast_load['vacuum'] and not schema_only:
+            with timings.step('vacuum analyze'):
+                vacuum_analyze(target, restored_tables(target, existing), index_workers or default_jobs(), log_callback)
+        timings.report(fast_load)
+
+        return True, "Migration completed successfully!"
+
+    except Exception as e:
+        log_callback(f"ERROR: Migration Failed - {str(e)}")
+        return False, str(e)
+    finally:
+        if post_data_file and os.path.exists(post_data_file):
+            try:
+                os.remove(post_data_file)
+            except:
+                pass
+
+# --- Deferred post-data phase ---
+
+# Session settings for index/constraint builds (override via environment)
+MAINTENANCE_WORK_MEM = os.environ.get('PGSHIFT_MAINTENANCE_WORK_MEM', '1GB')
+MAX_PARALLEL_MAINTENANCE_WORKERS = os.environ.get('PGSHIFT_MAX_PARALLEL_MAINTENANCE_WORKERS', '2')
+
+# Post-data objects built concurrently, wave by wave. Everything else runs serially afterwards.
+POST_DATA_WAVES = [
+    ('INDEX', 'CONSTRAINT'),            # Indexes, primary keys, unique/check/exclusion constraints
+    ('FK CONSTRAINT', 'INDEX ATTACH'),  # Need the unique indexes / partition indexes above
+]
+
+PRE_AND_DATA_SECTIONS = ['--section=pre-data', '--section=data']
+
+TOC_HEADER = re.compile(r"^-- (?:Data for )?Name: (.*?); Type: ([^;]+); Schema: ([^;]*);")
+
+def split_restore_script(sql):
+    """Splits a pg_restore/pg_dump SQL script into its session preamble and per-object items.
+
+    Objects are delimited by the "-- Name: ...; Type: ...; Schema: ..." TOC headers.
+    """
+    preamble = []
+    items = []
+    current = None
+    for line in sql.splitlines():
+        match = TOC_HEADER.match(line)
+        if match:
+            current = {'name': match.group(1), 'type': match.group(2), 'schema': match.group(3), 'lines': []}
+            items.append(current)
+        elif current is None:
+            if line and not line.startswith('--'):
+                preamble.append(line)
+        elif line != '--':
+            current['lines'].append(line)
+
+    for item in items:
+        item['sql'] = "\n".join(item.pop('lines'))
+    return "\n".join(preamble), [i for i in items if i['sql'].strip()]
+
+def extract_post_data(dump_file):
+    """Reads index, constraint and other post-data definitions from a dump's TOC."""
+    output = subprocess.check_output(
+        ['pg_restore', '--section=post-data', '-f', '-', dump_file],
+        text=True
+    )
+    return split_restore_script(output)
+
+def build_post_data(target, dump_file, log_callback, workers=None, run=None):
+    """Builds post-data objects concurrently over a bounded pool of target connections.
+
+    With a checkpoints.RestoreRun, objects it has already built are skipped and
+    each object built is checkpointed.
+    """
+    workers = workers or default_jobs()
+    preamble, items = extract_post_data(dump_file)
+    if run:
+        remaining = [i for i in items if not run.done(checkpoints.item_key(i['type'], i['schema'], i['name']))]
+        if len(remaining) < len(items):
+            log_callback(f"Skipping {len(items) - len(remaining)} post-data objects built by the previous attempt.")
+        items = remaining
+
+    log_callback(f"PHASE:INDEXING|Building {len(items)} indexes, constraints and other post-data objects with {workers} connections...")
+
+    connections = []
+    local = threading.local()
+    lock = threading.Lock()
+
+    def session():
+        if not hasattr(local, 'conn'):
+            conn = open_connection(target)
+            conn.autocommit = True
+            cur = conn.cursor()
+            if preamble:
+                cur.execute(preamble)
+            for name, value in (('maintenance_work_mem', MAINTENANCE_WORK_MEM),
+                                ('max_parallel_maintenance_workers', MAX_PARALLEL_MAINTENANCE_WORKERS)):
+                try:
+                    cur.execute(f"SET {name} = %s;", (value,))
+                except psycopg2.Error:
+                    pass  # Older servers lack some settings
+            local.conn = conn
+            with lock:
+                connections.append(conn)
+        return local.conn
+
+    def build(item):
+        started = time.time()
+        for attempt in range(3):
+            try:
+                cur = session().cursor()
+                # Tablespace SETs in a previous item must not leak into this one
+                cur.execute("SET default_tablespace = '';")
+                cur.execute(item['sql'])
+                return item, started, time.time() - started, None
+            except psycopg2.errors.DeadlockDetected as e:
+                # FKs lock both tables and can deadlock against each other; retry
+                error = e
+            except psycopg2.Error as e:
+                return item, started, time.time() - started, e
+        return item, started, time.time() - started, error
+
+    failures = []
+    done = 0
+
+    def report(item, started, elapsed, error):
+        label = f"{item['type']} {item['schema']}.{item['name']}" if item['schema'] != '-' else f"{item['type']} {item['name']}"
+        kind = tracing.object_kind(item['type'])
+        if kind:
+            name = f"{item['schema']}.{item['name']}" if item['schema'] != '-' else item['name']
+            tracing.emit(log_callback, name, kind, started, started + elapsed, error, type=item['type'])
+        if error:
+            failures.append(item)
+            log_callback(f"[{done}/{len(items)}] ERROR building {label}: {str(error).strip()}")
+        else:
+            if run:
+                run.mark(checkpoints.item_key(item['type'], item['schema'], item['name']))
+            log_callback(f"[{done}/{len(items)}] Built {label} in {elapsed:.1f}s")
+
+    try:
+        deferred = set()
+        for wave in POST_DATA_WAVES:
+            batch = [i for i in items if i['type'] in wave]
+            deferred.update(id(i) for i in batch)
+            if not batch:
+                continue
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+                for result in pool.map(build, batch):
+                    done += 1
+                    report(*result)
+
+        # Triggers, rules, comments, ACLs... in dump order on a single session
+        for item in items:
+            if id(item) not in deferred:
+                done += 1
+                report(*build(item))
+    finally:
+        for conn in connections:
             try:
-                os.remove(dump_file)
+                conn.close()
+            except Exception:
+                pass
+
+    if failures:
+        raise Exception(f"{len(failures)} post-data objects failed to build")
+    log_callback("Post-data phase completed successfully.")
+
+# --- Fast load profile ---
+
+# Session settings of the restore connections, passed via PGOPTIONS. Losing the
+# last commits in a server crash is harmless while the target is being rebuilt.
+FAST_LOAD_SETTINGS = {
+    'synchronous_commit': 'off',
+    'maintenance_work_mem': MAINTENANCE_WORK_MEM,
+}
+FAST_LOAD_DEFAULTS = {'unlogged': False, 'single_transaction': False, 'vacuum': True}
+
+def normalize_fast_load(fast_load):
+    """Fast load options with defaults filled in, or None when the profile is off.
+
+    fast_load is True for the defaults, or a dict overriding some of
+    {'unlogged', 'single_transaction', 'vacuum'}.
+    """
+    if not fast_load:
+        return None
+    options = dict(FAST_LOAD_DEFAULTS)
+    if isinstance(fast_load, dict):
+        options.update(fast_load)
+    return options
+
+def restore_env(target, fast_load):
+    """pg_env() for the restore side, with the fast load session settings in PGOPTIONS."""
+    env = pg_env(target)
+    if fast_load:
+        settings = " ".join(f"-c {name}={value}" for name, value in FAST_LOAD_SETTINGS.items())
+        env['PGOPTIONS'] = f"{env.get('PGOPTIONS', '')} {settings}".strip()
+    return env
+
+def single_transaction(fast_load, jobs, log_callback):
+    """Whether the restore runs in one transaction. pg_restore can't combine it with -j."""
+    if not (fast_load and fast_load['single_transaction']):
+        return False
+    if jobs > 1:
+        log_callback("WARNING: --single-transaction can't be combined with parallel restore jobs, restoring without it.")
+        return False
+    return True
+
+class StepTimings:
+    """Wall time of each migration step, summarized in the log at the end of a run.
+
+    Each step is also reported as a tracing span.
+    """
+
+    def __init__(self, log_callback):
+        self.log_callback = log_callback
+        self.steps = []
+
+    @contextlib.contextmanager
+    def step(self, name):
+        started = time.time()
+        try:
+            with tracing.span(self.log_callback, name):
+                yield
+        finally:
+            self.steps.append((name, time.time() - started))
+
+    def report(self, fast_load):
+        total = sum(elapsed for _, elapsed in self.steps)
+        steps = ", ".join(f"{name} {elapsed:.1f}s" for name, elapsed in self.steps)
+        self.log_callback(f"Step timings (fast load {'on' if fast_load else 'off'}): {steps}; total {total:.1f}s.")
+
+def list_target_tables(target):
+    """oid -> (qualified name, relkind, relpersistence) of the user tables and materialized views on the target."""
+    with db_pool.connection(target) as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT c.oid, n.nspname, c.relname, c.relkind, c.relpersistence
+            FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE c.relkind IN ('r', 'p', 'm')
+              AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+              AND n.nspname NOT LIKE 'pg_toast%' AND n.nspname NOT LIKE 'pg_temp%'
+              AND NOT EXISTS (SELECT 1 FROM pg_depend d WHERE d.objid = c.oid AND d.deptype = 'e');
+        """)
+        return {oid: (qualified_name(schema, name), kind, persistence) for oid, schema, name, kind, persistence in cur.fetchall()}
+
+def restored_tables(target, before):
+    """Tables created on the target since the list_target_tables() snapshot before."""
+    return [t for oid, t in list_target_tables(target).items() if oid not in before]
+
+def run_parallel_statements(target, statements, workers, log_callback):
+    """Runs independent statements (VACUUM, ALTER TABLE) over up to workers autocommit connections.
+
+    Returns the statements that succeeded; failures are logged as warnings.
+    """
+    local = threading.local()
+    connections = []
+    lock = threading.Lock()
+
+    def execute(sql):
+        try:
+            if not hasattr(local, 'conn'):
+                conn = open_connection(target)
+                conn.autocommit = True
+                conn.cursor().execute("SET maintenance_work_mem = %s;", (MAINTENANCE_WORK_MEM,))
+                local.conn = conn
+                with lock:
+                    connections.append(conn)
+            local.conn.cursor().execute(sql)
+            return sql, None
+        except psycopg2.Error as e:
+            return sql, e
+
+    succeeded = []
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for sql, error in pool.map(execute, statements):
+                if error:
+                    log_callback(f"WARNING: {sql} failed: {str(error).strip()}")
+                else:
+                    succeeded.append(sql)
+    finally:
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+    return succeeded
+
+def set_tables_persistence(target, tables, persistence, workers, log_callback):
+    """ALTER TABLE ... SET LOGGED/UNLOGGED on the given table names. Returns the tables changed."""
+    log_callback(f"Setting {len(tables)} tables {persistence} with {workers} connections...")
+    started = time.time()
+    statements = {f"ALTER TABLE {name} SET {persistence};": name for name in tables}
+    changed = [statements[sql] for sql in run_parallel_statements(target, list(statements), workers, log_callback)]
+    log_callback(f"Set {len(changed)} tables {persistence} in {time.time() - started:.1f}s.")
+    return changed
+
+def vacuum_analyze(target, tables, workers, log_callback):
+    """VACUUM (ANALYZE) of freshly loaded tables in parallel: fresh statistics and visibility map before the first query."""
+    log_callback(f"PHASE:ANALYZING|Running VACUUM ANALYZE on {len(tables)} tables with {workers} connections...")
+    started = time.time()
+    # Partitioned parents only have statistics, their partitions are vacuumed on their own
+    statements = [f"ANALYZE {name};" if kind == 'p' else f"VACUUM (ANALYZE) {name};" for name, kind, _ in tables]
+    done = run_parallel_statements(target, statements, workers, log_callback)
+    log_callback(f"VACUUM ANALYZE of {len(done)} tables completed in {time.time() - started:.1f}s.")
+
+# --- Post-restore analyze and verification ---
+
+# estimate: reltuples after ANALYZE (sampled), count: exact count(*), checksum: count(*) and a hash over all rows
+VERIFY_LEVELS = ['estimate', 'count', 'checksum']
+# Estimates come from ANALYZE samples: differences up to this share (or VERIFY_ESTIMATE_SLACK rows) are not reported
+VERIFY_ESTIMATE_TOLERANCE = 0.1
+VERIFY_ESTIMATE_SLACK = 1000
+# Same text output on both servers, so the row hashes of equal rows are equal
+# (also used by the incremental mode's bucket checksums)
+VERIFY_SESSION_SETTINGS = {
+    'TimeZone': 'UTC',
+    'DateStyle': 'ISO, YMD',
+    'IntervalStyle': 'postgres',
+    'extra_float_digits': '3',
+    'bytea_output': 'hex',
+}
+
+def set_hash_settings(cur):
+    """Applies VERIFY_SESSION_SETTINGS to the session of cur."""
+    for name, value in VERIFY_SESSION_SETTINGS.items():
+        cur.execute(f"SET {name} = %s;", (value,))
+
+def list_verify_tables(cur, filters=None):
+    """(schema, name) -> (relkind, reltuples) of the user tables that a run with filters migrates."""
+    cur.execute("""
+        SELECT n.nspname, c.relname, c.relkind, c.reltuples, pg_table_is_visible(c.oid)
+        FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relkind IN ('r', 'p', 'm')
+          AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+          AND n.nspname NOT LIKE 'pg_toast%' AND n.nspname NOT LIKE 'pg_temp%'
+          AND NOT EXISTS (SELECT 1 FROM pg_depend d WHERE d.objid = c.oid AND d.deptype = 'e');
+    """)
+    return {(schema, name): (kind, reltuples) for schema, name, kind, reltuples, visible in cur.fetchall()
+            if table_selected(filters, schema, name, visible)}
+
+def table_fingerprint(cur, table, level):
+    """(row count, checksum or None) of one (schema, name) table; the checksum only at level 'checksum'."""
+    name = qualified_name(*table)
+    if level == 'checksum':
+        cur.execute(f"SELECT count(*), coalesce(sum({ROW_HASH}), 0) FROM {name} r;")
+        count, checksum = cur.fetchone()
+        return count, str(checksum)
+    cur.execute(f"SELECT count(*) FROM {name};")
+    return cur.fetchone()[0], None
+
+def estimates_differ(source_rows, target_rows):
+    diff = abs(source_rows - target_rows)
+    return diff > VERIFY_ESTIMATE_SLACK and diff > VERIFY_ESTIMATE_TOLERANCE * max(source_rows, target_rows)
+
+def verify_migration(source, target, log_callback, level='estimate', workers=None, filters=None, analyze=True):
+    """ANALYZE of the migrated tables on the target, then a source/target comparison of each table.
+
+    Returns the report that is also logged as a VERIFY: record:
+    {'level', 'tables', 'matched', 'mismatches': [...], 'missing': [...], 'errors': [...]}.
+    Writes on the source after the dump show up as mismatches.
+    """
+    if level not in VERIFY_LEVELS:
+        raise Exception(f"Unknown verification level '{level}', use one of {', '.join(VERIFY_LEVELS)}")
+    workers = workers or default_jobs()
+
+    with db_pool.connection(source) as conn:
+        source_tables = list_verify_tables(conn.cursor(), filters)
+    with db_pool.connection(target) as conn:
+        target_tables = list_verify_tables(conn.cursor(), filters)
+
+    # 1. Planner statistics for every migrated table
+    if analyze:
+        log_callback(f"PHASE:ANALYZING|Running ANALYZE on {len(target_tables)} tables with {workers} connections...")
+        started = time.time()
+        statements = [f"ANALYZE {qualified_name(*t)};" for t in sorted(target_tables) if t in source_tables]
+        done = run_parallel_statements(target, statements, workers, log_callback)
+        log_callback(f"ANALYZE of {len(done)} tables completed in {time.time() - started:.1f}s.")
+        with db_pool.connection(target) as conn:
+            target_tables = list_verify_tables(conn.cursor(), filters)
+
+    # 2. Compare table by table; partitioned parents are covered by their partitions
+    log_callback(f"PHASE:VERIFYING|Comparing {level} of {len(source_tables)} tables between source and target...")
+    started = time.time()
+    tables = sorted(t for t, (kind, _) in source_tables.items() if kind != 'p')
+    missing = [t for t in tables if t not in target_tables]
+    report = {'level': level, 'tables': len(tables), 'matched': 0, 'mismatches': [],
+              'missing': [f"{s}.{n}" for s, n in missing], 'errors': []}
+
+    # (table, estimated, (source rows, checksum), (target rows, checksum))
+    exact, compared = [], []
+    for t in tables:
+        if t in missing:
+            continue
+        source_rows, target_rows = source_tables[t][1], target_tables[t][1]
+        if level == 'estimate' and source_rows >= 0 and target_rows >= 0:
+            compared.append((t, True, (int(source_rows), None), (int(target_rows), None)))
+        else:
+            # reltuples is -1 until a table has been analyzed; those are counted exactly
+            exact.append(t)
+
+    local = threading.local()
+    connections = []
+    lock = threading.Lock()
+
+    def worker_connections():
+        if not hasattr(local, 'pair'):
+            pair = []
+            for details in (source, target):
+                conn = open_connection(details)
+                conn.set_session(readonly=True, autocommit=True)
+                set_hash_settings(conn.cursor())
+                pair.append(conn)
+            local.pair = pair
+            with lock:
+                connections.extend(pair)
+        return local.pair
+
+    def fingerprint(table):
+        try:
+            src, tgt = worker_connections()
+            return (table, table_fingerprint(src.cursor(), table, level),
+                    table_fingerprint(tgt.cursor(), table, level), None)
+        except psycopg2.Error as e:
+            return table, None, None, e
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            for table, source_print, target_print, error in pool.map(fingerprint, exact):
+                if error:
+                    report['errors'].append({'table': f"{table[0]}.{table[1]}", 'error': str(error).strip()})
+                else:
+                    compared.append((table, False, source_print, target_print))
+    finally:
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    for table, estimated, (source_rows, source_checksum), (target_rows, target_checksum) in compared:
+        label = f"{table[0]}.{table[1]}"
+        if estimated:
+            differs = estimates_differ(source_rows, target_rows)
+        else:
+            differs = source_rows != target_rows or source_checksum != target_checksum
+        if not differs:
+            report['matched'] += 1
+            continue
+        report['mismatches'].append({
+            'table': label,
+            'source_rows': source_rows,
+            'target_rows': target_rows,
+            'checksum_differs': source_checksum != target_checksum,
+        })
+        log_callback(f"MISMATCH {label}: {source_rows:,} rows on source, {target_rows:,} on target"
+                     f"{' (checksums differ)' if source_checksum != target_checksum else ''}")
+    for label in report['missing']:
+        log_callback(f"MISMATCH {label}: missing on target")
+    for error in report['errors']:
+        log_callback(f"WARNING: Could not verify {error['table']}: {error['error']}")
+
+    report['mismatches'].sort(key=lambda m: m['table'])
+    log_callback(f"Verified {report['tables']} tables in {time.time() - started:.1f}s: {report['matched']} match, "
+                 f"{len(report['mismatches'])} differ, {len(report['missing'])} missing.")
+    log_callback("VERIFY:" + json.dumps(report))
+    return report
+
+# --- Native COPY engine ---
+
+# Tables bigger than this (on disk) are split into primary-key range chunks
+COPY_CHUNK_BYTES = 1024 * 1024 * 1024
+COPY_MAX_CHUNKS = 64
+
+def open_connection(conn_details, **kwargs):
+    """Opens a new psycopg2 connection from connection details."""
+    # Named, so the throttle can tell the migration's own sessions from the source's workload
+    kwargs.setdefault('application_name', 'pgshift')
+    return psycopg2.connect(
+        host=conn_details['host'],
+        port=conn_details['port'],
+        dbname=conn_details['dbname'],
+        user=conn_details['user'],
+        password=conn_details['password'],
+        **kwargs
+    )
+
+def quote_ident(name):
+    """Quotes an SQL identifier."""
+    return '"' + name.replace('"', '""') + '"'
+
+def qualified_name(schema, table):
+    return f"{quote_ident(schema)}.{quote_ident(table)}"
+
+def list_copy_tables(cur, filters=None):
+    """Returns user tables with size, copyable columns and single-column integer primary key (if any).
+
+    With filters, only the tables pg_dump would select.
+    """
+    cur.execute("""
+        SELECT n.nspname, c.relname, pg_relation_size(c.oid), c.reltuples::bigint, pk.attname, pg_table_is_visible(c.oid)
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        LEFT JOIN LATERAL (
+            SELECT a.attname
+            FROM pg_index i
+            JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+            WHERE i.indrelid = c.oid AND i.indisprimary AND i.indnatts = 1
+              AND a.atttypid IN ('int2'::regtype, 'int4'::regtype, 'int8'::regtype)
+        ) pk ON true
+        WHERE c.relkind = 'r'
+          AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+          AND n.nspname NOT LIKE 'pg_toast%'
+          AND n.nspname NOT LIKE 'pg_temp%'
+          AND NOT EXISTS (SELECT 1 FROM pg_depend d WHERE d.objid = c.oid AND d.deptype = 'e')
+        ORDER BY 3 DESC;
+    """)
+    tables = [
+        {'schema': r[0], 'name': r[1], 'bytes': r[2], 'rows': max(r[3], 0), 'pk': r[4], 'columns': []}
+        for r in cur.fetchall() if table_selected(filters, r[0], r[1], r[5])
+    ]
+
+    # Generated columns can't be copied into, so use explicit column lists
+    cur.execute("""
+        SELECT table_schema, table_name, column_name
+        FROM information_schema.columns
+        WHERE is_generated = 'NEVER'
+        ORDER BY table_schema, table_name, ordinal_position;
+    """)
+    by_name = {(t['schema'], t['name']): t for t in tables}
+    for schema, table, column in cur.fetchall():
+        if (schema, table) in by_name:
+            by_name[(schema, table)]['columns'].append(column)
+    return tables
+
+def plan_copy_tasks(cur, tables, jobs):
+    """Splits tables into COPY tasks, chunking large tables by primary-key range."""
+    tasks = []
+    for t in tables:
+        ranges = [None]
+        chunks = min(COPY_MAX_CHUNKS, max(jobs, 1) * 4, t['bytes'] // COPY_CHUNK_BYTES + 1)
+        if t['pk'] and chunks > 1:
+            pk = quote_ident(t['pk'])
+            cur.execute(f"SELECT min({pk}), max({pk}) FROM {qualified_name(t['schema'], t['name'])};")
+            lo, hi = cur.fetchone()
+            if lo is not None and hi > lo:
+                step = (hi - lo) // chunks + 1
+                ranges = [(start, min(start + step, hi + 1)) for start in range(lo, hi + 1, step)]
+        for i, pk_range in enumerate(ranges):
+            tasks.append({'table': t, 'range': pk_range, 'chunk': i + 1, 'chunks': len(ranges)})
+    return tasks
+
+def copy_table_data(src_conn, tgt_conn, task, limiter=None):
+    """Streams one COPY task from source to target through an OS pipe. Returns rows copied.
+
+    limiter (a throttling.Throttle) paces the data read from the source.
+    """
+    t = task['table']
+    name = qualified_name(t['schema'], t['name'])
+    columns = ", ".join(quote_ident(c) for c in t['columns'])
+
+    if task['range']:
+        pk = quote_ident(t['pk'])
+        lo, hi = task['range']
+        copy_out = f"COPY (SELECT {columns} FROM {name} WHERE {pk} >= {int(lo)} AND {pk} < {int(hi)}) TO STDOUT"
+    else:
+        copy_out = f"COPY {name} ({columns}) TO STDOUT"
+    copy_in = f"COPY {name} ({columns}) FROM STDIN"
+
+    read_fd, write_fd = os.pipe()
+    reader = os.fdopen(read_fd, 'rb', buffering=PIPE_BUFFER_SIZE)
+    writer = os.fdopen(write_fd, 'wb', buffering=PIPE_BUFFER_SIZE)
+    errors = []
+
+    def produce():
+        try:
+            src_conn.cursor().copy_expert(copy_out, throttling.ThrottledWriter(writer, limiter) if limiter else writer)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            try:
+                writer.close()
+            except OSError:
+                pass
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        cur = tgt_conn.cursor()
+        cur.copy_expert(copy_in, reader)
+        rows = cur.rowcount
+    except Exception:
+        # Closing the read end makes the producer fail with a broken pipe
+        reader.close()
+        src_conn.cancel()
+        producer.join()
+        tgt_conn.rollback()
+        raise
+    reader.close()
+    producer.join()
+
+    # A failed source leaves a truncated stream; never commit that
+    if errors:
+        tgt_conn.rollback()
+        raise errors[0]
+    tgt_conn.commit()
+    return rows
+
+def copy_sequences(src_cur, tgt_cur, filters=None):
+    """Copies sequence values, which a schema-only dump does not carry.
+
+    Only sequences that exist on the target; with filters, only those pg_dump
+    selects (by name, or through the table owning them).
+    """
+    src_cur.execute("""
+        SELECT n.nspname, s.relname, seq.last_value, pg_table_is_visible(s.oid),
+               tn.nspname, t.relname, pg_table_is_visible(t.oid)
+        FROM pg_sequences seq
+        JOIN pg_namespace n ON n.nspname = seq.schemaname
+        JOIN pg_class s ON s.relnamespace = n.oid AND s.relname = seq.sequencename
+        LEFT JOIN pg_depend d ON d.classid = 'pg_class'::regclass AND d.objid = s.oid
+            AND d.refclassid = 'pg_class'::regclass AND d.deptype IN ('a', 'i')
+        LEFT JOIN pg_class t ON t.oid = d.refobjid
+        LEFT JOIN pg_namespace tn ON tn.oid = t.relnamespace
+        WHERE seq.last_value IS NOT NULL;
+    """)
+    sequences = [
+        (schema, name, value) for schema, name, value, visible, t_schema, t_name, t_visible in src_cur.fetchall()
+        if not filters or table_selected(filters, schema, name, visible)
+        or (t_name and table_selected(filters, t_schema, t_name, t_visible))
+    ]
+    tgt_cur.execute("SELECT schemaname, sequencename FROM pg_sequences;")
+    existing = set(tgt_cur.fetchall())
+    sequences = [seq for seq in sequences if seq[:2] in existing]
+    for schema, name, value in sequences:
+        tgt_cur.execute("SELECT setval(%s, %s, true);", (qualified_name(schema, name), value))
+    return len(sequences)
+
+def run_copy_migration(source, target, log_callback, jobs=None, index_workers=None, filters=None, throttle=None):
+    """Schema via pg_dump -s, data via parallel COPY streams between the two servers.
+
+    throttle caps the bytes per second read by all COPY streams together.
+    """
+    jobs = jobs or default_jobs()
+
+    with tempfile.NamedTemporaryFile(suffix=".dump", delete=False) as tmp_file:
+        schema_file = tmp_file.name
+
+    coordinator = None
+    connections = []
+    local = threading.local()
+    lock = threading.Lock()
+
+    def worker_connections(snapshot):
+        # One source/target connection pair per worker thread, reused across tasks
+        if not hasattr(local, 'pair'):
+            src = open_connection(source)
+            src.set_session(isolation_level='REPEATABLE READ', readonly=True)
+            src.cursor().execute("SET TRANSACTION SNAPSHOT %s;", (snapshot,))
+            tgt = open_connection(target)
+            local.pair = (src, tgt)
+            with lock:
+                connections.extend(local.pair)
+        return local.pair
+
+    try:
+        # 1. Consistent snapshot shared by the schema dump and all COPY workers
+        coordinator = open_connection(source)
+        coordinator.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        cur = coordinator.cursor()
+        cur.execute("SELECT pg_export_snapshot();")
+        snapshot = cur.fetchone()[0]
+
+        log_callback(f"PHASE:DUMPING|Dumping schema from {source['host']}...")
+        dump_cmd = build_dump_cmd(source, 'c', schema_file, schema_only=True, extra=['--snapshot', snapshot], filters=filters)
+        run_command(dump_cmd, pg_env(source), log_callback)
+        log_callback("Schema dump completed successfully.")
+
+        # 2. Drop tables on Target
+        reset_target(target, log_callback, filters)
+
+        # 3. Tables, types, functions... everything but indexes and constraints
+        log_callback(f"PHASE:RESTORING|Creating schema on {target['host']}...")
+        restore_cmd = build_restore_cmd(target, schema_file, extra=['--section=pre-data'])
+        run_command(restore_cmd, pg_env(target), log_callback)
+
+        # 4. Parallel COPY
+        tables = list_copy_tables(cur, filters)
+        tasks = plan_copy_tasks(cur, tables, jobs)
+        log_callback(f"PHASE:COPYING|Copying {len(tables)} tables as {len(tasks)} streams with {jobs} workers...")
+        progress = ProgressTracker(log_callback, tables)
+        progress.start('copying')
+        chunks_left = {}
+        for task in tasks:
+            key = f"{task['table']['schema']}.{task['table']['name']}"
+            chunks_left[key] = chunks_left.get(key, 0) + 1
+
+        def run_task(task):
+            src, tgt = worker_connections(snapshot)
+            started = time.time()
+            rows = copy_table_data(src, tgt, task, limiter)
+            return task, rows, started, time.time() - started
+
+        total_rows = 0
+        with dump_throttle(source, throttle, log_callback, progress) as limiter, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(run_task, task) for task in tasks]
+            try:
+                done = 0
+                pending = set(futures)
+                while pending:
+                    # Wake up at least once per second so progress keeps flowing during huge tables
+                    finished, pending = concurrent.futures.wait(pending, timeout=1, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in finished:
+                        done += 1
+                        task, rows, started, elapsed = future.result()
+                        total_rows += rows
+                        t = task['table']
+                        chunk = f" [chunk {task['chunk']}/{task['chunks']}]" if task['chunks'] > 1 else ""
+                        log_callback(f"[{done}/{len(tasks)}] Copied {t['schema']}.{t['name']}{chunk}: {rows:,} rows in {elapsed:.1f}s")
+                        tracing.emit(log_callback, f"{t['schema']}.{t['name']}{chunk}", 'table data', started, started + elapsed, rows=rows)
+
+                        # Exact row counts from COPY
+                        key = f"{t['schema']}.{t['name']}"
+                        progress.add_rows(rows)
+                        chunks_left[key] -= 1
+                        if not chunks_left[key]:
+                            progress.table_done(key, rows=0)
+                    progress.tick()
+            except Exception:
+                for f in futures:
+                    f.cancel()
+                raise
+        progress.finish()
+        log_callback(f"Data copy completed: {total_rows:,} rows.")
+
+        with db_pool.connection(target) as tgt_conn:
+            seq_count = copy_sequences(cur, tgt_conn.cursor(), filters)
+        log_callback(f"Synchronized {seq_count} sequences.")
+
+        # 5. Indexes, constraints, triggers
+        build_post_data(target, schema_file, log_callback, index_workers)
+        log_callback("Restore completed successfully.")
+
+        return True, "Migration completed successfully!"
+
+    except Exception as e:
+        log_callback(f"ERROR: Migration Failed - {str(e)}")
+        return False, str(e)
+    finally:
+        for conn in connections + ([coordinator] if coordinator else []):
+            try:
+                conn.close()
+            except Exception:
+                pass
+        if os.path.exists(schema_file):
+            try:
+                os.remove(schema_file)
                 log_callback("Cleaned up temporary resources.")
             except:
                 pass
 
-def test_connection(conn_details):
-    """Tests connection and returns Postgres version string."""
+# --- Incremental re-sync ---
+
+# Width of the primary-key buckets compared between source and target
+INCREMENTAL_BUCKET_KEYS = 100000
+
+# Order-independent row checksum term: sum() of it over a table or key range
+ROW_HASH = "('x' || substr(md5(ROW(r.*)::text), 1, 16))::bit(64)::bigint"
+
+def connection_key(conn_details):
+    """Stable identity of a database, without the password."""
+    return f"{conn_details['user']}@{conn_details['host']}:{conn_details['port']}/{conn_details['dbname']}"
+
+def table_change_counters(cur):
+    """(cumulative insert/update/delete counter, live rows) per table from pg_stat_user_tables.
+
+    TRUNCATE does not move the counter but sets the live rows to 0, so both are compared.
+    """
+    cur.execute("SELECT schemaname, relname, n_tup_ins + n_tup_upd + n_tup_del, n_live_tup FROM pg_stat_user_tables;")
+    return {f"{r[0]}.{r[1]}": (r[2], r[3]) for r in cur.fetchall()}
+
+def stats_reset_time(cur):
+    """When the statistics counters of the current database were last reset (pg_stat_reset), as text."""
+    cur.execute("SELECT stats_reset FROM pg_stat_database WHERE datname = current_database();")
+    row = cur.fetchone()
+    return str(row[0]) if row else None
+
+def unchanged_since_sync(mark, source, target, stats_reset, source_in_recovery=False):
+    """Whether a table can be skipped: neither side changed since the watermark, and no counters were reset.
+
+    source and target are (change counter, live rows) from table_change_counters.
+    Tables re-copied in the last run have no target counters yet (stats are flushed
+    asynchronously), so they are compared once more before they can be skipped.
+    A standby's counters do not move for replayed changes, so on a standby source
+    every table is compared.
+    """
+    if source_in_recovery or mark is None or source is None or target is None or mark['target_counter'] is None:
+        return False
+    return (mark['stats_reset'] == stats_reset
+            and (mark['change_counter'], mark['live_tuples']) == tuple(source)
+            and (mark['target_counter'], mark['target_live_tuples']) == tuple(target))
+
+def set_replica_role(conn):
+    """Turns off FK and user triggers for the session, so re-copied buckets do not cascade into other tables."""
+    try:
+        conn.cursor().execute("SET session_replication_role = replica;")
+        conn.commit()
+    except psycopg2.Error as e:
+        conn.rollback()
+        raise Exception("Incremental sync needs to set session_replication_role = replica on the target "
+                        f"(superuser, or SET privilege on it in PostgreSQL 15+): {str(e).strip()}")
+
+def bucket_checksums(cur, table):
+    """Row count and order-independent checksum per primary-key bucket (one bucket without a usable key)."""
+    name = qualified_name(table['schema'], table['name'])
+    if table['pk']:
+        # floor() so negative keys land in the same buckets sync_table deletes
+        bucket = f"floor(r.{quote_ident(table['pk'])}::numeric / {INCREMENTAL_BUCKET_KEYS})::bigint"
+    else:
+        bucket = "0"
+    cur.execute(f"SELECT {bucket}, count(*), sum({ROW_HASH}) FROM {name} r GROUP BY 1;")
+    return {r[0]: (r[1], r[2]) for r in cur.fetchall()}
+
+def sync_table(src_conn, tgt_conn, table):
+    """Re-copies the buckets of one table that differ between source and target. Returns (buckets, rows) copied."""
+    src_sums = bucket_checksums(src_conn.cursor(), table)
+    tgt_sums = bucket_checksums(tgt_conn.cursor(), table)
+    tgt_conn.rollback()
+
+    name = qualified_name(table['schema'], table['name'])
+    changed = [b for b in set(src_sums) | set(tgt_sums) if src_sums.get(b) != tgt_sums.get(b)]
+    rows = 0
+    for b in sorted(changed):
+        cur = tgt_conn.cursor()
+        if table['pk']:
+            pk = quote_ident(table['pk'])
+            lo, hi = b * INCREMENTAL_BUCKET_KEYS, (b + 1) * INCREMENTAL_BUCKET_KEYS
+            cur.execute(f"DELETE FROM {name} WHERE {pk} >= %s AND {pk} < %s;", (lo, hi))
+            task = {'table': table, 'range': (lo, hi)}
+        else:
+            cur.execute(f"DELETE FROM {name};")
+            task = {'table': table, 'range': None}
+        # Delete and re-copy commit together
+        if b in src_sums:
+            rows += copy_table_data(src_conn, tgt_conn, task)
+        else:
+            tgt_conn.commit()
+    return len(changed), rows, sum(count for count, _ in src_sums.values())
+
+def run_incremental_migration(source, target, log_callback, jobs=None, filters=None):
+    """Re-syncs only what changed since the last run instead of dropping and reloading everything.
+
+    Tables whose source and target change counters both match the stored watermark
+    are skipped. The rest are compared bucket by bucket (primary-key ranges) via
+    row counts and checksums, and only differing buckets are deleted and re-copied.
+    Target sessions run with session_replication_role = replica, so deleting a
+    bucket fires no ON DELETE CASCADE and no FK check; the run fails without it.
+    """
+    jobs = jobs or default_jobs()
+    source_key, target_key = connection_key(source), connection_key(target)
+    watermarks = storage.get_sync_watermarks(source_key, target_key)
+
+    connections = []
+    local = threading.local()
+    lock = threading.Lock()
+
+    def worker_connections():
+        if not hasattr(local, 'pair'):
+            src = open_connection(source)
+            src.set_session(readonly=True, autocommit=True)
+            set_hash_settings(src.cursor())
+            tgt = open_connection(target)
+            set_hash_settings(tgt.cursor())
+            set_replica_role(tgt)
+            local.pair = (src, tgt)
+            with lock:
+                connections.extend(local.pair)
+        return local.pair
+
     try:
-        conn = psycopg2.connect(
-            host=conn_details['host'],
-            port=conn_details['port'],
-            dbname=conn_details['dbname'],
-            user=conn_details['user'],
-            password=conn_details['password'],
-            connect_timeout=5
+        log_callback(f"PHASE:COMPARING|Comparing tables between {source['host']} and {target['host']}...")
+        src_conn = open_connection(source)
+        connections.append(src_conn)
+        cur = src_conn.cursor()
+        tables = list_copy_tables(cur, filters)
+        counters = table_change_counters(cur)
+        cur.execute("SELECT pg_is_in_recovery();")
+        in_recovery = cur.fetchone()[0]
+        if in_recovery:
+            log_callback("Source is a standby, whose change counters miss replayed changes: comparing every table.")
+
+        tgt_conn = open_connection(target)
+        connections.append(tgt_conn)
+        # Fail before comparing anything if buckets can't be replaced safely
+        set_replica_role(tgt_conn)
+        tgt_cur = tgt_conn.cursor()
+        tgt_tables = {f"{t['schema']}.{t['name']}" for t in list_copy_tables(tgt_cur)}
+        tgt_counters = table_change_counters(tgt_cur)
+        stats_reset = f"{stats_reset_time(cur)}|{stats_reset_time(tgt_cur)}"
+        tgt_conn.commit()
+
+        pending, missing = [], []
+        for t in tables:
+            key = f"{t['schema']}.{t['name']}"
+            if key not in tgt_tables:
+                missing.append(key)
+            elif unchanged_since_sync(watermarks.get(key), counters.get(key), tgt_counters.get(key), stats_reset, in_recovery):
+                # Stats are flushed asynchronously; a change missed here shows up on the next run
+                continue
+            else:
+                pending.append(t)
+
+        for key in missing:
+            log_callback(f"WARNING: {key} does not exist on target, run a full migration first.")
+        log_callback(f"{len(tables) - len(pending) - len(missing)} tables unchanged since last sync, {len(pending)} to compare.")
+
+        log_callback(f"PHASE:SYNCING|Re-syncing changed ranges with {jobs} workers...")
+
+        def run_task(table):
+            src, tgt = worker_connections()
+            started = time.time()
+            buckets, rows, total = sync_table(src, tgt, table)
+            return table, buckets, rows, total, time.time() - started
+
+        total_rows = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(run_task, t) for t in pending]
+            try:
+                for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                    t, buckets, rows, total, elapsed = future.result()
+                    key = f"{t['schema']}.{t['name']}"
+                    total_rows += rows
+                    # The target counters only stand for the synced state if this run wrote nothing
+                    changes, live = counters.get(key, (0, None))
+                    target_changes, target_live = (None, None) if buckets else tgt_counters.get(key, (None, None))
+                    storage.save_sync_watermark(source_key, target_key, key, changes, total, time.time(),
+                                                target_changes, stats_reset, live, target_live)
+                    tracing.emit(log_callback, key, 'table data', time.time() - elapsed, rows=rows, ranges=buckets)
+                    if buckets:
+                        log_callback(f"[{done}/{len(pending)}] {key}: re-copied {buckets} ranges, {rows:,} rows in {elapsed:.1f}s")
+                    else:
+                        log_callback(f"[{done}/{len(pending)}] {key}: in sync ({elapsed:.1f}s)")
+            except Exception:
+                for f in futures:
+                    f.cancel()
+                raise
+
+        seq_count = copy_sequences(cur, tgt_conn.cursor(), filters)
+        tgt_conn.commit()
+        log_callback(f"Synchronized {seq_count} sequences.")
+
+        if missing:
+            return False, f"Incremental sync finished, but {len(missing)} tables are missing on target."
+        log_callback(f"Incremental sync completed: {total_rows:,} rows re-copied.")
+        return True, "Migration completed successfully!"
+
+    except Exception as e:
+        log_callback(f"ERROR: Migration Failed - {str(e)}")
+        return False, str(e)
+    finally:
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+# --- Logical replication cutover ---
+
+# Replication lag (bytes) under which the cutover is offered
+CUTOVER_LAG_BYTES = 1024 * 1024
+
+def replication_names(target):
+    """Publication/slot/subscription name, unique per target database."""
+    return "pgshift_" + hashlib.md5(connection_key(target).encode()).hexdigest()[:12]
+
+def create_replication_slot(source, target, log_callback):
+    """Creates the publication and a logical slot on the source.
+
+    Returns the replication connection (keep it open until pg_dump has started,
+    the exported snapshot dies with it) and the snapshot name.
+    """
+    name = replication_names(target)
+    with db_pool.connection(source) as conn:
+        # The publication has to exist before the slot starts decoding
+        conn.cursor().execute(f"CREATE PUBLICATION {quote_ident(name)} FOR ALL TABLES;")
+    log_callback(f"Created publication {name} on {source['host']}.")
+
+    repl_conn = open_connection(source, connection_factory=psycopg2.extras.LogicalReplicationConnection)
+    cur = repl_conn.cursor()
+    cur.execute(f"CREATE_REPLICATION_SLOT {quote_ident(name)} LOGICAL pgoutput EXPORT_SNAPSHOT;")
+    slot_name, consistent_point, snapshot, _ = cur.fetchone()
+    log_callback(f"Created replication slot {slot_name} at {consistent_point}, dumping from snapshot {snapshot}.")
+    return repl_conn, snapshot
+
+def create_subscription(source, target, log_callback):
+    """Subscribes the target to the source publication, starting at the slot's position."""
+    name = replication_names(target)
+    with db_pool.connection(target) as conn:
+        conn.cursor().execute(
+            f"CREATE SUBSCRIPTION {quote_ident(name)} CONNECTION %s PUBLICATION {quote_ident(name)} "
+            f"WITH (create_slot = false, slot_name = %s, copy_data = false);",
+            (get_conn_string(source), name)
+        )
+    log_callback(f"Created subscription {name} on {target['host']}, changes are now streaming.")
+
+def drop_replication(source, target, log_callback):
+    """Removes subscription, slot and publication. Safe to call on partial setups.
+
+    The publication is also dropped on the target, which got a copy of it from the dump.
+    """
+    name = replication_names(target)
+    with db_pool.connection(target) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT 1 FROM pg_subscription WHERE subname = %s;", (name,))
+        if cur.fetchone():
+            try:
+                # Also drops the slot on the source
+                cur.execute(f"DROP SUBSCRIPTION {quote_ident(name)};")
+            except psycopg2.Error:
+                # Source unreachable: detach from the slot, it is dropped below
+                cur.execute(f"ALTER SUBSCRIPTION {quote_ident(name)} DISABLE;")
+                cur.execute(f"ALTER SUBSCRIPTION {quote_ident(name)} SET (slot_name = NONE);")
+                cur.execute(f"DROP SUBSCRIPTION {quote_ident(name)};")
+        cur.execute(f"DROP PUBLICATION IF EXISTS {quote_ident(name)};")
+
+    with db_pool.connection(source) as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT pg_drop_replication_slot(slot_name) FROM pg_replication_slots WHERE slot_name = %s AND NOT active;",
+            (name,)
         )
+        cur.execute(f"DROP PUBLICATION IF EXISTS {quote_ident(name)};")
+    log_callback(f"Removed replication objects {name}.")
+
+def get_replication_lag(source, target):
+    """Replication lag of the target's subscription: bytes behind the source WAL and seconds since the last apply."""
+    name = replication_names(target)
+    with db_pool.connection(source, connect_timeout=5) as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT active, pg_wal_lsn_diff(pg_current_wal_lsn(), confirmed_flush_lsn)
+            FROM pg_replication_slots WHERE slot_name = %s;
+        """, (name,))
+        row = cur.fetchone()
+    if not row:
+        return None
+
+    with db_pool.connection(target, connect_timeout=5) as conn:
         cur = conn.cursor()
-        cur.execute("SELECT version();")
-        version = cur.fetchone()[0]
-        conn.close()
+        cur.execute("""
+            SELECT extract(epoch FROM now() - latest_end_time)
+            FROM pg_stat_subscription WHERE subname = %s AND relid IS NULL;
+        """, (name,))
+        lag = cur.fetchone()
+
+    return {
+        'active': row[0],
+        'lag_bytes': int(row[1] or 0),
+        'lag_seconds': float(lag[0]) if lag and lag[0] is not None else None,
+    }
+
+def cutover_replication(source, target, log_callback, timeout=60):
+    """Final cutover: wait for the target to catch up, sync sequences, remove replication.
+
+    Writes to the source should be stopped before calling this.
+    """
+    try:
+        log_callback("PHASE:CUTOVER|Waiting for the target to catch up...")
+        with db_pool.connection(source) as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT pg_current_wal_lsn();")
+            final_lsn = cur.fetchone()[0]
+            deadline = time.time() + timeout
+            while True:
+                cur.execute(
+                    "SELECT confirmed_flush_lsn >= %s::pg_lsn FROM pg_replication_slots WHERE slot_name = %s;",
+                    (final_lsn, replication_names(target))
+                )
+                row = cur.fetchone()
+                if not row:
+                    raise Exception("Replication slot not found")
+                if row[0]:
+                    break
+                if time.time() > deadline:
+                    raise Exception(f"Target did not reach {final_lsn} within {timeout}s")
+                time.sleep(1)
+            log_callback(f"Target caught up to {final_lsn}.")
+
+            # Logical replication does not carry sequence values
+            with db_pool.connection(target) as tgt_conn:
+                seq_count = copy_sequences(cur, tgt_conn.cursor())
+            log_callback(f"Synchronized {seq_count} sequences.")
+
+        drop_replication(source, target, log_callback)
+        log_callback("Cutover completed successfully.")
+        return True, "Cutover completed successfully!"
+    except Exception as e:
+        log_callback(f"ERROR: Cutover Failed - {str(e)}")
+        return False, str(e)
+
+def run_replicated_migration(source, target, log_callback, mode, jobs=None, stream_format='custom',
+                             deferred_indexes=True, index_workers=None, fast_load=None, throttle=None):
+    """Initial copy from a replication slot's snapshot, then a subscription that keeps streaming changes."""
+    log_callback("PHASE:REPLICATION|Creating publication and replication slot on source...")
+    try:
+        repl_conn, snapshot = create_replication_slot(source, target, log_callback)
+    except Exception as e:
+        log_callback(f"ERROR: Migration Failed - {str(e)}")
+        return False, str(e)
+
+    try:
+        if mode == MODE_STREAM:
+            success, msg = run_stream_migration(source, target, log_callback, False, stream_format,
+                                                deferred_indexes, index_workers, snapshot, fast_load=fast_load, throttle=throttle)
+        else:
+            success, msg = run_dump_migration(source, target, log_callback, False, mode == MODE_PARALLEL, jobs,
+                                              deferred_indexes, index_workers, snapshot, fast_load=fast_load, throttle=throttle)
+    finally:
+        repl_conn.close()
+
+    try:
+        if success:
+            log_callback("PHASE:REPLICATION|Starting subscription on target...")
+            create_subscription(source, target, log_callback)
+            return True, "Initial copy completed, replication is running. Cut over once lag is near zero."
+    except Exception as e:
+        log_callback(f"ERROR: Migration Failed - {str(e)}")
+        success, msg = False, str(e)
+
+    # Don't leave a slot behind that retains WAL on the source forever
+    try:
+        drop_replication(source, target, log_callback)
+    except Exception as e:
+        log_callback(f"WARNING: Could not remove replication objects: {str(e)}")
+    return success, msg
+
+def test_connection(conn_details):
+    """Tests connection and returns Postgres version string."""
+    try:
+        with db_pool.connection(conn_details, connect_timeout=5) as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT version();")
+            version = cur.fetchone()[0]
         return True, version
     except Exception as e:
         return False, str(e)
 
 def get_db_stats(conn_details):
-    """Returns basic stats about the database."""
-    try:
-        conn = psycopg2.connect(
-            host=conn_details['host'],
-            port=conn_details['port'],
-            dbname=conn_details['dbname'],
-            user=conn_details['user'],
-            password=conn_details['password']
-        )
+    """Returns per-schema and per-table sizes and row estimates, largest tables first.
+
+    One pass over pg_class/pg_namespace: rows are reltuples estimates (never-analyzed
+    tables count as 0 and are reported in 'unanalyzed'), sizes come from the
+    relation size functions. Extension-owned tables are skipped, like pg_dump does.
+    Partitioned tables are counted through their partitions: the parent holds no
+    data, and autovacuum never analyzes it.
+    """
+    with db_pool.connection(conn_details) as conn:
         cur = conn.cursor()
-        
-        # Schema count
-        cur.execute("SELECT count(*) FROM information_schema.schemata;")
-        schema_count = cur.fetchone()[0]
-        
-        # Table count
-        cur.execute("SELECT count(*) FROM information_schema.tables WHERE table_schema NOT IN ('information_schema', 'pg_catalog');")
-        table_count = cur.fetchone()[0]
-        
-        # Approx Row Count (fastest way)
-        cur.execute("SELECT SUM(reltuples) AS approximate_row_count FROM pg_class WHERE relkind = 'r';")
-        row_count = cur.fetchone()[0]
-        if row_count is None: row_count = 0
-        
-        conn.close()
-        
-        return {
-            'schemas': schema_count,
-            'tables': table_count,
-            'rows': int(row_count)
+        cur.execute("""
+            SELECT n.nspname, c.relname, c.reltuples::bigint,
+                   pg_total_relation_size(c.oid),
+                   pg_indexes_size(c.oid),
+                   COALESCE(pg_total_relation_size(NULLIF(c.reltoastrelid, 0)), 0)
+            FROM pg_namespace n
+            LEFT JOIN pg_class c ON c.relnamespace = n.oid
+                AND c.relkind IN ('r', 'm')
+                AND NOT EXISTS (SELECT 1 FROM pg_depend d WHERE d.objid = c.oid AND d.deptype = 'e')
+            WHERE n.nspname NOT IN ('pg_catalog', 'information_schema')
+              AND n.nspname NOT LIKE 'pg_toast%'
+              AND n.nspname NOT LIKE 'pg_temp%'
+            ORDER BY 4 DESC NULLS LAST;
+        """)
+        rows = cur.fetchall()
+
+    schemas, tables = {}, []
+    for schema, name, reltuples, total, index, toast in rows:
+        agg = schemas.setdefault(schema, {'schema': schema, 'tables': 0, 'rows': 0, 'total_bytes': 0, 'toast_bytes': 0, 'index_bytes': 0})
+        if name is None:
+            # Empty schema
+            continue
+        table = {
+            'schema': schema,
+            'name': name,
+            'rows': max(reltuples, 0),
+            'analyzed': reltuples >= 0,
+            'total_bytes': total,
+            'table_bytes': total - index - toast,
+            'toast_bytes': toast,
+            'index_bytes': index,
         }
-    except Exception as e:
-        raise e
+        tables.append(table)
+        agg['tables'] += 1
+        for field in ('rows', 'total_bytes', 'toast_bytes', 'index_bytes'):
+            agg[field] += table[field]
+
+    return {
+        'schemas': len(schemas),
+        'tables': len(tables),
+        'rows': sum(t['rows'] for t in tables),
+        'unanalyzed': sum(1 for t in tables if not t['analyzed']),
+        'total_bytes': sum(t['total_bytes'] for t in tables),
+        'toast_bytes': sum(t['toast_bytes'] for t in tables),
+        'index_bytes': sum(t['index_bytes'] for t in tables),
+        'schema_stats': sorted(schemas.values(), key=lambda s: s['total_bytes'], reverse=True),
+        'table_stats': tables,
+    }
+
+def get_database_size(conn_details):
+    """Size of the database on disk in bytes."""
+    with db_pool.connection(conn_details, connect_timeout=5) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_database_size(current_database());")
+        return cur.fetchone()[0]
 
 def get_local_pg_dump_version():
     """Returns the major version of the local pg_dump binary."""
@@ -201,7 +2364,65 @@ def get_local_pg_dump_version():
     except Exception:
         return 0
 
-def preflight_check(source, target):
+def replication_checks(source, target):
+    """Preflight checks for logical replication: wal_level, slot capacity and privileges."""
+    checks = []
+
+    with db_pool.connection(source, connect_timeout=5) as conn:
+        cur = conn.cursor()
+        cur.execute("SHOW wal_level;")
+        wal_level = cur.fetchone()[0]
+        if wal_level == 'logical':
+            checks.append({'status': 'pass', 'msg': "Source wal_level is logical"})
+        else:
+            checks.append({'status': 'fail', 'msg': f"Source wal_level is '{wal_level}', logical replication needs 'logical' (restart required)"})
+
+        cur.execute("""
+            SELECT current_setting('max_replication_slots')::int - (SELECT count(*) FROM pg_replication_slots),
+                   current_setting('max_wal_senders')::int - (SELECT count(*) FROM pg_stat_replication);
+        """)
+        free_slots, free_senders = cur.fetchone()
+        if free_slots > 0 and free_senders > 0:
+            checks.append({'status': 'pass', 'msg': f"Replication capacity: {free_slots} free slots, {free_senders} free WAL senders"})
+        else:
+            checks.append({'status': 'fail', 'msg': f"No free replication slot / WAL sender on source ({free_slots} slots, {free_senders} senders free)"})
+
+        # FOR ALL TABLES publications need superuser; the slot needs REPLICATION
+        cur.execute("SELECT rolsuper, rolreplication FROM pg_roles WHERE rolname = current_user;")
+        is_super, can_replicate = cur.fetchone()
+        if is_super or can_replicate:
+            checks.append({'status': 'pass', 'msg': "Source user has REPLICATION privilege"})
+        else:
+            checks.append({'status': 'fail', 'msg': "Source user needs the REPLICATION attribute"})
+        if not is_super:
+            checks.append({'status': 'fail', 'msg': "Source user must be superuser to create a FOR ALL TABLES publication"})
+
+        cur.execute("""
+            SELECT count(*) FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE c.relkind = 'r' AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+              AND c.relreplident = 'd'
+              AND NOT EXISTS (SELECT 1 FROM pg_index i WHERE i.indrelid = c.oid AND i.indisprimary);
+        """)
+        no_identity = cur.fetchone()[0]
+        if no_identity:
+            checks.append({'status': 'warn', 'msg': f"{no_identity} tables have no primary key or replica identity; UPDATE/DELETE on them will fail during replication"})
+
+    with db_pool.connection(target, connect_timeout=5) as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT rolsuper OR EXISTS (
+                SELECT 1 FROM pg_roles r WHERE r.rolname = 'pg_create_subscription'
+                  AND pg_has_role(current_user, r.oid, 'member'))
+            FROM pg_roles WHERE rolname = current_user;
+        """)
+        if cur.fetchone()[0]:
+            checks.append({'status': 'pass', 'msg': "Target user can create subscriptions"})
+        else:
+            checks.append({'status': 'fail', 'msg': "Target user needs superuser (or pg_create_subscription) to create a subscription"})
+
+    return checks
+
+def preflight_check(source, target, replication=False):
     """Runs checks before migration."""
     checks = []
     
@@ -237,5 +2458,13 @@ def preflight_check(source, target):
         checks.append({'status': 'pass', 'msg': f"Target Connected: {t_ver.split(' ')[0]}..."})
     else:
         checks.append({'status': 'fail', 'msg': f"Target Failed: {t_ver}"})
+        return checks
+
+    # Check 3: Logical Replication
+    if replication:
+        try:
+            checks.extend(replication_checks(source, target))
+        except Exception as e:
+            checks.append({'status': 'fail', 'msg': f"Replication checks failed: {e}"})
     
     return checks
@@ -0,0 +1,96 @@
+import os
+import json
+import time
+import threading
+
+import storage
+import migration
+
+# Source statistics are served from this cache and refreshed in the background,
+# so re-rendering a page never blocks on (or loads) the production primary.
+STATS_TTL = float(os.environ.get('PGSHIFT_STATS_TTL', '600'))
+# A failed refresh is retried at most this often while the stale copy is shown
+RETRY_AFTER = 30
+
+_entries = {}  # connection_key -> {'stats', 'collected_at', 'error', 'failed_at'}
+_refreshing = set()
+_lock = threading.Lock()
+
+def load(key):
+    """Memory entry for key, falling back to the copy saved in storage."""
+    with _lock:
+        entry = _entries.get(key)
+    if entry is None:
+        row = storage.get_cached_stats(key)
+        if row:
+            entry = {'stats': json.loads(row['stats']), 'collected_at': row['collected_at'], 'error': None, 'failed_at': 0}
+            with _lock:
+                entry = _entries.setdefault(key, entry)
+    return entry
+
+def refresh(conn_details):
+    """Collects fresh stats and stores them in memory and in storage. Returns the stats."""
+    key = migration.connection_key(conn_details)
+    try:
+        stats = migration.get_db_stats(conn_details)
+    except Exception as e:
+        with _lock:
+            entry = _entries.get(key)
+            if entry:
+                entry['error'] = str(e)
+                entry['failed_at'] = time.time()
+        raise
+    collected_at = time.time()
+    storage.save_cached_stats(key, json.dumps(stats), collected_at)
+    with _lock:
+        _entries[key] = {'stats': stats, 'collected_at': collected_at, 'error': None, 'failed_at': 0}
+    return stats
+
+def refresh_in_background(conn_details):
+    """Starts a refresh thread unless one is already running for this database."""
+    key = migration.connection_key(conn_details)
+    with _lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def worker():
+        try:
+            refresh(conn_details)
+        except Exception:
+            pass  # Kept in the entry's 'error', the previous stats stay visible
+        finally:
+            with _lock:
+                _refreshing.discard(key)
+
+    threading.Thread(target=worker, name=f"pgshift-stats-{key}", daemon=True).start()
+
+def get_stats(conn_details, ttl=None, force_refresh=False):
+    """Cached stats for a database, without waiting on the server when a cached copy exists.
+
+    Returns {'stats', 'collected_at', 'age', 'stale', 'refreshing', 'error'}.
+    A missing entry is collected synchronously; a stale one (older than ttl) or
+    force_refresh is served as is while a background thread refreshes it.
+    """
+    ttl = STATS_TTL if ttl is None else ttl
+    key = migration.connection_key(conn_details)
+    entry = load(key)
+    if entry is None:
+        refresh(conn_details)
+        entry = load(key)
+
+    now = time.time()
+    age = now - entry['collected_at']
+    stale = age > ttl
+    if force_refresh or (stale and now - entry['failed_at'] > RETRY_AFTER):
+        refresh_in_background(conn_details)
+    with _lock:
+        refreshing = key in _refreshing
+    return {
+        'stats': entry['stats'],
+        'collected_at': entry['collected_at'],
+        'age': age,
+        'stale': stale,
+        'refreshing': refreshing,
+        'error': entry['error'],
+    }
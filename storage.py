@@ -1,5 +1,8 @@
 import sqlite3
 import os
+import time
+import threading
+from contextlib import contextmanager
 
 # Ensure data directory exists
 DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
@@ -8,8 +11,54 @@ os.makedirs(DATA_DIR, exist_ok=True)
 # Database path in data directory for Docker volume persistence
 DB_FILE = os.path.join(DATA_DIR, 'connections.db')
 
+# One connection per process, shared by the Streamlit script thread and the job
+# threads. sqlite3 objects aren't safe for concurrent use, so every access holds _lock.
+_conn = None
+_conn_file = None
+_lock = threading.RLock()
+
+# get_connections() result, dropped on save/delete and when another process writes
+_connections_cache = None
+_connections_version = None
+
+def get_db():
+    """The shared connection, (re)opened in WAL mode when missing or when DB_FILE changed."""
+    global _conn, _conn_file
+    with _lock:
+        if _conn is None or _conn_file != DB_FILE:
+            close_db()
+            conn = sqlite3.connect(DB_FILE, check_same_thread=False, timeout=30)
+            conn.row_factory = sqlite3.Row
+            # Readers don't block the writer; NORMAL sync is durable enough in WAL mode
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            _conn, _conn_file = conn, DB_FILE
+        return _conn
+
+def close_db():
+    global _conn, _conn_file, _connections_cache
+    with _lock:
+        if _conn is not None:
+            _conn.close()
+        _conn, _conn_file, _connections_cache = None, None, None
+
+@contextmanager
+def cursor():
+    """Cursor on the shared connection; commits on success, rolls back on error."""
+    with _lock:
+        conn = get_db()
+        c = conn.cursor()
+        try:
+            yield c
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            c.close()
+
 def init_db():
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db()
     c = conn.cursor()
     
     # Create table with environment field
@@ -34,34 +83,157 @@ def init_db():
         # Column already exists
         pass
     
+    # Incremental sync watermarks: per-table change counters from the last sync
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS sync_watermarks (
+            source_key TEXT NOT NULL,
+            target_key TEXT NOT NULL,
+            table_name TEXT NOT NULL,
+            change_counter INTEGER NOT NULL,
+            row_count INTEGER NOT NULL,
+            synced_at REAL NOT NULL,
+            PRIMARY KEY (source_key, target_key, table_name)
+        )
+    ''')
+    
+    # Migration: target-side counter and stats reset times, so drift on either side is noticed
+    for column in ("target_counter INTEGER", "stats_reset TEXT", "live_tuples INTEGER", "target_live_tuples INTEGER"):
+        try:
+            c.execute(f"ALTER TABLE sync_watermarks ADD COLUMN {column}")
+        except sqlite3.OperationalError:
+            # Column already exists
+            pass
+    
+    # Background migration jobs
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source TEXT NOT NULL,
+            target TEXT NOT NULL,
+            mode TEXT NOT NULL,
+            options TEXT NOT NULL DEFAULT '{}',
+            status TEXT NOT NULL DEFAULT 'queued',
+            phase TEXT,
+            message TEXT,
+            log_path TEXT,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL
+        )
+    ''')
+    
+    # Migration: batch membership, source size for throughput reporting, verification report
+    # Connection keys (migration.connection_key) and the state of a job's logical replication:
+    # 'streaming' until it is cut over ('cut over') or dropped ('dropped')
+    for column in ("batch_id INTEGER", "size_bytes INTEGER", "progress TEXT", "verification TEXT",
+                   "source_key TEXT", "target_key TEXT", "replication TEXT"):
+        try:
+            c.execute(f"ALTER TABLE jobs ADD COLUMN {column}")
+        except sqlite3.OperationalError:
+            # Column already exists
+            pass
+    
+    # Batch migrations: many source/target pairs under shared concurrency limits
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS batches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            max_concurrency INTEGER NOT NULL,
+            per_host_limit INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            finished_at REAL
+        )
+    ''')
+    
+    # Last source analysis per database, so pages render without querying the server
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS stats_cache (
+            conn_key TEXT PRIMARY KEY,
+            stats TEXT NOT NULL,
+            collected_at REAL NOT NULL
+        )
+    ''')
+    
+    # Cached dumps that later migrations can restore from (see artifacts.py)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS artifacts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source_key TEXT NOT NULL,
+            schema_only INTEGER NOT NULL,
+            format TEXT NOT NULL,
+            compression TEXT,
+            path TEXT NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            checksum TEXT NOT NULL,
+            lsn TEXT,
+            created_at REAL NOT NULL,
+            last_used_at REAL NOT NULL
+        )
+    ''')
+    # Migration: newest modification time of the dump's files, checked on reuse instead of the checksum
+    try:
+        c.execute("ALTER TABLE artifacts ADD COLUMN mtime REAL")
+    except sqlite3.OperationalError:
+        # Column already exists
+        pass
+    
+    # Restores that can be resumed (see checkpoints.py)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS restore_runs (
+            id TEXT PRIMARY KEY,
+            source_key TEXT NOT NULL,
+            target_key TEXT NOT NULL,
+            dump_path TEXT NOT NULL,
+            owns_dump INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS restore_checkpoints (
+            run_id TEXT NOT NULL,
+            item TEXT NOT NULL,
+            restored_at REAL NOT NULL,
+            PRIMARY KEY (run_id, item)
+        )
+    ''')
+    
     conn.commit()
-    conn.close()
 
 def save_connection(name, host, port, user, password, dbname, environment='Production'):
     try:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute('''
-            INSERT INTO connections (name, environment, host, port, user, password, dbname)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (name, environment, host, port, user, password, dbname))
-        conn.commit()
+        with cursor() as c:
+            c.execute('''
+                INSERT INTO connections (name, environment, host, port, user, password, dbname)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (name, environment, host, port, user, password, dbname))
         return True, "Saved successfully"
     except sqlite3.IntegrityError:
         return False, "Connection name already exists"
     except Exception as e:
         return False, str(e)
     finally:
-        conn.close()
+        invalidate_connections()
+
+def invalidate_connections():
+    global _connections_cache
+    with _lock:
+        _connections_cache = None
 
 def get_connections():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    c.execute('SELECT * FROM connections ORDER BY environment, name')
-    rows = c.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+    """Saved connections, served from memory until they change."""
+    global _connections_cache, _connections_version
+    with _lock:
+        # data_version only moves when another connection (process) commits
+        version = get_db().execute('PRAGMA data_version').fetchone()[0]
+        if _connections_cache is None or version != _connections_version:
+            with cursor() as c:
+                c.execute('SELECT * FROM connections ORDER BY environment, name')
+                _connections_cache = [dict(row) for row in c.fetchall()]
+            _connections_version = version
+        # Copies, so callers can't alter the cache
+        return [dict(row) for row in _connections_cache]
 
 def get_connections_by_environment():
     """Get connections grouped by environment"""
@@ -75,11 +247,202 @@ def get_connections_by_environment():
     return grouped
 
 def delete_connection(conn_id):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('DELETE FROM connections WHERE id = ?', (conn_id,))
-    conn.commit()
-    conn.close()
+    with cursor() as c:
+        c.execute('DELETE FROM connections WHERE id = ?', (conn_id,))
+    invalidate_connections()
+
+def get_sync_watermarks(source_key, target_key):
+    """Watermarks from the last incremental sync, keyed by table name."""
+    with cursor() as c:
+        c.execute('SELECT * FROM sync_watermarks WHERE source_key = ? AND target_key = ?', (source_key, target_key))
+        rows = c.fetchall()
+    return {row['table_name']: dict(row) for row in rows}
+
+def save_sync_watermark(source_key, target_key, table_name, change_counter, row_count, synced_at, target_counter=None,
+                        stats_reset=None, live_tuples=None, target_live_tuples=None):
+    with cursor() as c:
+        c.execute('''
+            INSERT OR REPLACE INTO sync_watermarks (source_key, target_key, table_name, change_counter, row_count, synced_at,
+                                                    target_counter, stats_reset, live_tuples, target_live_tuples)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (source_key, target_key, table_name, change_counter, row_count, synced_at, target_counter, stats_reset,
+              live_tuples, target_live_tuples))
+
+JOB_FIELDS = ('status', 'phase', 'message', 'log_path', 'started_at', 'finished_at', 'size_bytes', 'progress', 'verification',
+              'replication')
+
+def create_job(source, target, mode, options, log_path, batch_id=None, source_key=None, target_key=None):
+    """Records a queued job and returns its id. source/target are display labels, options a JSON string,
+    source_key/target_key identify the databases (see migration.connection_key)."""
+    with cursor() as c:
+        c.execute('''
+            INSERT INTO jobs (source, target, mode, options, status, log_path, created_at, batch_id, source_key, target_key)
+            VALUES (?, ?, ?, ?, 'queued', ?, ?, ?, ?, ?)
+        ''', (source, target, mode, options, log_path, time.time(), batch_id, source_key, target_key))
+        job_id = c.lastrowid
+    return job_id
+
+def update_job(job_id, **fields):
+    unknown = set(fields) - set(JOB_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown job fields: {', '.join(sorted(unknown))}")
+    with cursor() as c:
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        c.execute(f'UPDATE jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+
+def get_job(job_id):
+    with cursor() as c:
+        c.execute('SELECT * FROM jobs WHERE id = ?', (job_id,))
+        row = c.fetchone()
+    return dict(row) if row else None
+
+def get_jobs(limit=50):
+    """Most recent jobs first."""
+    with cursor() as c:
+        c.execute('SELECT * FROM jobs ORDER BY id DESC LIMIT ?', (limit,))
+        rows = c.fetchall()
+    return [dict(row) for row in rows]
+
+def get_batch_jobs(batch_id):
+    with cursor() as c:
+        c.execute('SELECT * FROM jobs WHERE batch_id = ? ORDER BY id', (batch_id,))
+        rows = c.fetchall()
+    return [dict(row) for row in rows]
+
+def create_batch(name, max_concurrency, per_host_limit):
+    with cursor() as c:
+        c.execute('''
+            INSERT INTO batches (name, max_concurrency, per_host_limit, created_at)
+            VALUES (?, ?, ?, ?)
+        ''', (name, max_concurrency, per_host_limit, time.time()))
+        batch_id = c.lastrowid
+    return batch_id
+
+def finish_batch(batch_id):
+    with cursor() as c:
+        c.execute('UPDATE batches SET finished_at = ? WHERE id = ?', (time.time(), batch_id))
+
+def get_batch(batch_id):
+    with cursor() as c:
+        c.execute('SELECT * FROM batches WHERE id = ?', (batch_id,))
+        row = c.fetchone()
+    return dict(row) if row else None
+
+def get_batches(limit=20):
+    with cursor() as c:
+        c.execute('SELECT * FROM batches ORDER BY id DESC LIMIT ?', (limit,))
+        rows = c.fetchall()
+    return [dict(row) for row in rows]
+
+def count_jobs_by_status():
+    """{status: number of jobs} over the whole job history."""
+    with cursor() as c:
+        c.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status')
+        rows = c.fetchall()
+    return {status: count for status, count in rows}
+
+def mark_interrupted_jobs():
+    """Flags jobs left queued/running by a previous process as interrupted, and their restores as resumable."""
+    with cursor() as c:
+        c.execute('''
+            UPDATE jobs SET status = 'interrupted', finished_at = ?
+            WHERE status IN ('queued', 'running')
+        ''', (time.time(),))
+        count = c.rowcount
+        c.execute("UPDATE restore_runs SET status = 'failed', updated_at = ? WHERE status = 'running'", (time.time(),))
+    return count
+
+def get_cached_stats(conn_key):
+    """Cached get_db_stats result for a connection: {'stats': JSON string, 'collected_at'} or None."""
+    with cursor() as c:
+        c.execute('SELECT stats, collected_at FROM stats_cache WHERE conn_key = ?', (conn_key,))
+        row = c.fetchone()
+    return dict(row) if row else None
+
+def save_cached_stats(conn_key, stats, collected_at):
+    with cursor() as c:
+        c.execute('''
+            INSERT OR REPLACE INTO stats_cache (conn_key, stats, collected_at)
+            VALUES (?, ?, ?)
+        ''', (conn_key, stats, collected_at))
+
+def create_artifact(source_key, schema_only, fmt, compression, path, size_bytes, checksum, lsn, created_at, mtime=None):
+    with cursor() as c:
+        c.execute('''
+            INSERT INTO artifacts (source_key, schema_only, format, compression, path, size_bytes, checksum, lsn, created_at, last_used_at, mtime)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (source_key, int(schema_only), fmt, compression, path, size_bytes, checksum, lsn, created_at, created_at, mtime))
+        artifact_id = c.lastrowid
+    return artifact_id
+
+def get_artifacts(source_key=None):
+    """Cached dumps, newest first, optionally only those of one source."""
+    with cursor() as c:
+        if source_key is None:
+            c.execute('SELECT * FROM artifacts ORDER BY created_at DESC')
+        else:
+            c.execute('SELECT * FROM artifacts WHERE source_key = ? ORDER BY created_at DESC', (source_key,))
+        rows = c.fetchall()
+    return [dict(row) for row in rows]
+
+def touch_artifact(artifact_id):
+    with cursor() as c:
+        c.execute('UPDATE artifacts SET last_used_at = ? WHERE id = ?', (time.time(), artifact_id))
+
+def delete_artifact(artifact_id):
+    with cursor() as c:
+        c.execute('DELETE FROM artifacts WHERE id = ?', (artifact_id,))
+
+def create_restore_run(run_id, source_key, target_key, dump_path, owns_dump, created_at):
+    with cursor() as c:
+        c.execute('''
+            INSERT OR REPLACE INTO restore_runs (id, source_key, target_key, dump_path, owns_dump, status, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, 'running', ?, ?)
+        ''', (run_id, source_key, target_key, dump_path, int(bool(owns_dump)), created_at, created_at))
+        c.execute('DELETE FROM restore_checkpoints WHERE run_id = ?', (run_id,))
+
+def get_restore_run(run_id):
+    with cursor() as c:
+        c.execute('SELECT * FROM restore_runs WHERE id = ?', (run_id,))
+        row = c.fetchone()
+    return dict(row) if row else None
+
+def get_restore_runs():
+    with cursor() as c:
+        c.execute('SELECT * FROM restore_runs ORDER BY created_at')
+        rows = c.fetchall()
+    return [dict(row) for row in rows]
+
+def update_restore_run(run_id, status, updated_at):
+    with cursor() as c:
+        c.execute('UPDATE restore_runs SET status = ?, updated_at = ? WHERE id = ?', (status, updated_at, run_id))
+
+def delete_restore_run(run_id):
+    with cursor() as c:
+        c.execute('DELETE FROM restore_checkpoints WHERE run_id = ?', (run_id,))
+        c.execute('DELETE FROM restore_runs WHERE id = ?', (run_id,))
+
+def add_checkpoint(run_id, item, restored_at):
+    with cursor() as c:
+        c.execute('''
+            INSERT OR IGNORE INTO restore_checkpoints (run_id, item, restored_at) VALUES (?, ?, ?)
+        ''', (run_id, item, restored_at))
+
+def delete_checkpoints(run_id, exclude_prefix=None):
+    """Forgets the items of a run, except those starting with exclude_prefix."""
+    with cursor() as c:
+        if exclude_prefix:
+            c.execute("DELETE FROM restore_checkpoints WHERE run_id = ? AND substr(item, 1, ?) != ?",
+                      (run_id, len(exclude_prefix), exclude_prefix))
+        else:
+            c.execute('DELETE FROM restore_checkpoints WHERE run_id = ?', (run_id,))
+
+def get_checkpoints(run_id):
+    """Items restored so far by a run."""
+    with cursor() as c:
+        c.execute('SELECT item FROM restore_checkpoints WHERE run_id = ?', (run_id,))
+        rows = c.fetchall()
+    return [row[0] for row in rows]
 
 # Initialize DB on import
 init_db()
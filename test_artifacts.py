@@ -0,0 +1,105 @@
+import unittest
+import os
+import tempfile
+import time
+
+import storage
+import artifacts
+
+class TestArtifacts(unittest.TestCase):
+
+    def setUp(self):
+        storage.DB_FILE = 'test_artifacts.db'
+        storage.init_db()
+        self.dir = tempfile.TemporaryDirectory()
+        artifacts.ARTIFACT_DIR = self.dir.name
+
+    def tearDown(self):
+        storage.close_db()
+        for path in ('test_artifacts.db', 'test_artifacts.db-wal', 'test_artifacts.db-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+        self.dir.cleanup()
+
+    def make_dump(self, content):
+        path = artifacts.new_path('postgres@prod:5432/app')
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_compression_args(self):
+        log = []
+        self.assertEqual(artifacts.compression_args('', 16, log.append), [])
+        self.assertEqual(artifacts.compression_args('6', 14, log.append), ['-Z', '6'])
+        self.assertEqual(artifacts.compression_args('zstd:3', 16, log.append), ['-Z', 'zstd:3'])
+        self.assertEqual(artifacts.compression_args('zstd:3', 15, log.append), ['-Z', '3'])
+        self.assertEqual(len(log), 1)
+        with self.assertRaises(Exception):
+            artifacts.compression_args('brotli', 16, log.append)
+
+    def test_find_fresh_and_checksum(self):
+        path = self.make_dump(b'dump')
+        artifact = artifacts.register('postgres@prod:5432/app', False, 'c', None, path, '0/1A2B', time.time())
+        self.assertEqual(artifact['checksum'], artifacts.checksum(path))
+
+        self.assertEqual(artifacts.find_fresh('postgres@prod:5432/app', False, 60)['id'], artifact['id'])
+        self.assertIsNone(artifacts.find_fresh('postgres@prod:5432/app', True, 60))
+        self.assertIsNone(artifacts.find_fresh('postgres@other:5432/app', False, 60))
+
+        os.remove(path)
+        self.assertIsNone(artifacts.find_fresh('postgres@prod:5432/app', False, 60))
+        self.assertEqual(storage.get_artifacts(), [])
+
+    def test_intact(self):
+        path = self.make_dump(b'dump')
+        artifact = artifacts.register('postgres@prod:5432/app', False, 'c', None, path, None, time.time())
+        self.assertEqual((artifact['size_bytes'], artifact['mtime']), artifacts.stat(path))
+        self.assertTrue(artifacts.intact(artifact))
+
+        # Same size, rewritten later: caught without reading the dump
+        with open(path, 'wb') as f:
+            f.write(b'DUMP')
+        os.utime(path, (artifact['mtime'] + 10, artifact['mtime'] + 10))
+        self.assertFalse(artifacts.intact(artifact))
+
+        # Same size and mtime: only the full check reads the content
+        os.utime(path, (artifact['mtime'], artifact['mtime']))
+        self.assertTrue(artifacts.intact(artifact))
+        self.assertFalse(artifacts.intact(artifact, full=True))
+
+        with open(path, 'ab') as f:
+            f.write(b'!')
+        self.assertFalse(artifacts.intact(artifact))
+        os.remove(path)
+        self.assertFalse(artifacts.intact(artifact))
+
+    def test_intact_directory_dump(self):
+        path = artifacts.new_path('postgres@prod:5432/app')
+        os.makedirs(path)
+        for name in ('toc.dat', '3381.dat.gz'):
+            with open(os.path.join(path, name), 'wb') as f:
+                f.write(name.encode())
+        artifact = artifacts.register('postgres@prod:5432/app', False, 'd', None, path, None, time.time())
+        self.assertEqual(artifact['size_bytes'], len('toc.dat') + len('3381.dat.gz'))
+        self.assertTrue(artifacts.intact(artifact, full=True))
+        os.remove(os.path.join(path, '3381.dat.gz'))
+        self.assertFalse(artifacts.intact(artifact))
+
+    def test_evict_least_recently_used(self):
+        old = artifacts.register('postgres@prod:5432/app', False, 'c', None, self.make_dump(b'a' * 10), None, time.time())
+        used = artifacts.register('postgres@prod:5432/app', False, 'c', None, self.make_dump(b'b' * 10), None, time.time())
+        new = artifacts.register('postgres@prod:5432/app', False, 'c', None, self.make_dump(b'c' * 10), None, time.time())
+        storage.touch_artifact(new['id'])
+        artifacts.checkout(used)
+
+        artifacts.evict(lambda msg: None, max_bytes=20)
+        self.assertEqual(sorted(a['id'] for a in storage.get_artifacts()), [used['id'], new['id']])
+        self.assertFalse(os.path.exists(old['path']))
+
+        # In use: kept even when over the limit
+        artifacts.evict(lambda msg: None, max_bytes=0)
+        self.assertEqual([a['id'] for a in storage.get_artifacts()], [used['id']])
+        artifacts.release(used)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import unittest
+import os
+import json
+import tempfile
+
+import storage
+import checkpoints
+
+try:
+    import migration
+except ImportError:  # psycopg2 not installed
+    migration = None
+
+TOC = [
+    "3380; 1259 16390 TABLE public orders postgres",
+    "3381; 0 16390 TABLE DATA public orders postgres",
+    "3382; 0 16395 TABLE DATA public order_items postgres",
+    "3210; 2606 16400 CONSTRAINT public orders orders_pkey postgres",
+]
+
+class TestCheckpoints(unittest.TestCase):
+
+    def setUp(self):
+        storage.DB_FILE = 'test_checkpoints.db'
+        storage.init_db()
+        self.toc = []
+        for line in TOC:
+            dump_id, desc, schema, tag = checkpoints.parse_toc_line(line)
+            self.toc.append({'id': dump_id, 'desc': desc, 'schema': schema, 'tag': tag,
+                             'key': checkpoints.item_key(desc, schema, tag), 'line': line})
+
+    def tearDown(self):
+        storage.close_db()
+        for path in ('test_checkpoints.db', 'test_checkpoints.db-wal', 'test_checkpoints.db-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_parse_toc_line(self):
+        self.assertEqual(checkpoints.parse_toc_line(TOC[1]), (3381, 'TABLE DATA', 'public', 'orders'))
+        self.assertEqual(checkpoints.parse_toc_line(TOC[3]), (3210, 'CONSTRAINT', 'public', 'orders orders_pkey'))
+        self.assertIsNone(checkpoints.parse_toc_line("; Archive created at 2026-10-18 10:00:00 UTC"))
+
+    def test_serial_tracker(self):
+        run = checkpoints.RestoreRun.start('job-1', 'src', 'tgt', '/tmp/x.dump', owns_dump=True)
+        tracker = checkpoints.RestoreTracker(run, self.toc)
+        log = tracker.wrap(lambda msg: None)
+        log('pg_restore: processing data for table "public.orders"')
+        self.assertFalse(run.done('TABLE DATA public.orders'))
+        log('pg_restore: processing data for table "public.order_items"')
+        self.assertTrue(run.done('TABLE DATA public.orders'))
+        # Failed here: order_items is not done, and that is what the saved run remembers
+        self.assertEqual(storage.get_checkpoints('job-1'), ['TABLE DATA public.orders'])
+
+    def test_parallel_tracker_and_resume(self):
+        run = checkpoints.RestoreRun.start('job-2', 'src', 'tgt', '/tmp/x.dump', owns_dump=True)
+        tracker = checkpoints.RestoreTracker(run, self.toc)
+        tracker.observe('pg_restore: finished item 3382 TABLE DATA order_items')
+        run.finish_stage('pre-data')
+        checkpoints.fail(run, lambda msg: None)
+
+        resumed = checkpoints.reopen('job-2')
+        self.assertTrue(resumed.stage_done('pre-data'))
+        self.assertEqual(resumed.items("TABLE DATA "), ['public.order_items'])
+        self.assertEqual(storage.get_restore_run('job-2')['status'], 'running')
+
+    def test_parallel_tracker_ignores_worker_lines(self):
+        run = checkpoints.RestoreRun.start('job-4', 'src', 'tgt', '/tmp/x.dump', owns_dump=True)
+        tracker = checkpoints.RestoreTracker(run, self.toc, jobs=4)
+        tracker.observe('pg_restore: launching item 3381 TABLE DATA public orders')
+        tracker.observe('pg_restore: processing data for table "public.orders"')
+        # Another worker starting does not mean orders is loaded
+        tracker.observe('pg_restore: processing data for table "public.order_items"')
+        self.assertFalse(run.done('TABLE DATA public.orders'))
+        tracker.observe('pg_restore: finished item 3381 TABLE DATA orders')
+        self.assertTrue(run.done('TABLE DATA public.orders'))
+        self.assertFalse(run.done('TABLE DATA public.order_items'))
+
+    def test_atomic_tracker_and_forget(self):
+        run = checkpoints.RestoreRun.start('job-5', 'src', 'tgt', '/tmp/x.dump', owns_dump=True)
+        tracker = checkpoints.RestoreTracker(run, self.toc, atomic=True)
+        tracker.observe('pg_restore: creating TABLE "public.orders"')
+        tracker.observe('pg_restore: processing data for table "public.orders"')
+        # Rolled back if the restore fails: nothing is checkpointed yet
+        self.assertEqual(storage.get_checkpoints('job-5'), [])
+        tracker.succeeded()
+        self.assertEqual(sorted(storage.get_checkpoints('job-5')), ['TABLE DATA public.orders', 'TABLE public.orders'])
+
+        run.finish_stage('data')
+        run.forget_items()
+        self.assertEqual(storage.get_checkpoints('job-5'), ['STAGE data'])
+        self.assertFalse(run.done('TABLE public.orders'))
+
+    def test_tracker_spans(self):
+        run = checkpoints.RestoreRun.start(None, 'src', 'tgt', '/tmp/x.dump', owns_dump=True)
+        tracker = checkpoints.RestoreTracker(run, self.toc)
+        log = []
+        callback = tracker.wrap(log.append)
+        callback('pg_restore: launching item 3381 TABLE DATA public orders')
+        callback('pg_restore: launching item 3210 CONSTRAINT public orders orders_pkey')
+        callback('pg_restore: finished item 3381 TABLE DATA orders')
+        # Not launched in this restore: checkpointed, but without a span
+        callback('pg_restore: finished item 3382 TABLE DATA order_items')
+        spans = [json.loads(msg[len("SPAN:"):]) for msg in log if msg.startswith("SPAN:")]
+        self.assertEqual([(s['name'], s['kind']) for s in spans], [('public.orders', 'table data')])
+        self.assertTrue(run.done("TABLE DATA public.order_items"))
+
+    def test_resumable_and_finish(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'run.dump')
+            open(path, 'w').close()
+            run = checkpoints.RestoreRun.start('job-3', 'src', 'tgt', path, owns_dump=True)
+            self.assertIsNone(checkpoints.resumable('job-3'))
+            checkpoints.fail(run, lambda msg: None)
+            self.assertEqual(checkpoints.resumable('job-3')['dump_path'], path)
+
+            checkpoints.finish(run)
+            self.assertFalse(os.path.exists(path))
+            self.assertIsNone(storage.get_restore_run('job-3'))
+
+@unittest.skipIf(migration is None, "psycopg2 is not installed")
+class TestResumableOption(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.run_dump_migration = migration.run_dump_migration
+
+        def run_dump_migration(source, target, log_callback, *args, run_id=None, resume=False, **kwargs):
+            self.calls.append((run_id, resume))
+            return True, "ok"
+        migration.run_dump_migration = run_dump_migration
+
+    def tearDown(self):
+        migration.run_dump_migration = self.run_dump_migration
+
+    def test_checkpointing_is_opt_in(self):
+        migration.run_migration({}, {}, print, run_id='job-1')
+        migration.run_migration({}, {}, print, run_id='job-2', resumable=True)
+        migration.run_migration({}, {}, print, run_id='job-3', resume='job-2')
+        self.assertEqual(self.calls, [(None, False), ('job-2', False), ('job-2', True)])
+
+if __name__ == '__main__':
+    unittest.main()
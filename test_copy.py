@@ -0,0 +1,159 @@
+import unittest
+import contextlib
+
+try:
+    import migration
+except ImportError:  # psycopg2 not installed
+    migration = None
+
+GB = 1024 * 1024 * 1024
+
+def table(name, size, pk='id', rows=0):
+    return {'schema': 'public', 'name': name, 'bytes': size, 'rows': rows, 'pk': pk, 'columns': ['id', 'note']}
+
+class FakeCursor:
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = -1
+
+    def execute(self, query, params=None):
+        self.conn.queries.append((query, params))
+
+    def fetchone(self):
+        return self.conn.results.pop(0)
+
+    def copy_expert(self, sql, file):
+        self.conn.copies.append(sql)
+        if self.conn.fail:
+            raise migration.psycopg2.OperationalError("canceling statement due to user request")
+        if 'TO STDOUT' in sql:
+            file.write(self.conn.data)
+        else:
+            self.conn.received = file.read()
+            self.rowcount = self.conn.received.count(b"\n")
+
+class FakeConnection:
+
+    def __init__(self, data=b"", results=(), fail=False):
+        self.data = data
+        self.results = list(results)
+        self.fail = fail
+        self.queries = []
+        self.copies = []
+        self.sessions = []
+        self.received = None
+        self.commits = self.rollbacks = 0
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def set_session(self, **kwargs):
+        self.sessions.append(kwargs)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def cancel(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+@unittest.skipIf(migration is None, "psycopg2 is not installed")
+class TestPlanCopyTasks(unittest.TestCase):
+
+    def test_small_tables_are_one_task(self):
+        conn = FakeConnection()
+        tasks = migration.plan_copy_tasks(conn.cursor(), [table('orders', GB // 2), table('notes', 10 * GB, pk=None)], 4)
+        self.assertEqual([(t['table']['name'], t['range'], t['chunks']) for t in tasks], [('orders', None, 1), ('notes', None, 1)])
+        # No key range query without a primary key or for a single chunk
+        self.assertEqual(conn.queries, [])
+
+    def test_large_table_split_by_key_range(self):
+        conn = FakeConnection(results=[(1, 1000)])
+        tables = [table('events', 3 * GB), table('users', 1024)]
+        tasks = migration.plan_copy_tasks(conn.cursor(), tables, 8)
+        self.assertIn('min("id"), max("id") FROM "public"."events"', conn.queries[0][0])
+        # 3 GB: 4 chunks covering 1..1000 without gaps, then the small table
+        self.assertEqual([t['range'] for t in tasks[:4]], [(1, 251), (251, 501), (501, 751), (751, 1001)])
+        self.assertEqual([(t['chunk'], t['chunks']) for t in tasks[:4]], [(1, 4), (2, 4), (3, 4), (4, 4)])
+        self.assertEqual((tasks[4]['table']['name'], tasks[4]['range']), ('users', None))
+
+    def test_chunks_capped_by_jobs(self):
+        conn = FakeConnection(results=[(0, 10 ** 6)])
+        tasks = migration.plan_copy_tasks(conn.cursor(), [table('events', 100 * GB)], 1)
+        self.assertEqual(len(tasks), 4)
+
+    def test_empty_table_not_split(self):
+        conn = FakeConnection(results=[(None, None)])
+        tasks = migration.plan_copy_tasks(conn.cursor(), [table('events', 3 * GB)], 8)
+        self.assertEqual([t['range'] for t in tasks], [None])
+
+@unittest.skipIf(migration is None, "psycopg2 is not installed")
+class TestCopyTableData(unittest.TestCase):
+
+    def test_range_copy(self):
+        src, tgt = FakeConnection(data=b"1\ta\n2\tb\n"), FakeConnection()
+        task = {'table': table('events', 3 * GB), 'range': (1, 251), 'chunk': 1, 'chunks': 4}
+        self.assertEqual(migration.copy_table_data(src, tgt, task), 2)
+        self.assertEqual(src.copies, ['COPY (SELECT "id", "note" FROM "public"."events" WHERE "id" >= 1 AND "id" < 251) TO STDOUT'])
+        self.assertEqual(tgt.copies, ['COPY "public"."events" ("id", "note") FROM STDIN'])
+        self.assertEqual(tgt.received, b"1\ta\n2\tb\n")
+        self.assertEqual((tgt.commits, tgt.rollbacks), (1, 0))
+
+    def test_failed_source_is_not_committed(self):
+        src, tgt = FakeConnection(fail=True), FakeConnection()
+        task = {'table': table('events', 1024), 'range': None, 'chunk': 1, 'chunks': 1}
+        with self.assertRaises(migration.psycopg2.OperationalError):
+            migration.copy_table_data(src, tgt, task)
+        self.assertEqual(src.copies, ['COPY "public"."events" ("id", "note") TO STDOUT'])
+        self.assertEqual((tgt.commits, tgt.rollbacks), (0, 1))
+
+@unittest.skipIf(migration is None, "psycopg2 is not installed")
+class TestCopyMigrationSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.opened = []
+        names = ('open_connection', 'run_command', 'reset_target', 'list_copy_tables', 'copy_sequences', 'build_post_data')
+        self.saved = {name: getattr(migration, name) for name in names}
+        self.pool_connection = migration.db_pool.connection
+
+        def open_connection(conn_details, **kwargs):
+            conn = FakeConnection(data=b"1\ta\n", results=[('00000003-0000001B-1',)])
+            conn.host = conn_details['host']
+            self.opened.append(conn)
+            return conn
+        migration.open_connection = open_connection
+        migration.run_command = lambda *args, **kwargs: None
+        migration.reset_target = lambda *args, **kwargs: None
+        migration.list_copy_tables = lambda cur, filters=None: [table('orders', 1024), table('users', 1024)]
+        migration.copy_sequences = lambda *args, **kwargs: 0
+        migration.build_post_data = lambda *args, **kwargs: None
+        migration.db_pool.connection = lambda conn_details, connect_timeout=10: contextlib.nullcontext(FakeConnection())
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            setattr(migration, name, value)
+        migration.db_pool.connection = self.pool_connection
+
+    def test_workers_share_the_exported_snapshot(self):
+        conn = {'host': 'src', 'port': '5432', 'dbname': 'app', 'user': 'postgres', 'password': ''}
+        success, msg = migration.run_copy_migration(conn, dict(conn, host='tgt'), lambda msg: None, jobs=2)
+        self.assertTrue(success, msg)
+        coordinator, workers = self.opened[0], self.opened[1:]
+        self.assertEqual(coordinator.queries[0][0], "SELECT pg_export_snapshot();")
+        sources = [c for c in workers if c.host == 'src']
+        self.assertTrue(sources)
+        for src in sources:
+            self.assertEqual(src.sessions, [{'isolation_level': 'REPEATABLE READ', 'readonly': True}])
+            self.assertEqual(src.queries[0], ("SET TRANSACTION SNAPSHOT %s;", ('00000003-0000001B-1',)))
+        self.assertEqual(sum(len(c.copies) for c in workers if c.host == 'tgt'), 2)
+        self.assertTrue(all(c.closed for c in self.opened))
+
+if __name__ == '__main__':
+    unittest.main()
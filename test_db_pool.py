@@ -0,0 +1,124 @@
+import unittest
+import time
+
+try:
+    import db_pool
+except ImportError:  # psycopg2 not installed
+    db_pool = None
+
+DETAILS = {'host': 'db.internal', 'port': '5432', 'dbname': 'app', 'user': 'alice', 'password': 'secret'}
+
+class FakeCursor:
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query):
+        self.conn.queries.append(query)
+        if self.conn.broken:
+            raise db_pool.psycopg2.OperationalError("server closed the connection unexpectedly")
+
+class FakeConnection:
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.closed = 0
+        self.broken = False
+        self.autocommit = False
+        self.queries = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def get_transaction_status(self):
+        return db_pool.psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+@unittest.skipIf(db_pool is None, "psycopg2 is not installed")
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.opened = []
+        self.connect = db_pool.psycopg2.connect
+
+        def connect(**kwargs):
+            conn = FakeConnection(**kwargs)
+            self.opened.append(conn)
+            return conn
+        db_pool.psycopg2.connect = connect
+
+    def tearDown(self):
+        db_pool.psycopg2.connect = self.connect
+        db_pool.close_all()
+
+    def test_reuse_and_health_check_after_idle(self):
+        pool = db_pool.ConnectionPool(DETAILS, health_check_after=30)
+        conn = pool.acquire()
+        self.assertTrue(conn.autocommit)
+        pool.release(conn)
+        # Recently used: handed out again without a round trip
+        self.assertIs(pool.acquire(), conn)
+        self.assertEqual(conn.queries, [])
+
+        # Idle for longer than health_check_after: pinged first
+        pool.release(conn)
+        pool.idle = [(conn, time.time() - 60)]
+        self.assertIs(pool.acquire(), conn)
+        self.assertEqual(conn.queries, ["SELECT 1;"])
+
+        # A failed ping replaces the connection
+        pool.release(conn)
+        pool.idle = [(conn, time.time() - 60)]
+        conn.broken = True
+        fresh = pool.acquire()
+        self.assertIsNot(fresh, conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.stats()['created'], 2)
+
+    def test_idle_eviction(self):
+        pool = db_pool.ConnectionPool(DETAILS, idle_timeout=300)
+        first, second = pool.acquire(), pool.acquire()
+        pool.release(first)
+        pool.release(second)
+        pool.idle[0] = (first, time.time() - 600)
+        self.assertIs(pool.acquire(), second)
+        self.assertTrue(first.closed)
+        self.assertEqual(pool.stats()['idle'], 0)
+
+    def test_max_size_and_timeout(self):
+        pool = db_pool.ConnectionPool(DETAILS, max_size=2)
+        held = [pool.acquire(), pool.acquire()]
+        started = time.time()
+        with self.assertRaises(db_pool.PoolTimeout):
+            pool.acquire(timeout=0.1)
+        self.assertGreaterEqual(time.time() - started, 0.1)
+        self.assertEqual(pool.stats(), {'in_use': 2, 'idle': 0, 'max_size': 2, 'created': 2})
+        pool.release(held[0])
+        self.assertIs(pool.acquire(timeout=0.1), held[0])
+
+    def test_connect_timeout_per_acquire(self):
+        with db_pool.connection(DETAILS, connect_timeout=5):
+            with db_pool.connection(DETAILS):
+                pass
+        self.assertEqual([c.kwargs['connect_timeout'] for c in self.opened], [5, 10])
+        # Both callers share one pool for the database
+        self.assertEqual(len(db_pool.pool_stats()), 1)
+
+    def test_discard_after_operational_error(self):
+        with self.assertRaises(db_pool.psycopg2.OperationalError):
+            with db_pool.connection(DETAILS) as conn:
+                raise db_pool.psycopg2.OperationalError("terminating connection due to administrator command")
+        self.assertTrue(conn.closed)
+        pool = db_pool.get_pool(DETAILS)
+        self.assertEqual(pool.stats()['in_use'], 0)
+        self.assertEqual(pool.stats()['idle'], 0)
+        with db_pool.connection(DETAILS) as fresh:
+            self.assertIsNot(fresh, conn)
+
+if __name__ == '__main__':
+    unittest.main()
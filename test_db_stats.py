@@ -0,0 +1,73 @@
+import unittest
+import re
+import contextlib
+
+try:
+    import migration
+except ImportError:  # psycopg2 not installed
+    migration = None
+
+MB = 1024 * 1024
+
+# (schema, name, relkind, reltuples, total bytes, index bytes, toast bytes)
+CATALOG = [
+    ('public', 'events', 'p', -1, 0, 0, 0),  # Partitioned parent: no storage, never analyzed
+    ('public', 'events_2025', 'r', 600000, 60 * MB, 10 * MB, 0),
+    ('public', 'events_2026', 'r', 400000, 40 * MB, 8 * MB, 1 * MB),
+    ('public', 'users', 'r', 5000, 2 * MB, 1 * MB, 0),
+    ('public', 'users_pkey', 'i', 0, 1 * MB, 0, 0),
+    ('public', 'daily_totals', 'm', 365, 1 * MB, 0, 0),
+    ('public', 'user_names', 'v', 0, 0, 0, 0),
+    ('audit', None, None, None, None, None, None),  # Empty schema
+]
+
+class FakeCursor:
+    """Answers the stats query from CATALOG, applying its relkind filter."""
+
+    def execute(self, query, params=None):
+        relkinds = re.search(r"c\.relkind IN \(([^)]*)\)", query).group(1)
+        kept = set(re.findall(r"'(\w)'", relkinds))
+        rows = [(schema, name, reltuples, total, index, toast) for schema, name, kind, reltuples, total, index, toast in CATALOG
+                if kind in kept or name is None]
+        self.rows = sorted(rows, key=lambda r: -1 if r[3] is None else r[3], reverse=True)
+
+    def fetchall(self):
+        return self.rows
+
+class FakeConnection:
+
+    def cursor(self):
+        return FakeCursor()
+
+@unittest.skipIf(migration is None, "psycopg2 is not installed")
+class TestDbStats(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = migration.db_pool.connection
+        migration.db_pool.connection = lambda conn_details, connect_timeout=10: contextlib.nullcontext(FakeConnection())
+
+    def tearDown(self):
+        migration.db_pool.connection = self.connection
+
+    def test_partitions_counted_once(self):
+        stats = migration.get_db_stats({})
+        names = [t['name'] for t in stats['table_stats']]
+        # Children and the materialized view only, largest first; no parent, index or view
+        self.assertEqual(names, ['events_2025', 'events_2026', 'users', 'daily_totals'])
+        self.assertEqual(stats['rows'], 600000 + 400000 + 5000 + 365)
+        self.assertEqual(stats['total_bytes'], 103 * MB)
+        # The never-analyzed parent would have shown up here
+        self.assertEqual(stats['unanalyzed'], 0)
+
+    def test_schema_totals(self):
+        stats = migration.get_db_stats({})
+        self.assertEqual(stats['schemas'], 2)
+        public, audit = stats['schema_stats']
+        self.assertEqual((public['schema'], public['tables'], public['index_bytes'], public['toast_bytes']),
+                         ('public', 4, 19 * MB, 1 * MB))
+        self.assertEqual((audit['schema'], audit['tables'], audit['total_bytes']), ('audit', 0, 0))
+        events = stats['table_stats'][1]
+        self.assertEqual(events['table_bytes'], 31 * MB)
+
+if __name__ == '__main__':
+    unittest.main()
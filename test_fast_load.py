@@ -0,0 +1,103 @@
+import unittest
+
+try:
+    import migration
+except ImportError:  # psycopg2 not installed
+    migration = None
+
+@unittest.skipIf(migration is None, "psycopg2 is not installed")
+class TestFastLoad(unittest.TestCase):
+
+    def test_normalize(self):
+        self.assertIsNone(migration.normalize_fast_load(None))
+        self.assertEqual(migration.normalize_fast_load(True), migration.FAST_LOAD_DEFAULTS)
+        options = migration.normalize_fast_load({'unlogged': True})
+        self.assertTrue(options['unlogged'])
+        self.assertTrue(options['vacuum'])
+
+    def test_restore_env(self):
+        target = {'password': 'secret'}
+        self.assertNotIn('-c synchronous_commit', migration.restore_env(target, None).get('PGOPTIONS', ''))
+        env = migration.restore_env(target, migration.normalize_fast_load(True))
+        self.assertIn('-c synchronous_commit=off', env['PGOPTIONS'])
+        self.assertEqual(env['PGPASSWORD'], 'secret')
+
+    def test_single_transaction(self):
+        log = []
+        options = migration.normalize_fast_load({'single_transaction': True})
+        self.assertTrue(migration.single_transaction(options, 1, log.append))
+        self.assertFalse(migration.single_transaction(options, 4, log.append))
+        self.assertEqual(len(log), 1)
+
+    def test_stream_single_transaction(self):
+        target = {'host': 'localhost', 'port': '5432', 'user': 'postgres', 'dbname': 'app'}
+        # psql ignores -1 for a script read from stdin unless it is passed as -f -
+        self.assertEqual(migration.build_stream_restore_cmd(target, 'plain', single=True)[-3:], ['--single-transaction', '-f', '-'])
+        self.assertNotIn('-f', migration.build_stream_restore_cmd(target, 'plain'))
+        self.assertEqual(migration.build_stream_restore_cmd(target, 'custom', single=True)[-1], '--single-transaction')
+
+def conn(host):
+    return {'host': host, 'port': '5432', 'dbname': 'app', 'user': 'postgres', 'password': ''}
+
+TOC = [
+    "3380; 1259 16390 TABLE public orders postgres",
+    "3381; 0 16390 TABLE DATA public orders postgres",
+    "3210; 2606 16400 CONSTRAINT public orders orders_pkey postgres",
+]
+
+@unittest.skipIf(migration is None, "psycopg2 is not installed")
+class TestSingleTransactionRestore(unittest.TestCase):
+
+    def setUp(self):
+        self.restores = []
+        self.saved = {name: getattr(migration, name) for name in
+                      ('dump_source', 'reset_target', 'start_progress', 'restore_section', 'build_post_data', 'run_command')}
+        self.read_toc = migration.checkpoints.read_toc
+        toc = []
+        for line in TOC:
+            dump_id, desc, schema, tag = migration.checkpoints.parse_toc_line(line)
+            toc.append({'id': dump_id, 'desc': desc, 'schema': schema, 'tag': tag,
+                        'key': migration.checkpoints.item_key(desc, schema, tag), 'line': line})
+        migration.checkpoints.read_toc = lambda dump_file: toc
+        migration.dump_source = lambda *args, **kwargs: None
+        migration.reset_target = lambda *args, **kwargs: None
+        migration.start_progress = lambda source, log_callback, filters=None: migration.ProgressTracker(log_callback)
+        migration.build_post_data = lambda *args, **kwargs: None
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            setattr(migration, name, value)
+        migration.checkpoints.read_toc = self.read_toc
+
+    def restore(self, **options):
+        def restore_section(target, dump_file, jobs, sections, env, log_callback, run, toc, extra=(), progress=None):
+            self.restores.append((sections, list(extra)))
+            for section in sections:
+                run.finish_stage(section)
+        migration.restore_section = restore_section
+        fast_load = migration.normalize_fast_load({'single_transaction': True, 'unlogged': True, 'vacuum': False})
+        return migration.run_dump_migration(conn('src'), conn('tgt'), lambda msg: None, fast_load=fast_load, **options)
+
+    def test_one_restore_for_all_sections(self):
+        self.assertTrue(self.restore(deferred_indexes=False)[0])
+        self.assertEqual(self.restores, [(['pre-data', 'data', 'post-data'], ['--single-transaction'])])
+
+    def test_deferred_indexes_stay_outside(self):
+        self.assertTrue(self.restore(deferred_indexes=True)[0])
+        self.assertEqual(self.restores, [(['pre-data', 'data'], ['--single-transaction'])])
+
+    def test_sections_in_one_pg_restore(self):
+        commands = []
+        migration.run_command = lambda cmd, *args, **kwargs: commands.append(cmd)
+        run = migration.checkpoints.RestoreRun()
+        toc = migration.checkpoints.read_toc(None)
+        self.saved['restore_section'](conn('tgt'), '/tmp/x.dump', 1,
+                                      ['pre-data', 'data'], {}, lambda msg: None, run, toc, ['--single-transaction'])
+        self.assertEqual(len(commands), 1)
+        self.assertIn('--section=pre-data', commands[0])
+        self.assertIn('--section=data', commands[0])
+        self.assertIn('--single-transaction', commands[0])
+        self.assertTrue(run.stage_done('pre-data') and run.stage_done('data'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+
+try:
+    import migration
+except ImportError:  # psycopg2 not installed
+    migration = None
+
+@unittest.skipIf(migration is None, "psycopg2 is not installed")
+class TestFilters(unittest.TestCase):
+
+    def test_filter_args(self):
+        filters = migration.normalize_filters({
+            'include_tables': ['public.orders*', ''],
+            'exclude_tables': ['public.orders_archive'],
+            'include_schemas': [],
+        })
+        self.assertEqual(filters, {'include_tables': ['public.orders*'], 'exclude_tables': ['public.orders_archive']})
+        self.assertEqual(migration.filter_args(filters), ['-t', 'public.orders*', '-T', 'public.orders_archive'])
+        self.assertIsNone(migration.normalize_filters({'include_tables': ['  ']}))
+
+    def test_table_patterns(self):
+        filters = {'include_tables': ['public.orders*', '"Mixed"."T1"', 'users'], 'exclude_tables': ['public.orders_archive']}
+        self.assertTrue(migration.table_selected(filters, 'public', 'orders_items'))
+        self.assertFalse(migration.table_selected(filters, 'public', 'orders_archive'))
+        self.assertTrue(migration.table_selected(filters, 'Mixed', 'T1', visible=False))
+        self.assertFalse(migration.table_selected(filters, 'mixed', 't1'))
+        # Unqualified patterns only match tables visible in the search_path
+        self.assertTrue(migration.table_selected(filters, 'public', 'users', visible=True))
+        self.assertFalse(migration.table_selected(filters, 'audit', 'users', visible=False))
+
+    def test_schema_patterns(self):
+        filters = {'include_schemas': ['sales*'], 'exclude_schemas': ['sales_test'], 'exclude_tables': ['sales.big']}
+        self.assertTrue(migration.table_selected(filters, 'sales_eu', 'orders', visible=False))
+        self.assertFalse(migration.table_selected(filters, 'sales_test', 'orders'))
+        self.assertFalse(migration.table_selected(filters, 'public', 'orders'))
+        self.assertFalse(migration.table_selected(filters, 'sales', 'big'))
+        # -n/-N have no effect once -t is used
+        filters['include_tables'] = ['public.orders']
+        self.assertTrue(migration.table_selected(filters, 'public', 'orders'))
+        self.assertFalse(migration.table_selected(filters, 'sales_eu', 'orders'))
+
+if __name__ == '__main__':
+    unittest.main()
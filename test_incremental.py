@@ -0,0 +1,35 @@
+import unittest
+
+try:
+    import migration
+except ImportError:  # psycopg2 not installed
+    migration = None
+
+# Watermark of a table synced with 500 changes / 100 live rows on the source, 40 / 100 on the target
+MARK = {'change_counter': 500, 'live_tuples': 100, 'target_counter': 40, 'target_live_tuples': 100, 'stats_reset': 'a|b'}
+
+@unittest.skipIf(migration is None, "psycopg2 is not installed")
+class TestIncrementalSkip(unittest.TestCase):
+
+    def test_unchanged_table_is_skipped(self):
+        self.assertTrue(migration.unchanged_since_sync(MARK, (500, 100), (40, 100), 'a|b'))
+
+    def test_truncated_source_table_is_compared(self):
+        # TRUNCATE leaves n_tup_ins + n_tup_upd + n_tup_del alone but empties n_live_tup
+        self.assertFalse(migration.unchanged_since_sync(MARK, (500, 0), (40, 100), 'a|b'))
+        self.assertFalse(migration.unchanged_since_sync(MARK, (500, 100), (40, 0), 'a|b'))
+
+    def test_standby_source_is_never_skipped(self):
+        self.assertFalse(migration.unchanged_since_sync(MARK, (500, 100), (40, 100), 'a|b', source_in_recovery=True))
+
+    def test_changes_resets_and_recopied_tables_are_compared(self):
+        self.assertFalse(migration.unchanged_since_sync(MARK, (501, 100), (40, 100), 'a|b'))
+        self.assertFalse(migration.unchanged_since_sync(MARK, (500, 100), (41, 100), 'a|b'))
+        self.assertFalse(migration.unchanged_since_sync(MARK, (500, 100), (40, 100), 'c|b'))
+        self.assertFalse(migration.unchanged_since_sync(dict(MARK, target_counter=None), (500, 100), (40, 100), 'a|b'))
+        # Watermarks saved before live rows were recorded
+        self.assertFalse(migration.unchanged_since_sync(dict(MARK, live_tuples=None), (500, 100), (40, 100), 'a|b'))
+        self.assertFalse(migration.unchanged_since_sync(None, (500, 100), (40, 100), 'a|b'))
+
+if __name__ == '__main__':
+    unittest.main()
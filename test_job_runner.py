@@ -0,0 +1,75 @@
+import unittest
+import threading
+
+try:
+    import job_runner
+except ImportError:  # psycopg2 not installed
+    job_runner = None
+
+def conn(host, dbname):
+    return {'host': host, 'port': '5432', 'dbname': dbname, 'user': 'postgres', 'password': ''}
+
+@unittest.skipIf(job_runner is None, "psycopg2 is not installed")
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.run_job = job_runner.run_job
+
+        def run_job(job_id, source, target, log_path, options):
+            self.release.wait(5)
+        job_runner.run_job = run_job
+        # Fresh scheduler state, so nothing leaks between tests
+        self.saved = (job_runner._pending[:], dict(job_runner._running), dict(job_runner._batch_remaining))
+        job_runner._pending.clear()
+        job_runner._running.update({'total': 0, 'hosts': {}, 'targets': set(), 'batches': {}})
+        job_runner._batch_remaining.clear()
+
+    def tearDown(self):
+        self.release.set()
+        self.join_jobs()
+        job_runner.run_job = self.run_job
+        pending, running, remaining = self.saved
+        job_runner._pending[:] = pending
+        job_runner._running.clear()
+        job_runner._running.update(running)
+        job_runner._batch_remaining.clear()
+        job_runner._batch_remaining.update(remaining)
+
+    def join_jobs(self):
+        threads = [t for t in threading.enumerate() if t.name.startswith('pgshift-job-')]
+        for thread in threads:
+            thread.join(5)
+        return len(threads)
+
+    def test_limits_are_shared_by_all_jobs(self):
+        entries = [
+            job_runner.new_entry(1, conn('a', 'app'), conn('b', 'app'), None, {}),
+            # Same target database as job 1: waits for it
+            job_runner.new_entry(2, conn('c', 'app'), conn('b', 'app'), None, {}),
+            # Another batch's job on host b, under its per-host limit of 1
+            job_runner.new_entry(3, conn('d', 'app'), conn('b', 'other'), None, {}, batch_id=7, max_concurrency=4, per_host_limit=1),
+            job_runner.new_entry(4, conn('e', 'app'), conn('f', 'app'), None, {}),
+        ]
+        job_runner._batch_remaining[7] = 2
+        job_runner.enqueue(entries)
+        with job_runner._schedule_lock:
+            waiting = [e['job_id'] for e in job_runner._pending]
+            job_runner._pending.clear()
+            self.assertEqual(job_runner._running['hosts']['b:5432'], 1)
+            self.assertEqual(job_runner._running['total'], 2)
+        self.assertEqual(waiting, [2, 3])
+
+        self.release.set()
+        self.assertEqual(self.join_jobs(), 2)
+        self.assertEqual(job_runner._running['total'], 0)
+        self.assertEqual(job_runner._running['hosts'], {'a:5432': 0, 'b:5432': 0, 'e:5432': 0, 'f:5432': 0})
+
+    def test_check_batch_rejects_shared_targets(self):
+        with self.assertRaises(Exception):
+            job_runner.check_batch([(conn('a', 'app'), conn('b', 'app')), (conn('c', 'app'), conn('b', 'app'))])
+        with self.assertRaises(Exception):
+            job_runner.check_batch([(conn('a', 'app'), conn('b', 'app')), (conn('b', 'app'), conn('c', 'app'))])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+import os
+import time
+import tempfile
+import logstream
+
+class TestLogStreamer(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+        self.frames = []
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def test_full_log_on_disk_tail_in_memory(self):
+        streamer = logstream.LogStreamer(self.path, render=self.frames.append, tail=3, fps=1000, echo=False)
+        for i in range(10):
+            streamer.write(f"line {i}")
+        streamer.close()
+
+        self.assertEqual(len(logstream.read_log(self.path)), 10)
+        self.assertEqual(logstream.read_log(self.path, limit=2), ["line 8", "line 9"])
+        self.assertEqual(self.frames[-1], ["line 7", "line 8", "line 9"])
+
+    def test_render_is_rate_limited(self):
+        streamer = logstream.LogStreamer(self.path, render=self.frames.append, tail=15, fps=0.001, echo=False)
+        for i in range(100):
+            streamer.write(f"line {i}", display=f"shown {i}")
+        # First write flushes, the rest wait for the next frame
+        self.assertEqual(len(self.frames), 1)
+        streamer.close()
+        self.assertEqual(len(self.frames), 2)
+        self.assertEqual(self.frames[-1][-1], "shown 99")
+
+    def test_timer_flushes_between_writes(self):
+        streamer = logstream.LogStreamer(self.path, render=self.frames.append, fps=20, echo=False)
+        streamer.write("first")
+        streamer.write("second")
+        self.assertEqual(self.frames, [["first"]])
+        # No further write: the timer pushes "second" out at the next frame
+        time.sleep(0.3)
+        self.assertEqual(self.frames[-1], ["first", "second"])
+        self.assertEqual(logstream.read_log(self.path), ["first", "second"])
+        streamer.close()
+        self.assertIsNone(streamer.timer)
+
+    def test_close_flushes_even_if_render_fails(self):
+        def render(lines):
+            raise RuntimeError("UI gone")
+        streamer = logstream.LogStreamer(self.path, render=render, fps=0.001, echo=False)
+        with self.assertRaises(RuntimeError):
+            streamer.write("first")
+        streamer.write("last")
+        with self.assertRaises(RuntimeError):
+            streamer.close()
+        self.assertTrue(streamer.file.closed)
+        self.assertEqual(logstream.read_log(self.path), ["first", "last"])
+
+    def test_tail_log_reads_from_end(self):
+        streamer = logstream.LogStreamer(self.path, echo=False)
+        for i in range(1000):
+            streamer.write(f"line {i}")
+        streamer.close()
+
+        self.assertEqual(logstream.tail_log(self.path, limit=3, block_size=128), ["line 997", "line 998", "line 999"])
+        self.assertEqual(logstream.tail_log(self.path, limit=5000), logstream.read_log(self.path))
+
+if __name__ == '__main__':
+    unittest.main()
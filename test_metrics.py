@@ -0,0 +1,71 @@
+import unittest
+import os
+import threading
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import storage
+
+try:
+    import metrics
+except ImportError:  # psycopg2 not installed
+    metrics = None
+
+@unittest.skipIf(metrics is None, "psycopg2 is not installed")
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        storage.DB_FILE = 'test_metrics.db'
+        storage.init_db()
+
+    def tearDown(self):
+        storage.close_db()
+        for path in ('test_metrics.db', 'test_metrics.db-wal', 'test_metrics.db-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_histogram(self):
+        histogram = metrics.Histogram('test_seconds', "Test.", buckets=(1, 10))
+        histogram.observe(0.5, phase='dumping')
+        histogram.observe(5, phase='dumping')
+        self.assertEqual(histogram.render()[2:], [
+            'test_seconds_bucket{phase="dumping",le="1"} 1',
+            'test_seconds_bucket{phase="dumping",le="10"} 2',
+            'test_seconds_bucket{phase="dumping",le="+Inf"} 2',
+            'test_seconds_sum{phase="dumping"} 5.5',
+            'test_seconds_count{phase="dumping"} 2',
+        ])
+        self.assertEqual(metrics.format_labels({'pool': 'a"b'}), '{pool="a\\"b"}')
+
+    def test_job_progress_counts_increments(self):
+        before = metrics.ROWS_MOVED.values.get((('mode', 'copy'),), 0)
+        metrics.job_started(-1, 'copy')
+        for phase, rows in (('dumping', 500), ('copying', 100), ('copying', 250)):
+            metrics.job_progress(-1, {'phase': phase, 'done': {'tables': 0, 'rows': rows, 'bytes': 0}})
+        # Dumped rows are not rows moved; the COPY phase counts 250 in two steps
+        self.assertEqual(metrics.ROWS_MOVED.values[(('mode', 'copy'),)] - before, 250)
+        metrics.job_finished(-1, 'copy', True, 12.0, size_bytes=1024)
+        self.assertNotIn(-1, metrics._jobs)
+
+    def test_pool_label_hides_user_and_database(self):
+        label = metrics.db_pool.pool_label(('db.internal', '5432', 'billing', 'alice', 'f00d'))
+        self.assertTrue(label.startswith('db.internal:5432/'))
+        self.assertNotIn('alice', label)
+        self.assertNotIn('billing', label)
+        self.assertNotEqual(label, metrics.db_pool.pool_label(('db.internal', '5432', 'billing', 'bob', 'f00d')))
+
+    def test_endpoint(self):
+        storage.create_job('src', 'tgt', 'standard', '{}', None)
+        server = ThreadingHTTPServer(('127.0.0.1', 0), metrics.MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            body = urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}/metrics").read().decode()
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertIn("# TYPE pgshift_migrations_started_total counter", body)
+        self.assertIn("pgshift_jobs_active ", body)
+        self.assertIn('pgshift_jobs{status="queued"} 1', body)
+
+if __name__ == '__main__':
+    unittest.main()
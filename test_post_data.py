@@ -0,0 +1,136 @@
+import unittest
+
+try:
+    import migration
+except ImportError:  # psycopg2 not installed
+    migration = None
+
+import checkpoints
+
+# pg_restore --section=post-data -f - of a small dump
+SCRIPT = """--
+-- PostgreSQL database dump
+--
+
+SET statement_timeout = 0;
+SET client_encoding = 'UTF8';
+SELECT pg_catalog.set_config('search_path', '', false);
+
+--
+-- Name: order_items order_items_order_id_fkey; Type: FK CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.order_items
+    ADD CONSTRAINT order_items_order_id_fkey FOREIGN KEY (order_id) REFERENCES public.orders(id);
+
+--
+-- Name: orders orders_audit; Type: TRIGGER; Schema: public; Owner: postgres
+--
+
+CREATE TRIGGER orders_audit AFTER INSERT ON public.orders FOR EACH ROW EXECUTE FUNCTION public.audit();
+
+--
+-- Name: orders orders_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.orders
+    ADD CONSTRAINT orders_pkey PRIMARY KEY (id);
+
+--
+-- Name: order_items_order_id_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX order_items_order_id_idx ON public.order_items USING btree (order_id);
+
+--
+-- Name: orders_2026_created_at_idx; Type: INDEX ATTACH; Schema: public; Owner: postgres
+--
+
+ALTER INDEX public.orders_created_at_idx ATTACH PARTITION public.orders_2026_created_at_idx;
+
+--
+-- Name: TABLE orders; Type: COMMENT; Schema: public; Owner: postgres
+--
+
+COMMENT ON TABLE public.orders IS 'One row per order';
+
+--
+-- PostgreSQL database dump complete
+--
+"""
+
+class FakeCursor:
+
+    def __init__(self, executed):
+        self.executed = executed
+
+    def execute(self, query, params=None):
+        # Session settings aside, every statement of every connection in order
+        if not query.startswith("SET "):
+            self.executed.append(query)
+
+class FakeConnection:
+
+    def __init__(self, executed):
+        self.executed = executed
+        self.autocommit = False
+
+    def cursor(self):
+        return FakeCursor(self.executed)
+
+    def close(self):
+        pass
+
+@unittest.skipIf(migration is None, "psycopg2 is not installed")
+class TestPostData(unittest.TestCase):
+
+    def setUp(self):
+        self.executed = []
+        self.saved = (migration.open_connection, migration.extract_post_data)
+        migration.open_connection = lambda conn_details, **kwargs: FakeConnection(self.executed)
+        migration.extract_post_data = lambda dump_file: migration.split_restore_script(SCRIPT)
+
+    def tearDown(self):
+        migration.open_connection, migration.extract_post_data = self.saved
+
+    def test_split_restore_script(self):
+        preamble, items = migration.split_restore_script(SCRIPT)
+        self.assertEqual(preamble.splitlines(), [
+            "SET statement_timeout = 0;",
+            "SET client_encoding = 'UTF8';",
+            "SELECT pg_catalog.set_config('search_path', '', false);",
+        ])
+        self.assertEqual([(i['type'], i['schema'], i['name']) for i in items], [
+            ('FK CONSTRAINT', 'public', 'order_items order_items_order_id_fkey'),
+            ('TRIGGER', 'public', 'orders orders_audit'),
+            ('CONSTRAINT', 'public', 'orders orders_pkey'),
+            ('INDEX', 'public', 'order_items_order_id_idx'),
+            ('INDEX ATTACH', 'public', 'orders_2026_created_at_idx'),
+            ('COMMENT', 'public', 'TABLE orders'),
+        ])
+        self.assertEqual(items[2]['sql'].strip(), "ALTER TABLE ONLY public.orders\n    ADD CONSTRAINT orders_pkey PRIMARY KEY (id);")
+
+    def kinds(self):
+        kinds = ('FOREIGN KEY', 'TRIGGER', 'PRIMARY KEY', 'CREATE INDEX', 'ATTACH', 'COMMENT ON')
+        # Each new session runs the preamble first (its search_path line)
+        return [next(k for k in kinds if k in query) for query in self.executed if 'set_config' not in query]
+
+    def test_waves_in_order(self):
+        log = []
+        migration.build_post_data({}, None, log.append, workers=3)
+        kinds = self.kinds()
+        # Indexes and constraints first, then FKs and index attachments, then the rest in dump order
+        self.assertEqual(sorted(kinds[:2]), ['CREATE INDEX', 'PRIMARY KEY'])
+        self.assertEqual(sorted(kinds[2:4]), ['ATTACH', 'FOREIGN KEY'])
+        self.assertEqual(kinds[4:], ['TRIGGER', 'COMMENT ON'])
+        self.assertFalse([msg for msg in log if 'ERROR' in msg])
+
+    def test_skips_built_objects(self):
+        run = checkpoints.RestoreRun()
+        run.mark(checkpoints.item_key('CONSTRAINT', 'public', 'orders orders_pkey'))
+        migration.build_post_data({}, None, lambda msg: None, workers=2, run=run)
+        self.assertEqual(sorted(self.kinds()), ['ATTACH', 'COMMENT ON', 'CREATE INDEX', 'FOREIGN KEY', 'TRIGGER'])
+        self.assertTrue(run.done(checkpoints.item_key('TRIGGER', 'public', 'orders orders_audit')))
+
+if __name__ == '__main__':
+    unittest.main()
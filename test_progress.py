@@ -0,0 +1,127 @@
+import unittest
+import json
+
+try:
+    import migration
+except ImportError:  # psycopg2 not installed
+    migration = None
+
+@unittest.skipIf(migration is None, "psycopg2 is not installed")
+class TestJobProgress(unittest.TestCase):
+
+    def test_parallel_dump_lines(self):
+        log = []
+        callback = migration.job_progress_callback(log.append, 2)
+        callback('pg_dump: dumping contents of table "public.orders"')
+        callback('pg_dump: dumping contents of table "public.order_items"')
+        callback('pg_dump: finished item 3381 TABLE DATA orders')
+        callback('pg_dump: reading schemas')
+        self.assertEqual(log, [
+            '[jobs 1/2 busy, 0 done] pg_dump: dumping contents of table "public.orders"',
+            '[jobs 2/2 busy, 0 done] pg_dump: dumping contents of table "public.order_items"',
+            '[jobs 1/2 busy, 1 done] pg_dump: finished item 3381 TABLE DATA orders',
+            'pg_dump: reading schemas',
+        ])
+
+    def test_parallel_restore_lines(self):
+        log = []
+        callback = migration.job_progress_callback(log.append, 4)
+        callback('pg_restore: launching item 3381 TABLE DATA public orders')
+        callback('pg_restore: finished item 3381 TABLE DATA orders')
+        self.assertEqual(log[-1], '[jobs 0/4 busy, 1 done] pg_restore: finished item 3381 TABLE DATA orders')
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+@unittest.skipIf(migration is None, "psycopg2 is not installed")
+class TestProgressTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.time = migration.time
+        migration.time = self.clock
+        self.log = []
+        tables = [{'schema': 'public', 'name': 'orders', 'rows': 1000}, {'schema': 'public', 'name': 'items', 'rows': 3000}]
+        self.tracker = migration.ProgressTracker(self.log.append, tables)
+        self.tracker.start('restoring')
+
+    def tearDown(self):
+        migration.time = self.time
+
+    def reports(self):
+        return [json.loads(msg[len("PROGRESS:"):]) for msg in self.log if msg.startswith("PROGRESS:")]
+
+    def test_moving_average_rate_and_eta(self):
+        self.clock.now += 10
+        self.tracker.table_done('public.orders')
+        self.tracker.tick(force=True)
+        first = self.reports()[-1]
+        self.assertEqual((first['unit'], first['rate'], first['eta_seconds'], first['percent']), ('rows', 100, 30, 25.0))
+
+        self.clock.now += 10
+        self.tracker.add_rows(1000)
+        self.tracker.tick(force=True)
+        # 0.3 * 100 rows/s now + 0.7 * 100 before: steady
+        self.assertEqual(self.reports()[-1]['rate'], 100)
+
+        self.clock.now += 10
+        self.tracker.add_rows(2000)
+        self.tracker.tick(force=True)
+        last = self.reports()[-1]
+        # 0.3 * 200 + 0.7 * 100: a burst only moves the rate part of the way
+        self.assertEqual(last['rate'], 130)
+        self.assertEqual(last['eta_seconds'], 0)
+        self.assertEqual(last['percent'], 100.0)
+
+    def test_zero_elapsed_time(self):
+        self.tracker.table_done('public.orders')
+        self.tracker.set_bytes(4096)
+        self.tracker.tick(force=True)
+        report = self.reports()[-1]
+        self.assertEqual((report['rate'], report['eta_seconds'], report['bytes_per_second'], report['elapsed_seconds']),
+                         (0, None, 0, 0))
+
+    def test_totals_below_done(self):
+        # reltuples underestimated the tables: COPY counts more rows than the total
+        self.clock.now += 10
+        self.tracker.add_rows(6000)
+        self.tracker.table_rows['public.items'] = 500
+        self.tracker.tick(force=True)
+        report = self.reports()[-1]
+        self.assertEqual((report['percent'], report['eta_seconds']), (100.0, 0))
+        self.assertEqual(report['total']['rows'], 1500)
+
+    def test_report_format(self):
+        self.tracker.tick()
+        self.assertEqual(self.log, [])
+        self.clock.now += migration.PROGRESS_INTERVAL
+        self.tracker.wrap(self.log.append)('pg_restore: processing data for table "public.orders"')
+        self.tracker.tick()
+        self.assertEqual(self.log[0], 'pg_restore: processing data for table "public.orders"')
+        self.assertTrue(self.log[1].startswith("PROGRESS:{"))
+        report = self.reports()[0]
+        self.assertEqual(sorted(report), ['bytes_per_second', 'done', 'elapsed_seconds', 'eta_seconds', 'percent', 'phase',
+                                          'rate', 'throttle', 'total', 'unit'])
+        self.assertEqual(report['phase'], 'restoring')
+        self.assertEqual(report['total'], {'tables': 2, 'rows': 4000, 'bytes': 0})
+
+        # The next table starting means the previous one is done
+        self.tracker.observe('pg_restore: processing data for table "public.items"')
+        self.tracker.finish()
+        self.assertEqual(self.reports()[-1]['done']['tables'], 2)
+
+    def test_tables_unit_without_estimates(self):
+        tracker = migration.ProgressTracker(self.log.append, [{'schema': 'public', 'name': 'orders', 'rows': 0}])
+        tracker.start('dumping')
+        tracker.observe('pg_dump: finished item 3381 TABLE DATA orders')
+        tracker.tick(force=True)
+        report = self.reports()[-1]
+        self.assertEqual((report['unit'], report['percent'], report['done']['tables']), ('tables', 100.0, 1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,17 @@
+import unittest
+
+try:
+    import migration
+except ImportError:  # psycopg2 not installed
+    migration = None
+
+@unittest.skipIf(migration is None, "psycopg2 is not installed")
+class TestReplication(unittest.TestCase):
+
+    def test_conn_string_quotes_values(self):
+        conn = {'host': 'db.internal', 'port': '5432', 'dbname': 'app', 'user': 'repl', 'password': "s3cr et'\\x"}
+        self.assertEqual(migration.get_conn_string(conn),
+                         "host='db.internal' port='5432' dbname='app' user='repl' password='s3cr et\\'\\\\x'")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 import unittest
+import sqlite3
 import os
 import storage
 
@@ -10,8 +11,10 @@ class TestStorage(unittest.TestCase):
         storage.init_db()
 
     def tearDown(self):
-        if os.path.exists('test_connections.db'):
-            os.remove('test_connections.db')
+        storage.close_db()
+        for path in ('test_connections.db', 'test_connections.db-wal', 'test_connections.db-shm'):
+            if os.path.exists(path):
+                os.remove(path)
 
     def test_save_and_get_connection(self):
         success, msg = storage.save_connection('prod', 'localhost', '5432', 'postgres', 'password', 'mydb')
@@ -31,5 +34,83 @@ class TestStorage(unittest.TestCase):
         conns = storage.get_connections()
         self.assertEqual(len(conns), 0)
 
+    def test_connections_cache_invalidation(self):
+        storage.save_connection('prod', 'localhost', '5432', 'postgres', 'password', 'mydb')
+        conns = storage.get_connections()
+        conns[0]['name'] = 'changed'
+        self.assertEqual(storage.get_connections()[0]['name'], 'prod')
+
+        storage.save_connection('staging', 'localhost', '5432', 'postgres', 'password', 'mydb', 'Staging')
+        self.assertEqual(sorted(c['name'] for c in storage.get_connections()), ['prod', 'staging'])
+
+        # Writes from another process are picked up too
+        other = sqlite3.connect(storage.DB_FILE)
+        other.execute("DELETE FROM connections WHERE name = 'staging'")
+        other.commit()
+        other.close()
+        self.assertEqual([c['name'] for c in storage.get_connections()], ['prod'])
+
+    def test_sync_watermarks(self):
+        storage.save_sync_watermark('src', 'tgt', 'public.orders', 10, 100, 1.0)
+        storage.save_sync_watermark('src', 'tgt', 'public.orders', 12, 101, 2.0)
+        storage.save_sync_watermark('src', 'other', 'public.orders', 5, 50, 1.0)
+
+        marks = storage.get_sync_watermarks('src', 'tgt')
+        self.assertEqual(list(marks), ['public.orders'])
+        self.assertEqual(marks['public.orders']['change_counter'], 12)
+        self.assertEqual(marks['public.orders']['row_count'], 101)
+        self.assertIsNone(marks['public.orders']['target_counter'])
+
+        storage.save_sync_watermark('src', 'tgt', 'public.orders', 12, 101, 3.0, target_counter=7, stats_reset='a|b',
+                                    live_tuples=101, target_live_tuples=99)
+        mark = storage.get_sync_watermarks('src', 'tgt')['public.orders']
+        self.assertEqual((mark['target_counter'], mark['stats_reset']), (7, 'a|b'))
+        self.assertEqual((mark['live_tuples'], mark['target_live_tuples']), (101, 99))
+
+    def test_job_lifecycle(self):
+        job_id = storage.create_job('prod/app', 'staging/app', 'parallel', '{}', '/tmp/job.jsonl')
+        self.assertEqual(storage.get_job(job_id)['status'], 'queued')
+
+        storage.update_job(job_id, status='running', phase='Dumping', started_at=1.0)
+        job = storage.get_job(job_id)
+        self.assertEqual(job['status'], 'running')
+        self.assertEqual(job['phase'], 'Dumping')
+
+        self.assertEqual(storage.mark_interrupted_jobs(), 1)
+        self.assertEqual(storage.get_jobs()[0]['status'], 'interrupted')
+
+        with self.assertRaises(ValueError):
+            storage.update_job(job_id, source='x')
+
+    def test_replication_job(self):
+        job_id = storage.create_job('prod/app', 'new/app', 'standard', '{"replication": true}', None,
+                                    source_key='u@prod:5432/app', target_key='u@new:5432/app')
+        storage.update_job(job_id, status='succeeded', replication='streaming')
+        job = storage.get_job(job_id)
+        self.assertEqual((job['source_key'], job['target_key'], job['replication']),
+                         ('u@prod:5432/app', 'u@new:5432/app', 'streaming'))
+
+    def test_batch_jobs(self):
+        batch_id = storage.create_batch('nightly', 4, 2)
+        storage.create_job('a/db1', 'b/db1', 'standard', '{}', None, batch_id=batch_id)
+        storage.create_job('a/db2', 'b/db2', 'standard', '{}', None, batch_id=batch_id)
+        storage.create_job('a/db3', 'b/db3', 'standard', '{}', None)
+
+        jobs = storage.get_batch_jobs(batch_id)
+        self.assertEqual([j['source'] for j in jobs], ['a/db1', 'a/db2'])
+        self.assertIsNone(storage.get_batch(batch_id)['finished_at'])
+
+        storage.finish_batch(batch_id)
+        self.assertIsNotNone(storage.get_batch(batch_id)['finished_at'])
+
+    def test_stats_cache(self):
+        self.assertIsNone(storage.get_cached_stats('postgres@db:5432/app'))
+        storage.save_cached_stats('postgres@db:5432/app', '{"tables": 1}', 1.0)
+        storage.save_cached_stats('postgres@db:5432/app', '{"tables": 2}', 2.0)
+
+        cached = storage.get_cached_stats('postgres@db:5432/app')
+        self.assertEqual(cached['stats'], '{"tables": 2}')
+        self.assertEqual(cached['collected_at'], 2.0)
+
 if __name__ == '__main__':
     unittest.main()
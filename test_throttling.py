@@ -0,0 +1,110 @@
+import unittest
+import os
+import sys
+import time
+import tempfile
+import subprocess
+
+try:
+    import throttling
+except ImportError:  # psycopg2 not installed
+    throttling = None
+
+@unittest.skipIf(throttling is None, "psycopg2 is not installed")
+class TestThrottling(unittest.TestCase):
+
+    def make(self, **options):
+        log = []
+        limiter = throttling.Throttle(None, throttling.normalize_throttle(options), log.append)
+        return limiter, log
+
+    def test_normalize(self):
+        self.assertIsNone(throttling.normalize_throttle(None))
+        self.assertIsNone(throttling.normalize_throttle({'max_bytes_per_second': 0, 'adaptive': False}))
+        options = throttling.normalize_throttle({'max_bytes_per_second': 1024, 'max_active_backends': None})
+        self.assertEqual(options['max_bytes_per_second'], 1024)
+        self.assertEqual(options['max_active_backends'], throttling.MAX_ACTIVE_BACKENDS)
+
+    def test_adaptive_states(self):
+        limiter, log = self.make(max_bytes_per_second=1000, adaptive=True, max_active_backends=10, max_replication_lag=1000)
+        limiter.active_backends = 8
+        limiter.update_state()
+        self.assertEqual(limiter.state, 'slowed')
+        self.assertEqual(limiter.rate(), 500)
+
+        limiter.replication_lag = 2000
+        limiter.update_state()
+        self.assertEqual(limiter.state, 'paused')
+        self.assertIn('replica lag', limiter.reason)
+
+        # Stays paused until the load is back below SLOW_DOWN_AT
+        limiter.replication_lag, limiter.active_backends = 900, 1
+        limiter.update_state()
+        self.assertEqual(limiter.state, 'paused')
+        limiter.replication_lag = None
+        limiter.update_state()
+        self.assertEqual(limiter.state, 'running')
+        self.assertEqual([msg.split('"state": ')[1][:9] for msg in log], ['"slowed",', '"paused",', '"running"'])
+
+    def test_wait_paces_bytes(self):
+        limiter, _ = self.make(max_bytes_per_second=100000)
+        started = time.time()
+        for _ in range(20):
+            limiter.wait(10000)
+        # The first 100000 bytes are the burst, the rest is paced
+        self.assertGreater(time.time() - started, 0.9)
+
+    def test_control_stops_process(self):
+        limiter, _ = self.make(max_bytes_per_second=256 * 1024)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'out')
+            script = f"import time\nwith open({path!r}, 'wb', buffering=0) as f:\n    while True:\n        f.write(b'x' * 65536)\n        time.sleep(0.01)\n"
+            process = subprocess.Popen([sys.executable, '-c', script], start_new_session=True)
+            release = limiter.control(process, lambda: os.path.getsize(path) if os.path.exists(path) else 0)
+            try:
+                time.sleep(2)
+                size = os.path.getsize(path)
+            finally:
+                release()
+                process.kill()
+                process.wait()
+        # Unthrottled this writes about 12 MB; throttled it is stopped after its first check
+        self.assertLess(size, 4 * 1024 * 1024)
+
+    @unittest.skipUnless(os.path.exists('/proc/self/io'), "needs Linux /proc")
+    def test_read_meter_counts_the_process_group(self):
+        # A leader and a worker in its process group, each reading 1 MB
+        script = ("import subprocess, sys, time\n"
+                  "worker = subprocess.Popen([sys.executable, '-c', \"open('/dev/zero', 'rb', buffering=0).read(1 << 20); import time; time.sleep(5)\"])\n"
+                  "open('/dev/zero', 'rb', buffering=0).read(1 << 20)\n"
+                  "time.sleep(5)\n")
+        process = subprocess.Popen([sys.executable, '-c', script], start_new_session=True)
+        try:
+            measure = throttling.read_meter(process.pid)
+            deadline = time.time() + 5
+            while time.time() < deadline and (measure() or 0) < 2 << 20:
+                time.sleep(0.1)
+            self.assertGreaterEqual(measure(), 2 << 20)
+            self.assertEqual(len(throttling.group_pids(process.pid)), 2)
+        finally:
+            os.killpg(process.pid, 9)
+            process.wait()
+        # Exited processes keep counting
+        self.assertGreaterEqual(measure(), 2 << 20)
+
+    def test_read_meter_fallback(self):
+        group_pids = throttling.group_pids
+        throttling.group_pids = lambda pgid: None  # No /proc
+        try:
+            self.assertEqual(throttling.read_meter(1, fallback=lambda: 42)(), 42)
+            self.assertIsNone(throttling.read_meter(1)())
+        finally:
+            throttling.group_pids = group_pids
+
+    def test_describe(self):
+        state = {'state': 'paused', 'reason': '40 active backends', 'limit_bytes_per_second': 50 * 1024 * 1024,
+                 'paused_seconds': 12.0}
+        self.assertEqual(throttling.describe(state), "Throttle: paused (40 active backends), cap 50.0 MB/s, held back 12s so far")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import os
+import json
+import tempfile
+
+import tracing
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = tracing.trace_path(os.path.join(self.dir.name, 'job-1.jsonl'))
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_spans(self):
+        log = []
+        with tracing.span(log.append, 'reset'):
+            pass
+        with self.assertRaises(ValueError):
+            with tracing.span(log.append, 'restore data'):
+                raise ValueError("disk full")
+        tracing.emit(log.append, 'public.orders', 'table data', 100.0, 112.5, rows=10)
+        records = [json.loads(msg[len("SPAN:"):]) for msg in log]
+        self.assertEqual([(r['name'], r['kind'], r['status']) for r in records],
+                         [('reset', 'step', 'ok'), ('restore data', 'step', 'error'), ('public.orders', 'table data', 'ok')])
+        self.assertEqual(records[1]['attributes']['error'], "disk full")
+        self.assertEqual(records[2]['attributes'], {'rows': 10})
+
+    def test_trace_file(self):
+        self.assertEqual(os.path.basename(self.path), 'job-1.trace.jsonl')
+        trace = tracing.TraceWriter(self.path)
+        trace.phase('Dumping')
+        trace.write({'name': 'public.big', 'kind': 'table data', 'start': 1.0, 'end': 9.0, 'status': 'ok', 'attributes': {}})
+        trace.write({'name': 'public.big_pkey', 'kind': 'index', 'start': 2.0, 'end': 4.0, 'status': 'ok', 'attributes': {}})
+        trace.write({'name': 'dump', 'kind': 'step', 'start': 0.5, 'end': 20.0, 'status': 'ok', 'attributes': {}})
+        trace.phase('Restoring', 'to target')
+        trace.close(error="pg_restore failed")
+
+        spans = tracing.read_trace(self.path)
+        self.assertEqual([(p['name'], p['status']) for p in tracing.phases(spans)], [('Dumping', 'ok'), ('Restoring', 'error')])
+        self.assertEqual([s['name'] for s in tracing.slowest(spans)], ['public.big', 'public.big_pkey'])
+        self.assertEqual(len({s['trace_id'] for s in spans}), 1)
+
+    def test_otlp_nests_objects_under_phases(self):
+        spans = [
+            {'name': 'Restoring', 'kind': 'phase', 'start': 10.0, 'end': 20.0, 'status': 'ok', 'attributes': {},
+             'trace_id': 'a' * 32, 'span_id': '1' * 16},
+            {'name': 'public.orders', 'kind': 'table data', 'start': 11.0, 'end': 15.0, 'status': 'ok',
+             'attributes': {'rows': 5}, 'trace_id': 'a' * 32, 'span_id': '2' * 16},
+            {'name': 'restore data', 'kind': 'step', 'start': 10.5, 'end': 19.0, 'status': 'error', 'attributes': {},
+             'trace_id': 'a' * 32, 'span_id': '3' * 16},
+        ]
+        otlp = tracing.to_otlp(spans)['resourceSpans'][0]['scopeSpans'][0]['spans']
+        self.assertEqual([s['parentSpanId'] for s in otlp], ["", '1' * 16, ""])
+        self.assertEqual(otlp[1]['startTimeUnixNano'], str(11 * 10 ** 9))
+        self.assertIn({'key': 'pgshift.rows', 'value': {'intValue': '5'}}, otlp[1]['attributes'])
+        self.assertEqual(otlp[2]['status'], {'code': 2})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+import os
+import tempfile
+
+import storage
+
+try:
+    import migration
+    import job_runner
+except ImportError:  # psycopg2 not installed
+    migration = job_runner = None
+
+@unittest.skipIf(migration is None, "psycopg2 is not installed")
+class TestVerify(unittest.TestCase):
+
+    def test_estimates_differ(self):
+        self.assertFalse(migration.estimates_differ(0, 500))
+        self.assertFalse(migration.estimates_differ(1000000, 950000))
+        self.assertTrue(migration.estimates_differ(1000000, 800000))
+        self.assertTrue(migration.estimates_differ(5000, 0))
+
+    def test_unknown_level(self):
+        with self.assertRaises(Exception):
+            migration.verify_migration({}, {}, lambda msg: None, level='sample')
+
+@unittest.skipIf(migration is None, "psycopg2 is not installed")
+class TestVerificationOutcome(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = (migration.run_dump_migration, migration.verify_migration, migration.get_database_size)
+        self.report = {'level': 'count', 'tables': 3, 'matched': 2, 'errors': [],
+                       'mismatches': [{'table': 'public.orders', 'source_rows': 10, 'target_rows': 9, 'checksum_differs': False}],
+                       'missing': []}
+        migration.run_dump_migration = lambda *args, **kwargs: (True, "Migration completed successfully!")
+        migration.verify_migration = lambda *args, **kwargs: self.report
+        migration.get_database_size = lambda conn_details: 0
+        self.tmp = tempfile.TemporaryDirectory()
+        storage.DB_FILE = os.path.join(self.tmp.name, 'jobs.db')
+        storage.init_db()
+
+    def tearDown(self):
+        migration.run_dump_migration, migration.verify_migration, migration.get_database_size = self.saved
+        storage.close_db()
+        self.tmp.cleanup()
+
+    def test_mismatch_fails_the_run(self):
+        success, msg = migration.run_migration({}, {}, lambda msg: None, verify='count')
+        self.assertFalse(success)
+        self.assertTrue(msg.startswith(migration.UNVERIFIED))
+        self.report['mismatches'] = []
+        self.assertEqual(migration.run_migration({}, {}, lambda msg: None, verify='count'), (True, "Migration completed successfully!"))
+
+    def test_job_ends_unverified(self):
+        log_path = os.path.join(self.tmp.name, 'job.jsonl')
+        job_id = storage.create_job('a', 'b', 'standard', '{}', log_path)
+        job_runner.run_job(job_id, {}, {}, log_path, {'verify': 'count'})
+        self.assertEqual(storage.get_job(job_id)['status'], 'unverified')
+
+        migration.run_dump_migration = lambda *args, **kwargs: (False, "pg_restore failed")
+        job_id = storage.create_job('a', 'b', 'standard', '{}', log_path)
+        job_runner.run_job(job_id, {}, {}, log_path, {'verify': 'count'})
+        self.assertEqual(storage.get_job(job_id)['status'], 'failed')
+
+if __name__ == '__main__':
+    unittest.main()
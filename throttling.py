@@ -0,0 +1,317 @@
+import os
+import time
+import json
+import signal
+import threading
+
+import db_pool
+
+# Dumps against production sources can be capped in bytes per second and, in
+# adaptive mode, slowed down or paused while the source is under load.
+# Adaptive thresholds (override via environment or per migration)
+MAX_ACTIVE_BACKENDS = int(os.environ.get('PGSHIFT_THROTTLE_MAX_ACTIVE', '32'))
+MAX_REPLICATION_LAG = int(float(os.environ.get('PGSHIFT_THROTTLE_MAX_LAG_MB', '256')) * 1024 * 1024)
+
+# Seconds between source load checks, and between checks of a controlled process
+CHECK_INTERVAL = 5
+CONTROL_INTERVAL = 0.25
+# Load (share of a threshold) above which a capped dump runs at half speed; a
+# paused dump continues once the load falls below it again
+SLOW_DOWN_AT = 0.8
+
+DEFAULTS = {
+    'max_bytes_per_second': None,
+    'adaptive': False,
+    'max_active_backends': MAX_ACTIVE_BACKENDS,
+    'max_replication_lag': MAX_REPLICATION_LAG,
+}
+
+def normalize_throttle(throttle):
+    """Throttle options with defaults filled in, or None when nothing is throttled.
+
+    throttle is a dict overriding some of DEFAULTS: a byte cap, adaptive mode, or both.
+    """
+    if not throttle:
+        return None
+    options = dict(DEFAULTS)
+    options.update({k: v for k, v in throttle.items() if v is not None})
+    if not options['max_bytes_per_second'] and not options['adaptive']:
+        return None
+    return options
+
+def process_io(pid, field):
+    """A counter of /proc/<pid>/io (rchar, wchar, ...), or None where that is not available."""
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+def group_pids(pgid):
+    """Processes of a process group, from /proc; None where /proc is not available."""
+    try:
+        names = os.listdir('/proc')
+    except OSError:
+        return None
+    pids = []
+    for name in names:
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                # "pid (comm) state ppid pgrp ...", comm may contain spaces and parentheses
+                fields = f.read().rsplit(')', 1)[1].split()
+            if int(fields[2]) == pgid:
+                pids.append(int(name))
+        except (OSError, ValueError, IndexError):
+            continue
+    return pids
+
+def read_meter(pgid, fallback=None):
+    """measure() for Throttle.control: bytes read so far by a process group, pg_dump and
+    its -j workers. Their reads are the data the source sends, before compression.
+
+    Comes from rchar in /proc/<pid>/io, kept for workers that have exited. Where /proc
+    is not available, fallback() (for example the dump's size on disk) or None.
+    """
+    seen = {}
+
+    def measure():
+        pids = group_pids(pgid)
+        if pids is None:
+            return fallback() if fallback else None
+        for pid in pids:
+            value = process_io(pid, 'rchar')
+            if value is not None:
+                seen[pid] = value
+        return sum(seen.values())
+    return measure
+
+class Throttle:
+    """Rate limit and load-based pausing for one dump.
+
+    The budget is for data read from the source. Data that passes through PG Shift
+    (COPY) calls wait() per chunk. Client binaries that read on their own (pg_dump)
+    are run under control(), which stops and continues their process group to keep
+    their reads in budget (see read_meter).
+    State changes are logged as "THROTTLE:{json}" lines.
+    """
+
+    def __init__(self, source, options, log_callback):
+        self.source = source
+        self.options = options
+        self.log_callback = log_callback
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.state = 'running'
+        self.reason = None
+        self.active_backends = None
+        self.replication_lag = None
+        # Time the dump was held back: paused for load, or stopped over its byte budget
+        self.paused_seconds = 0.0
+        self.paused_since = None
+        self.bytes_per_second = 0
+        self.tokens = self.burst()
+        self.last_refill = self.window_start = time.time()
+        self.window_bytes = 0
+        self.monitor = None
+
+    def burst(self):
+        return self.options['max_bytes_per_second'] or 0
+
+    def rate(self):
+        """Current byte cap, None for no cap; halved while the source is busy."""
+        rate = self.options['max_bytes_per_second']
+        if rate and self.state == 'slowed':
+            return rate / 2
+        return rate
+
+    # --- Source load (adaptive mode) ---
+
+    def start(self):
+        if self.options['max_bytes_per_second']:
+            self.log_callback(f"Dump throttled to {self.options['max_bytes_per_second'] / 1024 / 1024:,.1f} MB/s.")
+        if self.options['adaptive']:
+            self.monitor = threading.Thread(target=self.watch_load, name="pgshift-throttle", daemon=True)
+            self.monitor.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.monitor:
+            self.monitor.join()
+
+    def read_load(self):
+        """(active client backends other than dumps, max replica replay lag in bytes or None) on the source."""
+        with db_pool.connection(self.source, connect_timeout=5) as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT count(*) FROM pg_stat_activity
+                WHERE state = 'active' AND backend_type = 'client backend'
+                  AND pid <> pg_backend_pid() AND application_name NOT IN ('pg_dump', 'pgshift');
+            """)
+            active = cur.fetchone()[0]
+            cur.execute("""
+                SELECT CASE WHEN pg_is_in_recovery() THEN NULL ELSE
+                    (SELECT max(pg_wal_lsn_diff(pg_current_wal_lsn(), replay_lsn)) FROM pg_stat_replication) END;
+            """)
+            lag = cur.fetchone()[0]
+        return active, int(lag) if lag is not None else None
+
+    def watch_load(self):
+        while not self.stopped.is_set():
+            try:
+                self.active_backends, self.replication_lag = self.read_load()
+            except Exception as e:
+                # Keep the last state; a busy source may also be slow to answer
+                self.log_callback(f"WARNING: Could not read source load: {str(e).strip()}")
+            else:
+                self.update_state()
+            self.stopped.wait(CHECK_INTERVAL)
+
+    def update_state(self):
+        load = self.active_backends / self.options['max_active_backends']
+        reason = f"{self.active_backends} active backends"
+        if self.replication_lag is not None and self.replication_lag / self.options['max_replication_lag'] > load:
+            load = self.replication_lag / self.options['max_replication_lag']
+            reason = f"replica lag {self.replication_lag / 1024 / 1024:,.0f} MB"
+
+        if load >= 1:
+            state = 'paused'
+        elif self.state == 'paused' and load >= SLOW_DOWN_AT:
+            state = 'paused'
+        elif load >= SLOW_DOWN_AT and self.options['max_bytes_per_second']:
+            state = 'slowed'
+        else:
+            state = 'running'
+        with self.lock:
+            changed = state != self.state
+            if changed and state == 'paused':
+                self.paused_since = time.time()
+            elif changed and self.state == 'paused':
+                self.paused_seconds += time.time() - self.paused_since
+            self.state, self.reason = state, reason if state != 'running' else None
+        if changed:
+            self.report()
+
+    # --- Rate limiting ---
+
+    def wait(self, nbytes):
+        """Blocks until nbytes may be sent (token bucket; pauses while the source is overloaded)."""
+        while True:
+            with self.lock:
+                now = time.time()
+                rate = self.rate()
+                if rate:
+                    self.tokens = min(self.burst(), self.tokens + rate * (now - self.last_refill))
+                self.last_refill = now
+                if self.state != 'paused' and (not rate or self.tokens > 0):
+                    self.tokens -= nbytes
+                    self.window_bytes += nbytes
+                    if now - self.window_start >= 1:
+                        self.bytes_per_second = self.window_bytes / (now - self.window_start)
+                        self.window_start, self.window_bytes = now, 0
+                    return
+                delay = 0.5 if self.state == 'paused' else min(0.5, -self.tokens / rate + 0.01)
+            time.sleep(delay)
+
+    def control(self, process, measure):
+        """Keeps a client binary (and the workers in its process group) within budget.
+
+        measure() returns the bytes it has read so far (see read_meter), None if unknown.
+        Returns a function that stops controlling and lets the process continue.
+        """
+        done = threading.Event()
+        try:
+            pgid = os.getpgid(process.pid)
+        except OSError:
+            return done.set
+
+        def loop():
+            stopped = False
+            last, last_bytes, allowed = time.time(), measure() or 0, self.burst()
+            warned = False
+            while not done.wait(CONTROL_INTERVAL) and process.poll() is None:
+                now = time.time()
+                written = measure()
+                rate = self.rate()
+                if written is None:
+                    if rate and not warned:
+                        self.log_callback("WARNING: Reads of this process can't be measured here, only adaptive pausing applies.")
+                        warned = True
+                    over = False
+                else:
+                    self.bytes_per_second = (written - last_bytes) / (now - last)
+                    last_bytes = written
+                    # Unused budget builds up at most one second's worth
+                    allowed = min(allowed + (rate or 0) * (now - last), written + self.burst())
+                    over = bool(rate) and written > allowed
+                if stopped and self.state != 'paused':
+                    with self.lock:
+                        self.paused_seconds += now - last
+                last = now
+                pause = over or self.state == 'paused'
+                if pause != stopped:
+                    try:
+                        os.killpg(pgid, signal.SIGSTOP if pause else signal.SIGCONT)
+                    except OSError:
+                        break
+                    stopped = pause
+            if stopped:
+                try:
+                    os.killpg(pgid, signal.SIGCONT)
+                except OSError:
+                    pass
+
+        thread = threading.Thread(target=loop, name="pgshift-throttle-control", daemon=True)
+        thread.start()
+
+        def release():
+            done.set()
+            thread.join()
+        return release
+
+    # --- Reporting ---
+
+    def snapshot(self):
+        with self.lock:
+            paused = self.paused_seconds
+            if self.state == 'paused':
+                paused += time.time() - self.paused_since
+            return {
+                'state': self.state,
+                'reason': self.reason,
+                'limit_bytes_per_second': self.rate(),
+                'bytes_per_second': round(self.bytes_per_second),
+                'active_backends': self.active_backends,
+                'replication_lag_bytes': self.replication_lag,
+                'paused_seconds': round(paused, 1),
+            }
+
+    def report(self):
+        self.log_callback("THROTTLE:" + json.dumps(self.snapshot()))
+
+class ThrottledWriter:
+    """File-like object that passes every write through Throttle.wait() (for copy_expert)."""
+
+    def __init__(self, f, limiter):
+        self.f = f
+        self.limiter = limiter
+
+    def write(self, data):
+        self.limiter.wait(len(data))
+        return self.f.write(data)
+
+def describe(state):
+    """One-line summary of a Throttle snapshot."""
+    text = {'running': "running", 'slowed': "slowed down", 'paused': "paused"}.get(state['state'], state['state'])
+    if state['reason']:
+        text += f" ({state['reason']})"
+    if state['limit_bytes_per_second']:
+        text += f", cap {state['limit_bytes_per_second'] / 1024 / 1024:,.1f} MB/s"
+    if state['paused_seconds']:
+        text += f", held back {state['paused_seconds']:,.0f}s so far"
+    return f"Throttle: {text}"
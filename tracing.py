@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+
+# Timing spans of a migration, kept in a JSON-lines trace file next to the job log.
+# Phases are timed by the job runner from the PHASE: markers; the migration code
+# reports steps and objects (table data, index builds...) as "SPAN:{json}" lines.
+
+# pg_restore TOC descriptions traced per object, and their span kind
+OBJECT_KINDS = {
+    'TABLE DATA': 'table data',
+    'MATERIALIZED VIEW DATA': 'table data',
+    'INDEX': 'index',
+    'CONSTRAINT': 'constraint',
+    'FK CONSTRAINT': 'constraint',
+    'CHECK CONSTRAINT': 'constraint',
+    'TRIGGER': 'trigger',
+}
+
+def object_kind(desc):
+    """Span kind of a TOC / post-data object type, None for objects that are not traced."""
+    return OBJECT_KINDS.get(desc)
+
+def emit(log_callback, name, kind, start, end=None, error=None, **attributes):
+    """Reports one finished span."""
+    record = {
+        'name': name,
+        'kind': kind,
+        'start': start,
+        'end': end or time.time(),
+        'status': 'error' if error else 'ok',
+        'attributes': attributes,
+    }
+    if error:
+        record['attributes']['error'] = str(error).strip()
+    log_callback("SPAN:" + json.dumps(record))
+
+@contextmanager
+def span(log_callback, name, kind='step', **attributes):
+    """Times the block as one span, with status error if it raises."""
+    start = time.time()
+    try:
+        yield
+    except Exception as e:
+        emit(log_callback, name, kind, start, error=e, **attributes)
+        raise
+    emit(log_callback, name, kind, start, **attributes)
+
+def trace_path(log_path):
+    """Trace file of a job log: job-....jsonl -> job-....trace.jsonl"""
+    return os.path.splitext(log_path)[0] + ".trace.jsonl"
+
+class TraceWriter:
+    """Appends the spans of one job to its trace file, adding trace and span ids.
+
+    Also times the job's phases: each phase() ends the running phase span.
+    """
+
+    def __init__(self, path):
+        self.trace_id = uuid.uuid4().hex
+        self.lock = threading.Lock()
+        self.file = open(path, 'a', encoding='utf-8')
+        self.current = None
+
+    def phase(self, name, detail=""):
+        """Starts the next phase. Returns the span of the phase it ended, if any."""
+        now = time.time()
+        ended = self.end_phase(now)
+        self.current = {'name': name, 'kind': 'phase', 'start': now, 'attributes': {'detail': detail}}
+        return ended
+
+    def end_phase(self, end=None, error=None):
+        if not self.current:
+            return None
+        record = dict(self.current, end=end or time.time(), status='error' if error else 'ok')
+        self.current = None
+        self.write(record)
+        return record
+
+    def write(self, record):
+        record = dict(record, trace_id=self.trace_id, span_id=uuid.uuid4().hex[:16])
+        with self.lock:
+            self.file.write(json.dumps(record) + "\n")
+            self.file.flush()
+
+    def close(self, error=None):
+        """Ends the last phase, as failed if the job failed with error. Returns its span."""
+        ended = self.end_phase(error=error)
+        with self.lock:
+            self.file.close()
+        return ended
+
+def read_trace(path):
+    """Spans of a trace file with their duration in seconds, oldest first."""
+    if not path or not os.path.exists(path):
+        return []
+    spans = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            record['duration'] = record['end'] - record['start']
+            spans.append(record)
+    return sorted(spans, key=lambda s: s['start'])
+
+def phases(spans):
+    """The phase spans, in order."""
+    return [s for s in spans if s['kind'] == 'phase']
+
+def slowest(spans, limit=10):
+    """The slowest object spans (table data, indexes, constraints...)."""
+    objects = [s for s in spans if s['kind'] not in ('phase', 'step')]
+    return sorted(objects, key=lambda s: s['duration'], reverse=True)[:limit]
+
+def parent_phase(spans, record):
+    """The phase span that was running when an object span started, None for phases and steps."""
+    if record['kind'] in ('phase', 'step'):
+        return None
+    containing = [p for p in phases(spans) if p['start'] <= record['start'] <= p['end']]
+    return max(containing, key=lambda p: p['start']) if containing else None
+
+def to_otlp(spans, service_name="pg-shift"):
+    """The spans as an OpenTelemetry (OTLP/JSON) trace, objects nested under their phase.
+
+    Phases and steps overlap (a step can cover several phases), so both stay at the top level.
+    """
+    def attribute(key, value):
+        if isinstance(value, bool):
+            return {'key': key, 'value': {'boolValue': value}}
+        if isinstance(value, int):
+            return {'key': key, 'value': {'intValue': str(value)}}
+        if isinstance(value, float):
+            return {'key': key, 'value': {'doubleValue': value}}
+        return {'key': key, 'value': {'stringValue': str(value)}}
+
+    otlp_spans = []
+    for record in spans:
+        parent = parent_phase(spans, record)
+        otlp_spans.append({
+            'traceId': record['trace_id'],
+            'spanId': record['span_id'],
+            'parentSpanId': parent['span_id'] if parent else "",
+            'name': record['name'],
+            'kind': 1,  # SPAN_KIND_INTERNAL
+            'startTimeUnixNano': str(int(record['start'] * 1e9)),
+            'endTimeUnixNano': str(int(record['end'] * 1e9)),
+            'attributes': [attribute('pgshift.kind', record['kind'])] +
+                          [attribute(f"pgshift.{k}", v) for k, v in record['attributes'].items() if v is not None],
+            'status': {'code': 2 if record['status'] == 'error' else 1},
+        })
+    return {'resourceSpans': [{
+        'resource': {'attributes': [attribute('service.name', service_name)]},
+        'scopeSpans': [{'scope': {'name': 'pgshift.migration'}, 'spans': otlp_spans}],
+    }]}